@@ -1,11 +1,12 @@
-from data_management.models import Contact,Opportunity
-from django.utils.dateparse import parse_datetime
-from django.utils.timezone import make_aware, now, is_naive
+from data_management.mapping import CONTACT_MAPPING, OPPORTUNITY_MAPPING, opportunity_lookups, parse_datetime
+from data_management.models import Contact,Opportunity,OpportunityStageEvent
+from data_management.snapshot import notify_opportunities_changed
+from data_management.stage_events import stage_event
+from django.db import transaction
+from kpi_backend.db_router import record_write
+from django.utils import timezone
 from typing import List, Dict, Any, Optional
-from datetime import datetime
 import logging
-from data_management.models import Pipeline, PipelineStage
-import pytz
 
 logger = logging.getLogger('data_management.helpers')
 
@@ -31,33 +32,14 @@ def create_or_update_contact(contact_data: Dict[str, Any]) -> Optional[Contact]:
         return None
     
     try:
-        # Parse and handle date
-        date_added = _parse_date(contact_data.get("dateAdded"))
-        
-        # Prepare contact data
-        contact_data_dict = {
-            'contact_id': contact_id,
-            'first_name': (contact_data.get("firstName") or "").strip()[:100],
-            'last_name': (contact_data.get("lastName") or "").strip()[:100],
-            'phone': (contact_data.get("phone") or "").strip()[:20],
-            'email': (contact_data.get("email") or "").strip() or None,
-            'address': (contact_data.get("address") or "").strip()[:255],
-            'country': (contact_data.get("country") or "").strip()[:10],
-            'date_added': date_added or now(),
-            'date_updated': now(),
-            'tags': contact_data.get("tags", []),
-            'source': (contact_data.get("source") or "ghl_api").strip()[:100],
-        }
-        
-        # Generate full_name_lowercase
-        full_name = f"{contact_data_dict['first_name']} {contact_data_dict['last_name']}"
-        contact_data_dict['full_name_lowercase'] = full_name.lower().strip()
+        contact_data_dict = CONTACT_MAPPING.one(contact_data)
         
         # Create or update contact
         contact, created = Contact.objects.update_or_create(
             contact_id=contact_id,
             defaults=contact_data_dict
         )
+        transaction.on_commit(record_write)
         
         action = "created" if created else "updated"
         logger.info(f"Contact {contact_id} {action} successfully")
@@ -88,43 +70,21 @@ def create_opportunity(opportunity_data: Dict[str, Any]) -> Optional[Opportunity
         return None
     
     try:
-        # Find related objects
-        contact_id = opportunity_data.get("contactId")
-        pipeline_id = opportunity_data.get("pipelineId")
-        stage_id = opportunity_data.get("pipelineStageId")
+        # Resolve contact, pipeline and stage in one query each
+        opportunity_data_dict = OPPORTUNITY_MAPPING.one(opportunity_data, opportunity_lookups([opportunity_data]))
         
-        contact = Contact.objects.filter(contact_id=contact_id).first() if contact_id else None
-        pipeline = Pipeline.objects.filter(pipeline_id=pipeline_id).first() if pipeline_id else None
-        stage = PipelineStage.objects.filter(pipeline_stage_id=stage_id).first() if stage_id else None
-        
-        if not contact:
-            logger.warning(f"Contact {contact_id} not found for opportunity {opportunity_id}")
+        if opportunity_data_dict['contact_id'] is None:
+            logger.warning(f"Contact {opportunity_data.get('contactId')} not found for opportunity {opportunity_id}")
             return None
         
-        # Parse dates
-        created_timestamp = _parse_date(opportunity_data.get("createdAt")) or now()
-        
-        # Prepare opportunity data
-        opportunity_data_dict = {
-            'opportunity_id': opportunity_id,
-            'contact': contact,
-            'pipeline': pipeline,
-            'current_stage': stage,
-            'created_by_source': (opportunity_data.get("source") or "ghl_api").strip()[:50],
-            'created_by_channel': "ghl_api",
-            'source_id': (opportunity_data.get("source") or "").strip()[:255],
-            'created_timestamp': created_timestamp,
-            'value': _safe_float(opportunity_data.get("monetaryValue")),
-            'assigned': (opportunity_data.get("assignedTo") or "").strip()[:150],
-            'tags': str(opportunity_data.get("tags", [])),
-            'engagement_score': _safe_int(opportunity_data.get("engagementScore")),
-            'status': (opportunity_data.get("status") or "").strip()[:50] if opportunity_data.get("status") else None,
-            'description': (opportunity_data.get("name") or "").strip(),
-            'address': (opportunity_data.get("address") or "").strip(),
-        }
-        
-        # Create opportunity
-        opportunity = Opportunity.objects.create(**opportunity_data_dict)
+        # Create opportunity and record the stage it starts in
+        with transaction.atomic():
+            opportunity = Opportunity.objects.create(**opportunity_data_dict)
+            event = stage_event(opportunity.pk, opportunity_data_dict, None, opportunity_data,
+                                OpportunityStageEvent.SOURCE_WEBHOOK, timezone.now())
+            if event:
+                event.save()
+            transaction.on_commit(lambda: notify_opportunities_changed([opportunity.pk]))
         logger.info(f"Opportunity {opportunity_id} created successfully")
         return opportunity
         
@@ -159,95 +119,32 @@ def update_opportunity(opportunity_data: Dict[str, Any]) -> Optional[Opportunity
             logger.warning(f"Opportunity {opportunity_id} not found for update")
             return None
         
-        # Find related objects
-        contact_id = opportunity_data.get("contactId")
-        pipeline_id = opportunity_data.get("pipelineId")
-        stage_id = opportunity_data.get("pipelineStageId")
-        
-        contact = Contact.objects.filter(contact_id=contact_id).first() if contact_id else None
-        pipeline = Pipeline.objects.filter(pipeline_id=pipeline_id).first() if pipeline_id else None
-        stage = PipelineStage.objects.filter(pipeline_stage_id=stage_id).first() if stage_id else None
+        # Resolve contact, pipeline and stage in one query each
+        values = OPPORTUNITY_MAPPING.one(opportunity_data, opportunity_lookups([opportunity_data]))
         
-        if not contact:
-            logger.warning(f"Contact {contact_id} not found for opportunity {opportunity_id}")
+        if values['contact_id'] is None:
+            logger.warning(f"Contact {opportunity_data.get('contactId')} not found for opportunity {opportunity_id}")
             return None
         
-        # Parse dates
-        created_timestamp = _parse_date(opportunity_data.get("createdAt")) or opportunity.created_timestamp
+        # Keep the stored creation date when the payload has none
+        if parse_datetime(opportunity_data.get("createdAt")) is None:
+            values['created_timestamp'] = opportunity.created_timestamp
+        
+        event = stage_event(opportunity.pk, values, opportunity.current_stage_id, opportunity_data,
+                            OpportunityStageEvent.SOURCE_WEBHOOK, timezone.now())
         
         # Update opportunity fields
-        opportunity.contact = contact
-        opportunity.pipeline = pipeline
-        opportunity.current_stage = stage
-        opportunity.created_by_source = (opportunity_data.get("source") or "ghl_api").strip()[:50]
-        opportunity.created_by_channel = "ghl_api"
-        opportunity.source_id = (opportunity_data.get("source") or "").strip()[:255]
-        opportunity.created_timestamp = created_timestamp
-        opportunity.value = _safe_float(opportunity_data.get("monetaryValue"))
-        opportunity.assigned = (opportunity_data.get("assignedTo") or "").strip()[:150]
-        opportunity.tags = str(opportunity_data.get("tags", []))
-        opportunity.engagement_score = _safe_int(opportunity_data.get("engagementScore"))
-        opportunity.status = (opportunity_data.get("status") or "").strip()[:50] if opportunity_data.get("status") else None
-        opportunity.description = (opportunity_data.get("name") or "").strip()
-        opportunity.address = (opportunity_data.get("address") or "").strip()
-        
-        opportunity.save()
+        for key, value in values.items():
+            setattr(opportunity, key, value)
+        
+        with transaction.atomic():
+            opportunity.save()
+            if event:
+                event.save()
+            transaction.on_commit(lambda: notify_opportunities_changed([opportunity.pk]))
         logger.info(f"Opportunity {opportunity_id} updated successfully")
         return opportunity
         
     except Exception as e:
         logger.error(f"Error updating opportunity {opportunity_id}: {e}")
         return None
-
-
-def _parse_date(self, date_str: str) -> Optional[datetime]:
-        """
-        Parse date string and return datetime in 'Australia/Sydney' timezone.
-
-        Args:
-            date_str: Date string from API
-
-        Returns:
-            Parsed timezone-aware datetime or None
-        """
-        AUSTRALIA_SYDNEY_TZ = pytz.timezone("Australia/Sydney")
-
-        if not date_str:
-            return None
-
-        try:
-            parsed_date = parse_datetime(date_str)
-            if parsed_date:
-                if is_naive(parsed_date):
-                    parsed_date = make_aware(parsed_date)
-                # Convert to Australia/Sydney timezone
-                parsed_date = parsed_date.astimezone(AUSTRALIA_SYDNEY_TZ)
-                return parsed_date
-        except Exception:
-            pass
-
-        return None
-
-
-def _safe_float(value: Any) -> Optional[float]:
-    """Safely convert value to float."""
-    if value is None or value == "":
-        return None
-    try:
-        return float(value)
-    except (ValueError, TypeError):
-        return None
-
-
-def _safe_int(value: Any) -> int:
-    """Safely convert value to int."""
-    if value is None or value == "":
-        return 0
-    try:
-        return int(float(value))
-    except (ValueError, TypeError):
-        return 0
-    
-
-
-
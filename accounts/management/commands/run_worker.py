@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from kpi_backend.celery import app, WORKER_PROFILES
+
+
+class Command(BaseCommand):
+    help = "Start a Celery worker for one of the queue profiles in kpi_backend/celery.py."
+
+    def add_arguments(self, parser):
+        parser.add_argument('profile', choices=sorted(WORKER_PROFILES))
+        parser.add_argument('--concurrency', '-c', type=int, help="Override the profile concurrency")
+        parser.add_argument('--loglevel', '-l', default='INFO')
+
+    def handle(self, *args, **options):
+        profile = WORKER_PROFILES.get(options['profile'])
+        if profile is None:
+            raise CommandError(f"Unknown worker profile: {options['profile']}")
+
+        argv = [
+            'worker',
+            '--queues', ','.join(profile['queues']),
+            '--concurrency', str(options['concurrency'] or profile['concurrency']),
+            '--prefetch-multiplier', str(profile['prefetch_multiplier']),
+            '--hostname', f"{options['profile']}@%h",
+            '--loglevel', options['loglevel'],
+        ]
+        if profile.get('max_tasks_per_child'):
+            argv += ['--max-tasks-per-child', str(profile['max_tasks_per_child'])]
+
+        self.stdout.write(f"Starting celery {' '.join(argv)}")
+        app.worker_main(argv)
@@ -0,0 +1,58 @@
+"""
+Schema changes made to the models before migrations were kept up to date.
+
+Deployed databases usually have these columns and tables already, created
+by migrations that were never committed. The SQL therefore only adds what
+is missing, and `migrate` works on both fresh and existing databases. To
+record the migration without running it instead:
+
+    python manage.py migrate accounts 0002_model_drift --fake
+"""
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunSQL(
+                    """
+                    CREATE TABLE IF NOT EXISTS "accounts_webhooklog" (
+                        "id" bigint NOT NULL PRIMARY KEY GENERATED BY DEFAULT AS IDENTITY,
+                        "received_at" timestamp with time zone NOT NULL,
+                        "data" text NULL
+                    );
+                    ALTER TABLE "accounts_ghlauthcredentials"
+                        ADD COLUMN IF NOT EXISTS "location_name" varchar(255) NULL,
+                        ADD COLUMN IF NOT EXISTS "timezone" varchar(100) NULL;
+                    """,
+                    migrations.RunSQL.noop,
+                ),
+            ],
+            state_operations=[
+                migrations.CreateModel(
+                    name='WebhookLog',
+                    fields=[
+                        ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                        ('received_at', models.DateTimeField(auto_now_add=True)),
+                        ('data', models.TextField(blank=True, null=True)),
+                    ],
+                ),
+                migrations.AddField(
+                    model_name='ghlauthcredentials',
+                    name='location_name',
+                    field=models.CharField(blank=True, max_length=255, null=True),
+                ),
+                migrations.AddField(
+                    model_name='ghlauthcredentials',
+                    name='timezone',
+                    field=models.CharField(blank=True, default='', max_length=100, null=True),
+                ),
+            ],
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.1 on 2026-10-19 00:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0002_model_drift'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ghlauthcredentials',
+            name='token_expires_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
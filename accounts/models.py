@@ -5,6 +5,7 @@ class GHLAuthCredentials(models.Model):
     access_token = models.TextField()
     refresh_token = models.TextField()
     expires_in = models.IntegerField()
+    token_expires_at = models.DateTimeField(null=True, blank=True)
     scope = models.CharField(max_length=500, null=True, blank=True)
     user_type = models.CharField(max_length=50, null=True, blank=True)
     company_id = models.CharField(max_length=255, null=True, blank=True)
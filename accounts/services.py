@@ -1,16 +1,14 @@
 import requests
+from django.conf import settings
 from accounts.models import GHLAuthCredentials
-def get_ghl_contact(contactId, access_token):
+from accounts.token_manager import ghl_request
 
-    url = f"https://services.leadconnectorhq.com/contacts/{contactId}"
-    
-    headers = {
-        "Accept": "application/json",
-        "Authorization": f"Bearer {access_token}",
-        "Version": "2021-07-28"
-    }
+
+def get_ghl_contact(contactId, location_id=None):
+
+    url = f"{settings.GHL_API_BASE_URL}/contacts/{contactId}"
     
-    response = requests.get(url, headers=headers)
+    response = ghl_request("GET", url, location_id=location_id)
 
     
     if response.status_code == 200:
@@ -19,18 +17,10 @@ def get_ghl_contact(contactId, access_token):
         
         return {"error": response.status_code, "message": response.text}
     
-def get_ghl_opportunity(oppertunity_id, access_token):
-    url = f"https://services.leadconnectorhq.com/opportunities/{oppertunity_id}"
+def get_ghl_opportunity(oppertunity_id, location_id=None):
+    url = f"{settings.GHL_API_BASE_URL}/opportunities/{oppertunity_id}"
     
-    headers = {
-        "Accept": "application/json",
-        "Authorization": f"Bearer {access_token}",
-        "Version": "2021-07-28"
-    }
-    
-    response = requests.get(url, headers=headers)
-
-    print("response: ", response.json())
+    response = ghl_request("GET", url, location_id=location_id)
     
     if response.status_code == 200:
         return response.json()
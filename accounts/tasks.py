@@ -1,146 +1,171 @@
-import requests
+import logging
+import time
+from datetime import timedelta
 from celery import shared_task
+from django.db.models import Q
+from django.utils.timezone import now
 from accounts.models import GHLAuthCredentials
-from django.conf import settings
+from accounts.token_manager import token_manager, TokenError
+from data_management.data_version import bump_data_version
 from data_management.helpers import sync_ghl_contacts_and_opportunities
 from data_management.models import Contact, Opportunity
+from data_management.snapshot import notify_opportunities_changed
 from accounts.helpers import create_or_update_contact, update_opportunity, create_opportunity
 from accounts.services import get_ghl_contact, get_ghl_opportunity
+from kpi_backend.metrics import WEBHOOK_DURATION, WEBHOOK_EVENTS, WEBHOOK_QUEUE_LAG
 
-@shared_task
-def make_api_for_ghl():
-    print("api called") 
-    credentials = GHLAuthCredentials.objects.first()
-    
-    print("credentials tokenL", credentials)
-    refresh_token = credentials.refresh_token
-
-    
-    response = requests.post('https://services.leadconnectorhq.com/oauth/token', data={
-        'grant_type': 'refresh_token',
-        'client_id': settings.GHL_CLIENT_ID,
-        'client_secret': settings.GHL_CLIENT_SECRET,
-        'refresh_token': refresh_token
-    })
-    
-    new_tokens = response.json()
-    print("newtoken :", new_tokens)
-
-    obj, created = GHLAuthCredentials.objects.update_or_create(
-            location_id= new_tokens.get("locationId"),
-            defaults={
-                "access_token": new_tokens.get("access_token"),
-                "refresh_token": new_tokens.get("refresh_token"),
-                "expires_in": new_tokens.get("expires_in"),
-                "scope": new_tokens.get("scope"),
-                "user_type": new_tokens.get("userType"),
-                "company_id": new_tokens.get("companyId"),
-                "user_id":new_tokens.get("userId"),
+# Same logger as the token manager, so failures reach the indexed sync log
+logger = logging.getLogger('data_management.helpers')
 
-            }
-        )
+@shared_task(soft_time_limit=60, time_limit=120)
+def make_api_for_ghl():
+    """
+    Proactively refresh the access tokens that expire before the next run.
+    Runs every 10 minutes; the token manager makes sure a location is only
+    refreshed once even if a webhook triggered a refresh at the same time.
+    """
+    horizon = now() + timedelta(minutes=30)
+    expiring = GHLAuthCredentials.objects.filter(
+        Q(token_expires_at__isnull=True) | Q(token_expires_at__lte=horizon)
+    )
+    for credentials in expiring:
+        try:
+            token_manager.refresh(credentials.location_id, stale_token=credentials.access_token)
+        except TokenError as e:
+            logger.error(f"Token refresh failed for {credentials.location_id}: {e}")
 
 
 
-@shared_task
+@shared_task(soft_time_limit=60 * 60, time_limit=65 * 60)
 def sync_opp__and_cntct_task(location_id, access_token):
     sync_ghl_contacts_and_opportunities(location_id, access_token)
 
 
 
 
-@shared_task
-def handle_webhook_event(data, event_type):
+WEBHOOK_EVENT_TYPES = {
+    "ContactCreate", "ContactUpdate", "ContactDelete",
+    "OpportunityCreate", "OpportunityUpdate", "OpportunityDelete",
+}
+
+
+@shared_task(soft_time_limit=60, time_limit=90)
+def handle_webhook_event(data, event_type, received_at=None):
     """
     Process webhook events asynchronously.
-    Note: Removed 'self' parameter as it's not needed for shared_task
+
+    Args:
+        data: Webhook payload
+        event_type: GHL event type (e.g. "ContactUpdate")
+        received_at: Epoch seconds when the webhook was received, to
+            measure queue lag
     """
+    metric_type = event_type if event_type in WEBHOOK_EVENT_TYPES else "other"
+    if received_at:
+        WEBHOOK_QUEUE_LAG.observe(max(time.time() - received_at, 0), type=metric_type)
+
+    outcome = "ok"
+    with WEBHOOK_DURATION.time(type=metric_type):
+        try:
+            process_webhook_event(data, event_type)
+        except Exception as e:
+            outcome = "error"
+            print(f"Error handling webhook event {event_type}: {e}")
+            # You might want to log this to a proper logging system
+            import traceback
+            print(traceback.format_exc())
+        finally:
+            # Whatever was committed invalidates the analytics ETags
+            bump_data_version(data.get("locationId"))
+    WEBHOOK_EVENTS.inc(type=metric_type, outcome=outcome)
+
+
+def process_webhook_event(data, event_type):
+    """Apply a webhook event to the local contacts and opportunities."""
+    # Tokens are cached per location, so this normally costs no DB query
+    location_id = data.get("locationId")
     try:
-        # Get access token
-        credentials = GHLAuthCredentials.objects.first()
-        if not credentials:
-            print("No GHL credentials found")
-            return
-            
-        access_token = credentials.access_token
-        
-        # Handle Contact events
-        if event_type in ["ContactCreate", "ContactUpdate"]:
-            contact_id = data.get("id")
-            if contact_id:
-                contact_data = get_ghl_contact(contact_id, access_token)
-                contact = contact_data.get("contact")
-                if contact:
-                    create_or_update_contact(contact)
-                else:
-                    print(f"Failed to fetch contact data for {contact_id}")
+        token_manager.get_access_token(location_id)
+    except TokenError as e:
+        print(f"No usable GHL credentials: {e}")
+        return
+    
+    # Handle Contact events
+    if event_type in ["ContactCreate", "ContactUpdate"]:
+        contact_id = data.get("id")
+        if contact_id:
+            contact_data = get_ghl_contact(contact_id, location_id)
+            contact = contact_data.get("contact")
+            if contact:
+                create_or_update_contact(contact)
             else:
-                print("No contact ID in webhook data")
-        
-        elif event_type == "ContactDelete":
-            contact_id = data.get("id")
-            if contact_id:
-                contact = Contact.objects.filter(contact_id=contact_id).first()
-                if contact:
-                    # Delete related opportunities first
-                    Opportunity.objects.filter(contact__contact_id=contact_id).delete()
-                    contact.delete()
-                    print(f"Contact {contact_id} deleted successfully")
-                else:
-                    print(f"Contact {contact_id} not found for deletion")
+                print(f"Failed to fetch contact data for {contact_id}")
+        else:
+            print("No contact ID in webhook data")
+    
+    elif event_type == "ContactDelete":
+        contact_id = data.get("id")
+        if contact_id:
+            contact = Contact.objects.filter(contact_id=contact_id).first()
+            if contact:
+                # Delete related opportunities first
+                opportunities = Opportunity.objects.filter(contact__contact_id=contact_id)
+                deleted = list(opportunities.values_list('id', flat=True))
+                opportunities.delete()
+                contact.delete()
+                notify_opportunities_changed(deleted)
+                print(f"Contact {contact_id} deleted successfully")
             else:
-                print("No contact ID in webhook data")
+                print(f"Contact {contact_id} not found for deletion")
+        else:
+            print("No contact ID in webhook data")
 
-        # Handle Opportunity events
-        elif event_type == "OpportunityCreate":
-            opportunity_id = data.get("id")
-            if opportunity_id:
-                opportunity_data = get_ghl_opportunity(opportunity_id, access_token)
-                opportunity = opportunity_data.get("opportunity")
-                if opportunity:
-                    create_opportunity(opportunity)
-                else:
-                    print(f"Failed to fetch opportunity data for {opportunity_id}")
+    # Handle Opportunity events
+    elif event_type == "OpportunityCreate":
+        opportunity_id = data.get("id")
+        if opportunity_id:
+            opportunity_data = get_ghl_opportunity(opportunity_id, location_id)
+            opportunity = opportunity_data.get("opportunity")
+            if opportunity:
+                create_opportunity(opportunity)
             else:
-                print("No opportunity ID in webhook data")
+                print(f"Failed to fetch opportunity data for {opportunity_id}")
+        else:
+            print("No opportunity ID in webhook data")
 
-        elif event_type == "OpportunityUpdate":
-            opportunity_id = data.get("id")
-            if opportunity_id:
-                opportunity_data = get_ghl_opportunity(opportunity_id, access_token)
-                opportunity = opportunity_data.get("opportunity")
-                if opportunity:
-                    update_opportunity(opportunity)
-                else:
-                    print(f"Failed to fetch opportunity data for {opportunity_id}")
+    elif event_type == "OpportunityUpdate":
+        opportunity_id = data.get("id")
+        if opportunity_id:
+            opportunity_data = get_ghl_opportunity(opportunity_id, location_id)
+            opportunity = opportunity_data.get("opportunity")
+            if opportunity:
+                update_opportunity(opportunity)
             else:
-                print("No opportunity ID in webhook data")
-
-        elif event_type == "OpportunityDelete":
-            # Handle different possible data structures for opportunity deletion
-            opportunity_id = None
-            
-            # Try different ways to get opportunity ID based on webhook structure
-            if data.get("id"):
-                opportunity_id = data.get("id")
-            elif data.get("opportunity", {}).get("id"):
-                opportunity_id = data.get("opportunity", {}).get("id")
-            
-            if opportunity_id:
-                opportunity = Opportunity.objects.filter(opportunity_id=opportunity_id).first()
-                if opportunity:
-                    opportunity.delete()
-                    print(f"Opportunity {opportunity_id} deleted successfully")
-                else:
-                    print(f"Opportunity {opportunity_id} not found for deletion")
-            else:
-                print("No opportunity ID found in webhook data")
+                print(f"Failed to fetch opportunity data for {opportunity_id}")
+        else:
+            print("No opportunity ID in webhook data")
+
+    elif event_type == "OpportunityDelete":
+        # Handle different possible data structures for opportunity deletion
+        opportunity_id = None
         
+        # Try different ways to get opportunity ID based on webhook structure
+        if data.get("id"):
+            opportunity_id = data.get("id")
+        elif data.get("opportunity", {}).get("id"):
+            opportunity_id = data.get("opportunity", {}).get("id")
+        
+        if opportunity_id:
+            opportunity = Opportunity.objects.filter(opportunity_id=opportunity_id).first()
+            if opportunity:
+                pk = opportunity.pk
+                opportunity.delete()
+                notify_opportunities_changed([pk])
+                print(f"Opportunity {opportunity_id} deleted successfully")
+            else:
+                print(f"Opportunity {opportunity_id} not found for deletion")
         else:
-            print(f"Unhandled event type: {event_type}")
-            
-    except Exception as e:
-        print(f"Error handling webhook event {event_type}: {e}")
-        # You might want to log this to a proper logging system
-        import traceback
-        print(traceback.format_exc())
\ No newline at end of file
+            print("No opportunity ID found in webhook data")
+    
+    else:
+        print(f"Unhandled event type: {event_type}")
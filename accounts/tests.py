@@ -1,3 +1,103 @@
-from django.test import TestCase
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+import requests
+from django.conf import settings
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.utils.timezone import now
+
+from accounts import tasks, token_manager as tokens
+from accounts.models import GHLAuthCredentials
+from data_management.bench.fake_ghl import FakeGHLServer
+
+
+def _response(status=200, body=b'', content_type='application/json'):
+    response = requests.Response()
+    response.status_code = status
+    response._content = body
+    response.headers['Content-Type'] = content_type
+    return response
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class TokenRefreshTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.manager = tokens.GHLTokenManager()
+        self.credentials = GHLAuthCredentials.objects.create(
+            user_id='user', location_id='loc', access_token='old', refresh_token='refresh',
+            expires_in=0, token_expires_at=now() - timedelta(minutes=1),
+        )
+
+    def test_refresh_stores_new_token(self):
+        body = b'{"access_token": "new", "refresh_token": "refresh2", "expires_in": 86400}'
+        with mock.patch.object(tokens.requests, 'post', return_value=_response(body=body)) as post:
+            self.assertEqual(self.manager.refresh('loc', stale_token='old'), 'new')
+        self.assertEqual(post.call_args.kwargs['timeout'], tokens.TOKEN_TIMEOUT)
+        self.assertEqual(post.call_args.args[0], settings.GHL_TOKEN_URL)
+        self.credentials.refresh_from_db()
+        self.assertEqual(self.credentials.refresh_token, 'refresh2')
+        self.assertIsNone(cache.get(tokens.LOCK_KEY.format(location_id='loc')))
+
+    def test_error_pages_raise_token_error(self):
+        for response in (_response(502, b'<html>Bad gateway</html>', 'text/html'), _response(200, b''),
+                         _response(200, b'{"error": "invalid_grant"}')):
+            with self.subTest(status=response.status_code, body=response.content):
+                with mock.patch.object(tokens.requests, 'post', return_value=response):
+                    with self.assertRaises(tokens.TokenError):
+                        self.manager.refresh('loc', stale_token='old')
+
+    def test_network_errors_raise_token_error(self):
+        with mock.patch.object(tokens.requests, 'post', side_effect=requests.Timeout('read timed out')):
+            with self.assertRaises(tokens.TokenError):
+                self.manager.refresh('loc', stale_token='old')
+
+    def test_lock_of_another_worker_is_kept(self):
+        lock_key = tokens.LOCK_KEY.format(location_id='loc')
+
+        def slow_refresh(*args, **kwargs):
+            # Our lock expired and another worker took it
+            cache.set(lock_key, 12345)
+            return _response(body=b'{"access_token": "new", "expires_in": 86400}')
+
+        with mock.patch.object(tokens.requests, 'post', side_effect=slow_refresh):
+            self.manager.refresh('loc', stale_token='old')
+        self.assertEqual(cache.get(lock_key), 12345)
+
+
+class RefreshTaskTests(TestCase):
+
+    def test_failures_are_logged(self):
+        GHLAuthCredentials.objects.create(user_id='user', location_id='loc', access_token='old',
+                                          refresh_token='refresh', expires_in=0)
+        with mock.patch.object(tasks.token_manager, 'refresh', side_effect=tokens.TokenError('invalid_grant')), \
+                self.assertLogs('data_management.helpers', 'ERROR') as logs:
+            tasks.make_api_for_ghl()
+        self.assertEqual(len(logs.records), 1)
+        self.assertIn('loc', logs.output[0])
+
+
+class GHLRequestTests(TestCase):
+
+    def test_default_timeout(self):
+        with mock.patch.object(tokens._session, 'request', return_value=_response(body=b'{}')) as request:
+            tokens.ghl_request('GET', 'https://example.com/contacts/', access_token='token')
+            tokens.ghl_request('GET', 'https://example.com/contacts/', access_token='token', timeout=5)
+        self.assertEqual([call.kwargs['timeout'] for call in request.call_args_list], [tokens.REQUEST_TIMEOUT, 5])
+
+
+class FakeGHLTokenTests(TestCase):
+
+    def test_refresh_against_the_fake_server(self):
+        GHLAuthCredentials.objects.create(
+            user_id='user', location_id='loc', access_token='old', refresh_token='refresh',
+            expires_in=0, token_expires_at=now() - timedelta(minutes=1),
+        )
+        with FakeGHLServer() as server, override_settings(
+                GHL_TOKEN_URL=f"{server.url}/oauth/token",
+                CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}):
+            token = tokens.GHLTokenManager().refresh('loc', stale_token='old')
+        self.assertEqual(token, 'bench-token-1')
+        self.assertEqual(server.stats['token_refreshes'], 1)
@@ -0,0 +1,319 @@
+"""
+Access-token management for the GoHighLevel API.
+
+Tokens are cached per location in process memory and in the shared Django
+cache (Redis), so hot paths such as webhook processing do not query
+`GHLAuthCredentials` for every event. Refreshes happen proactively shortly
+before `token_expires_at`, and only one worker refreshes a location at a
+time: GHL refresh tokens are single use, so concurrent refreshes would
+invalidate each other.
+"""
+import logging
+import re
+import secrets
+import threading
+import time
+from datetime import timedelta
+from typing import Dict, Optional, Tuple
+from urllib.parse import urlparse
+
+import requests
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.timezone import now
+
+from accounts.models import GHLAuthCredentials
+from kpi_backend.metrics import CACHE_REQUESTS, GHL_REQUEST_DURATION, GHL_REQUESTS
+
+logger = logging.getLogger('data_management.helpers')
+
+
+# Refresh tokens this many seconds before they expire
+REFRESH_MARGIN = 5 * 60
+
+CACHE_KEY = "ghl:token:{location_id}"
+LOCK_KEY = "ghl:token-lock:{location_id}"
+DEFAULT_LOCATION_KEY = "ghl:token:default-location"
+
+LOCK_TIMEOUT = 30
+LOCK_WAIT = 15
+
+# Seconds to wait for GHL (connect and read)
+TOKEN_TIMEOUT = 10
+REQUEST_TIMEOUT = 30
+
+# Deletes the lock only while it still holds our owner token, so a refresh
+# that outlived LOCK_TIMEOUT cannot release the next worker's lock
+RELEASE_LOCK_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+class TokenError(Exception):
+    """Raised when no usable access token can be obtained."""
+
+
+class GHLTokenManager:
+    """
+    Per-location access token cache with single-flight refresh.
+
+    Use the module level `token_manager` instance.
+    """
+
+    def __init__(self):
+        # location_id -> (access_token, expires_at epoch seconds)
+        self._tokens: Dict[str, Tuple[str, float]] = {}
+        self._locks: Dict[str, threading.Lock] = {}
+        self._locks_guard = threading.Lock()
+
+    def get_access_token(self, location_id: Optional[str] = None) -> str:
+        """
+        Return a valid access token for a location.
+
+        Args:
+            location_id: GHL location ID, or None for the first connected location
+
+        Returns:
+            Access token string
+        """
+        location_id = location_id or self._default_location_id()
+
+        token = self._get_cached(location_id)
+        if token:
+            return token
+
+        credentials = GHLAuthCredentials.objects.filter(location_id=location_id).first()
+        if not credentials:
+            raise TokenError(f"No GHL credentials found for location {location_id}")
+
+        expires_at = credentials.token_expires_at.timestamp() if credentials.token_expires_at else 0
+        if expires_at - REFRESH_MARGIN > time.time():
+            self._set_cached(location_id, credentials.access_token, expires_at)
+            return credentials.access_token
+
+        return self.refresh(location_id, stale_token=credentials.access_token)
+
+    def refresh(self, location_id: Optional[str] = None, stale_token: Optional[str] = None) -> str:
+        """
+        Refresh the access token of a location, once across all workers.
+
+        If another worker already replaced `stale_token` (or is refreshing
+        right now), its token is returned instead of refreshing again.
+
+        Args:
+            location_id: GHL location ID, or None for the first connected location
+            stale_token: The token that was found to be expired or rejected
+
+        Returns:
+            A fresh access token
+        """
+        location_id = location_id or self._default_location_id()
+
+        with self._local_lock(location_id):
+            token = self._get_cached(location_id)
+            if token and token != stale_token:
+                return token
+
+            lock_key = LOCK_KEY.format(location_id=location_id)
+            # An int, so the Redis cache stores it unpickled for the release script
+            owner = secrets.randbits(62)
+            deadline = time.monotonic() + LOCK_WAIT
+            while not cache.add(lock_key, owner, timeout=LOCK_TIMEOUT):
+                # Someone else is refreshing; wait for their result
+                if time.monotonic() > deadline:
+                    raise TokenError(f"Timed out waiting for token refresh of location {location_id}")
+                time.sleep(0.2)
+                token = self._get_cached(location_id, local=False)
+                if token and token != stale_token:
+                    return token
+
+            try:
+                credentials = GHLAuthCredentials.objects.filter(location_id=location_id).first()
+                if not credentials:
+                    raise TokenError(f"No GHL credentials found for location {location_id}")
+
+                # Refreshed by another worker between our 401 and taking the lock
+                if (stale_token and credentials.access_token != stale_token
+                        and credentials.token_expires_at
+                        and credentials.token_expires_at.timestamp() - REFRESH_MARGIN > time.time()):
+                    self._set_cached(location_id, credentials.access_token,
+                                     credentials.token_expires_at.timestamp())
+                    return credentials.access_token
+
+                return self._refresh_credentials(credentials)
+            finally:
+                _release_lock(lock_key, owner)
+
+    def store(self, credentials: GHLAuthCredentials) -> None:
+        """Cache the token of credentials that were just saved (e.g. after OAuth)."""
+        if credentials.token_expires_at:
+            self._set_cached(credentials.location_id, credentials.access_token,
+                             credentials.token_expires_at.timestamp())
+
+    def _refresh_credentials(self, credentials: GHLAuthCredentials) -> str:
+        try:
+            response = requests.post(settings.GHL_TOKEN_URL, data={
+                'grant_type': 'refresh_token',
+                'client_id': settings.GHL_CLIENT_ID,
+                'client_secret': settings.GHL_CLIENT_SECRET,
+                'refresh_token': credentials.refresh_token,
+            }, timeout=TOKEN_TIMEOUT)
+        except requests.RequestException as e:
+            raise TokenError(f"Token refresh failed for location {credentials.location_id}: {e}") from e
+
+        if not response.ok:
+            logger.error(f"Token refresh failed for location {credentials.location_id}: "
+                         f"{response.status_code} - {response.text[:500]}")
+            raise TokenError(f"Token refresh failed: {response.status_code}")
+        try:
+            new_tokens = response.json()
+        except ValueError as e:
+            logger.error(f"Token refresh for location {credentials.location_id} returned invalid JSON: "
+                         f"{response.text[:500]}")
+            raise TokenError("Token refresh returned invalid JSON") from e
+        if not isinstance(new_tokens, dict) or not new_tokens.get("access_token"):
+            logger.error(f"Token refresh for location {credentials.location_id} returned no access token")
+            raise TokenError("Token refresh returned no access token")
+
+        credentials.access_token = new_tokens.get("access_token")
+        credentials.refresh_token = new_tokens.get("refresh_token") or credentials.refresh_token
+        credentials.expires_in = new_tokens.get("expires_in")
+        credentials.token_expires_at = now() + timedelta(seconds=credentials.expires_in or 0)
+        credentials.scope = new_tokens.get("scope") or credentials.scope
+        credentials.user_type = new_tokens.get("userType") or credentials.user_type
+        credentials.company_id = new_tokens.get("companyId") or credentials.company_id
+        credentials.user_id = new_tokens.get("userId") or credentials.user_id
+        credentials.save()
+
+        self.store(credentials)
+        logger.info(f"Refreshed GHL access token for location {credentials.location_id}")
+        return credentials.access_token
+
+    def _get_cached(self, location_id: str, local: bool = True) -> Optional[str]:
+        cutoff = time.time() + REFRESH_MARGIN
+
+        if local:
+            entry = self._tokens.get(location_id)
+            if entry and entry[1] > cutoff:
+                CACHE_REQUESTS.inc(cache='ghl_token', result='hit_local')
+                return entry[0]
+
+        entry = cache.get(CACHE_KEY.format(location_id=location_id))
+        if entry and entry[1] > cutoff:
+            self._tokens[location_id] = tuple(entry)
+            CACHE_REQUESTS.inc(cache='ghl_token', result='hit_shared')
+            return entry[0]
+        CACHE_REQUESTS.inc(cache='ghl_token', result='miss')
+        return None
+
+    def _set_cached(self, location_id: str, token: str, expires_at: float) -> None:
+        self._tokens[location_id] = (token, expires_at)
+        timeout = max(int(expires_at - time.time()), 1)
+        cache.set(CACHE_KEY.format(location_id=location_id), (token, expires_at), timeout=timeout)
+
+    def _default_location_id(self) -> str:
+        location_id = cache.get(DEFAULT_LOCATION_KEY)
+        if location_id:
+            return location_id
+
+        credentials = GHLAuthCredentials.objects.first()
+        if not credentials:
+            raise TokenError("No GHL credentials found")
+        cache.set(DEFAULT_LOCATION_KEY, credentials.location_id, timeout=60 * 60)
+        return credentials.location_id
+
+    def _local_lock(self, location_id: str) -> threading.Lock:
+        with self._locks_guard:
+            return self._locks.setdefault(location_id, threading.Lock())
+
+
+def _release_lock(lock_key: str, owner: int) -> None:
+    """Delete `lock_key` if it still holds `owner` (compare-and-delete)."""
+    backend = getattr(cache, '_cache', None)
+    if hasattr(backend, 'get_client'):
+        # Redis: compare and delete atomically
+        key = cache.make_and_validate_key(lock_key)
+        backend.get_client(key, write=True).eval(RELEASE_LOCK_SCRIPT, 1, key, owner)
+    elif cache.get(lock_key) == owner:
+        cache.delete(lock_key)
+
+
+token_manager = GHLTokenManager()
+
+
+# Retries for rate limiting (429) and transient server errors (5xx)
+MAX_RETRIES = 3
+RETRY_BACKOFF = 0.5
+MAX_RETRY_AFTER = 30
+
+# Reused across requests so paginated syncs keep their connections alive
+_session = requests.Session()
+
+
+# Path segments containing a digit are record IDs; collapse them so metric
+# labels stay low-cardinality ("/contacts/{id}")
+_ID_SEGMENT_RE = re.compile(r'/[^/]*\d[^/]*')
+
+
+def _endpoint_label(url: str) -> str:
+    path = urlparse(url).path.rstrip('/') or '/'
+    return _ID_SEGMENT_RE.sub('/{id}', path)
+
+
+def _retry_delay(response: requests.Response, attempt: int) -> float:
+    retry_after = response.headers.get("Retry-After")
+    if retry_after:
+        try:
+            return min(float(retry_after), MAX_RETRY_AFTER)
+        except ValueError:
+            pass
+    return RETRY_BACKOFF * (2 ** attempt)
+
+
+def ghl_request(method: str, url: str, location_id: Optional[str] = None,
+                access_token: Optional[str] = None, **kwargs) -> requests.Response:
+    """
+    Send an authenticated request to the GHL API.
+
+    Uses `access_token` if given, otherwise the cached token of the
+    location. A 401 response triggers one token refresh and a single retry;
+    `response.token_refreshed` tells callers holding their own token to
+    switch to the token manager. 429 and 5xx responses are retried up to
+    MAX_RETRIES times with exponential backoff (honouring Retry-After).
+    Requests time out after REQUEST_TIMEOUT seconds unless `timeout` is given.
+    """
+    token = access_token or token_manager.get_access_token(location_id)
+    headers = {
+        "Accept": "application/json",
+        "Version": "2021-07-28",
+        **kwargs.pop("headers", {}),
+    }
+    kwargs.setdefault("timeout", REQUEST_TIMEOUT)
+    token_refreshed = False
+    attempt = 0
+    endpoint = _endpoint_label(url)
+
+    while True:
+        started = time.perf_counter()
+        response = _session.request(method, url, headers={**headers, "Authorization": f"Bearer {token}"}, **kwargs)
+        GHL_REQUEST_DURATION.observe(time.perf_counter() - started, endpoint=endpoint)
+        GHL_REQUESTS.inc(endpoint=endpoint, status=response.status_code)
+
+        if response.status_code == 401 and not token_refreshed:
+            logger.warning(f"GHL API returned 401 for {url}, refreshing token and retrying")
+            token = token_manager.refresh(location_id, stale_token=token)
+            token_refreshed = True
+            continue
+
+        if (response.status_code == 429 or response.status_code >= 500) and attempt < MAX_RETRIES:
+            delay = _retry_delay(response, attempt)
+            logger.warning(f"GHL API returned {response.status_code} for {url}, retrying in {delay:.1f}s")
+            time.sleep(delay)
+            attempt += 1
+            continue
+
+        response.token_refreshed = token_refreshed
+        return response
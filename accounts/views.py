@@ -1,11 +1,11 @@
 from django.shortcuts import render
 from django.http import JsonResponse
-import json
 from django.shortcuts import redirect
 from decouple import config
 import requests
+import time
 from accounts.models import GHLAuthCredentials,WebhookLog
-import json
+from kpi_backend.fast_json import loads
 from django.conf import settings
 from django.views.decorators.csrf import csrf_exempt
 from django.http import JsonResponse
@@ -13,13 +13,15 @@ from django.http import JsonResponse
 # from accounts_management_app.tasks import handle_webhook_event
 from accounts.tasks import sync_opp__and_cntct_task, handle_webhook_event
 from accounts.services import get_location_name
+from accounts.token_manager import token_manager
+from datetime import timedelta
+from django.utils.timezone import now
 
 
 
 GHL_CLIENT_ID = config("GHL_CLIENT_ID")
 GHL_CLIENT_SECRET = config("GHL_CLIENT_SECRET")
 GHL_REDIRECTED_URI = config("GHL_REDIRECTED_URI")
-TOKEN_URL = "https://services.leadconnectorhq.com/oauth/token"
 SCOPE = config("SCOPE")
 
 def auth_connect(request):
@@ -56,7 +58,7 @@ def tokens(request):
         "code": authorization_code,
     }
 
-    response = requests.post(TOKEN_URL, data=data)
+    response = requests.post(settings.GHL_TOKEN_URL, data=data)
 
     try:
         response_data = response.json()
@@ -72,6 +74,7 @@ def tokens(request):
                 "access_token": response_data.get("access_token"),
                 "refresh_token": response_data.get("refresh_token"),
                 "expires_in": response_data.get("expires_in"),
+                "token_expires_at": now() + timedelta(seconds=response_data.get("expires_in") or 0),
                 "scope": response_data.get("scope"),
                 "user_type": response_data.get("userType"),
                 "company_id": response_data.get("companyId"),
@@ -81,7 +84,11 @@ def tokens(request):
 
             }
         )
-        sync_opp__and_cntct_task.delay(response_data.get("locationId"),response_data.get("access_token"))
+        token_manager.store(obj)
+        sync_opp__and_cntct_task.apply_async(
+            args=(response_data.get("locationId"), response_data.get("access_token")),
+            priority=settings.CELERY_PRIORITY_INTERACTIVE,
+        )
 
         return JsonResponse({
             "message": "Authentication successful",
@@ -104,13 +111,13 @@ def webhook_handler(request):
         return JsonResponse({"message": "Method not allowed"}, status=405)
 
     try:
-        data = json.loads(request.body)
+        data = loads(request.body)
         print("Webhook data:", data)
         WebhookLog.objects.create(data=data)
         event_type = data.get("type")
         
         # Pass the webhook data to the task
-        handle_webhook_event.delay(data, event_type)
+        handle_webhook_event.delay(data, event_type, received_at=time.time())
         return JsonResponse({"message": "Webhook received"}, status=200)
     except Exception as e:
         print(f"Webhook handler error: {e}")
@@ -0,0 +1,212 @@
+"""
+Local stand-in for the GoHighLevel API, used to benchmark the sync offline.
+
+Serves `/contacts/` and `/opportunities/search/` with the same pagination
+parameters the sync uses (`limit`, `startAfter`, `startAfterId`), plus the
+single record endpoints used by webhooks and `/oauth/token`, so token
+refreshes never reach the real GHL. Records are generated on the fly
+from their index, so serving millions of them costs no memory.
+"""
+import json
+import random
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Optional
+from urllib.parse import parse_qs, urlparse
+
+
+SOURCES = [
+    'Google Ads', 'Google Advertising', 'Organic Google', 'Google Maps',
+    'FB Community Group', 'Facebook Ad', 'Instagram', 'Client Referral',
+    'Word of mouth', 'Referral', 'BNI', 'Door Knocking',
+]
+STATUSES = ['open', 'won', 'lost', 'abandoned']
+PIPELINE_ID = 'bench-pipeline'
+STAGE_IDS = [f'bench-stage-{i}' for i in range(1, 7)]
+
+EPOCH = datetime(2023, 1, 1, tzinfo=timezone.utc)
+
+
+def contact_record(index: int) -> Dict[str, Any]:
+    rnd = random.Random(index)
+    created = (EPOCH + timedelta(minutes=index * 7)).isoformat().replace('+00:00', 'Z')
+    return {
+        'id': f'c{index:09d}',
+        'firstName': f'First{index}',
+        'lastName': f'Last{index}',
+        'email': f'contact{index}@example.com',
+        'phone': f'+61400{index % 1000000:06d}',
+        'address': f'{index} Example Street',
+        'country': 'AU',
+        'tags': ['bench'] if index % 3 else [],
+        'source': rnd.choice(SOURCES),
+        'dateAdded': created,
+        'createdAt': created,
+    }
+
+
+def opportunity_record(index: int, contacts: int) -> Dict[str, Any]:
+    rnd = random.Random(-index - 1)
+    created = (EPOCH + timedelta(minutes=index * 5)).isoformat().replace('+00:00', 'Z')
+    return {
+        'id': f'o{index:09d}',
+        'name': f'Job {index}',
+        'contactId': f'c{index % max(contacts, 1):09d}',
+        'pipelineId': PIPELINE_ID,
+        'pipelineStageId': rnd.choice(STAGE_IDS),
+        'source': rnd.choice(SOURCES),
+        'status': rnd.choice(STATUSES),
+        'monetaryValue': round(rnd.uniform(100, 20000), 2),
+        'assignedTo': f'user{index % 5}',
+        'createdAt': created,
+        'updatedAt': created,
+    }
+
+
+class FakeGHLServer:
+    """
+    Threaded HTTP server emulating the GHL endpoints used by GHLSyncService.
+
+    Args:
+        contacts: Number of contacts to serve
+        opportunities: Number of opportunities to serve
+        latency: Seconds to wait before answering each request
+        error_rate: Fraction of requests answered with a 500
+        rate_limit: Max requests per second before answering 429 (0 = off)
+        seed: Seed for error injection
+        port: Port to listen on (0 picks a free one)
+    """
+
+    def __init__(self, contacts: int = 1000, opportunities: int = 1000, latency: float = 0.0,
+                 error_rate: float = 0.0, rate_limit: int = 0, seed: int = 0, port: int = 0):
+        self.contacts = contacts
+        self.opportunities = opportunities
+        self.latency = latency
+        self.error_rate = error_rate
+        self.rate_limit = rate_limit
+        self.stats = {'requests': 0, 'errors': 0, 'rate_limited': 0, 'token_refreshes': 0}
+
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._window_start = time.monotonic()
+        self._window_count = 0
+
+        self._server = ThreadingHTTPServer(('127.0.0.1', port), self._make_handler())
+        self._server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> 'FakeGHLServer':
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _injected_status(self) -> Optional[int]:
+        """Return 429/500 if this request should fail, else None."""
+        with self._lock:
+            self.stats['requests'] += 1
+
+            if self.rate_limit:
+                current = time.monotonic()
+                if current - self._window_start >= 1:
+                    self._window_start, self._window_count = current, 0
+                self._window_count += 1
+                if self._window_count > self.rate_limit:
+                    self.stats['rate_limited'] += 1
+                    return 429
+
+            if self.error_rate and self._random.random() < self.error_rate:
+                self.stats['errors'] += 1
+                return 500
+        return None
+
+    def _page(self, params: Dict[str, str], total: int, make_record, key: str) -> Dict[str, Any]:
+        limit = min(int(params.get('limit', 100)), 100)
+        start_after_id = params.get('startAfterId')
+        start = int(start_after_id[1:]) + 1 if start_after_id else 0
+        records = [make_record(index) for index in range(start, min(start + limit, total))]
+        return {key: records, 'meta': {'total': total}}
+
+    def _token(self) -> Dict[str, Any]:
+        with self._lock:
+            self.stats['token_refreshes'] += 1
+            number = self.stats['token_refreshes']
+        return {
+            'access_token': f'bench-token-{number}',
+            'refresh_token': 'bench-refresh',
+            'expires_in': 86400,
+            'token_type': 'Bearer',
+        }
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                if server.latency:
+                    time.sleep(server.latency)
+
+                injected = server._injected_status()
+                if injected:
+                    headers = {'Retry-After': '1'} if injected == 429 else {}
+                    return self._send(injected, {'message': 'injected failure'}, headers)
+
+                parsed = urlparse(self.path)
+                params = {k: v[0] for k, v in parse_qs(parsed.query).items()}
+                path = parsed.path.rstrip('/')
+
+                if path == '/contacts':
+                    body = server._page(params, server.contacts, contact_record, 'contacts')
+                elif path == '/opportunities/search':
+                    body = server._page(
+                        params, server.opportunities,
+                        lambda index: opportunity_record(index, server.contacts), 'opportunities'
+                    )
+                elif path.startswith('/contacts/'):
+                    body = {'contact': contact_record(int(path.rsplit('/', 1)[1][1:]))}
+                elif path.startswith('/opportunities/'):
+                    index = int(path.rsplit('/', 1)[1][1:])
+                    body = {'opportunity': opportunity_record(index, server.contacts)}
+                else:
+                    return self._send(404, {'message': 'not found'})
+                self._send(200, body)
+
+            def do_POST(self):
+                # Drain the form body so the connection can be reused
+                self.rfile.read(int(self.headers.get('Content-Length') or 0))
+                if urlparse(self.path).path.rstrip('/') != '/oauth/token':
+                    return self._send(404, {'message': 'not found'})
+                self._send(200, server._token())
+
+            def _send(self, status, body, headers=None):
+                payload = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
@@ -0,0 +1,168 @@
+"""
+Synthetic pipelines, contacts and opportunities for local benchmarking.
+
+Sources follow a Zipf-like distribution and stages a funnel shape, and
+creation dates grow denser towards today with a small share in the coming
+month (booked jobs), so the dashboard's date filters behave as on real data.
+Seeded rows are marked with a `seed-` prefix on their GHL ids so they can be
+removed again with `clear_seeded()`.
+"""
+from datetime import timedelta
+from typing import Callable, Optional
+
+import numpy as np
+from django.db import transaction
+from django.utils.timezone import now
+
+from data_management.bench.fake_ghl import SOURCES
+from data_management.date_ranges import location_timezone
+from data_management.models import Contact, Opportunity, Pipeline, PipelineStage
+
+
+SEED_PREFIX = 'seed-'
+
+# (stage name, opportunity status, share of opportunities)
+STAGES = [
+    ('New Lead', 'open', 0.35),
+    ('Contacted', 'open', 0.15),
+    ('Quote Sent', 'quoted', 0.15),
+    ('Awaiting Deposit', 'awaiting deposit', 0.05),
+    ('Quote Booked', 'booked', 0.08),
+    ('Won', 'won', 0.12),
+    ('Lost', 'lost', 0.10),
+]
+
+SOURCE_WEIGHTS = 1 / np.arange(1, len(SOURCES) + 1) ** 1.1
+SOURCE_WEIGHTS /= SOURCE_WEIGHTS.sum()
+STAGE_WEIGHTS = np.array([share for _, _, share in STAGES])
+STAGE_WEIGHTS /= STAGE_WEIGHTS.sum()
+
+# Share of opportunities created in the next 30 days (scheduled jobs)
+FUTURE_SHARE = 0.03
+
+
+def create_pipelines(count: int = 1):
+    """Create `count` seeded pipelines with the funnel stages; return their stages."""
+    timestamp = now()
+    stages = []
+    for index in range(count):
+        pipeline = Pipeline.objects.create(
+            name=f"Seed Pipeline {index + 1}",
+            pipeline_id=f"{SEED_PREFIX}pipeline-{index}",
+            date_added=timestamp,
+            date_updated=timestamp,
+        )
+        stages.append(PipelineStage.objects.bulk_create([
+            PipelineStage(
+                pipeline=pipeline,
+                name=name,
+                pipeline_stage_id=f"{SEED_PREFIX}stage-{index}-{position}",
+                position=position,
+            )
+            for position, (name, _, _) in enumerate(STAGES)
+        ]))
+    return stages
+
+
+def seed(opportunities: int, contacts: Optional[int] = None, pipelines: int = 1, days: int = 730,
+         batch_size: int = 5000, random_seed: int = 0,
+         progress: Optional[Callable[[str, int], None]] = None) -> None:
+    """
+    Insert seeded data in batches of `batch_size`, each in its own transaction.
+
+    Args:
+        opportunities: Number of opportunities to create
+        contacts: Number of contacts (defaults to 80% of opportunities)
+        pipelines: Number of pipelines; opportunities are spread evenly
+        days: How far back creation dates go
+        batch_size: Rows per bulk insert
+        random_seed: Seed for the random generator
+        progress: Called with (model name, rows created so far) after each batch
+    """
+    rng = np.random.default_rng(random_seed)
+    contacts = contacts if contacts is not None else max(int(opportunities * 0.8), 1)
+    pipeline_stages = create_pipelines(pipelines)
+    reference = now()
+
+    # Contact primary keys and sources, looked up by the opportunities
+    contact_pks = np.empty(contacts, dtype=np.int64)
+    contact_sources = rng.choice(len(SOURCES), size=contacts, p=SOURCE_WEIGHTS).astype(np.int16)
+
+    for start in range(0, contacts, batch_size):
+        stop = min(start + batch_size, contacts)
+        offsets = _creation_offsets(rng, stop - start, days)
+        batch = [
+            Contact(
+                contact_id=f"{SEED_PREFIX}{index}",
+                first_name=f"First{index}",
+                last_name=f"Last{index}",
+                full_name_lowercase=f"first{index} last{index}",
+                email=f"seed{index}@example.com",
+                phone=f"+61400{index % 1000000:06d}",
+                address=f"{index} Seed Street",
+                country="AU",
+                tags=[],
+                source=SOURCES[contact_sources[index]],
+                date_added=reference - timedelta(seconds=int(offset)),
+                date_updated=reference,
+            )
+            for index, offset in zip(range(start, stop), offsets)
+        ]
+        with transaction.atomic():
+            created = Contact.objects.bulk_create(batch)
+        contact_pks[start:stop] = [contact.pk for contact in created]
+        if progress:
+            progress('contacts', stop)
+
+    tz = location_timezone()
+    for start in range(0, opportunities, batch_size):
+        stop = min(start + batch_size, opportunities)
+        size = stop - start
+        contact_index = rng.integers(0, contacts, size=size)
+        stage_index = rng.choice(len(STAGES), size=size, p=STAGE_WEIGHTS)
+        pipeline_index = rng.integers(0, pipelines, size=size)
+        offsets = _creation_offsets(rng, size, days)
+        values = np.round(rng.lognormal(mean=8, sigma=0.8, size=size), 2)
+        missing_value = rng.random(size) < 0.05
+
+        batch = []
+        for i in range(size):
+            stage = pipeline_stages[pipeline_index[i]][stage_index[i]]
+            source = SOURCES[contact_sources[contact_index[i]]]
+            batch.append(Opportunity(
+                opportunity_id=f"{SEED_PREFIX}{start + i}",
+                contact_id=int(contact_pks[contact_index[i]]),
+                pipeline_id=stage.pipeline_id,
+                current_stage=stage,
+                created_by_source=source,
+                created_by_channel='seed',
+                source_id=source,
+                created_timestamp=reference - timedelta(seconds=int(offsets[i])),
+                value=None if missing_value[i] else float(values[i]),
+                assigned=f"user{i % 5}",
+                tags='[]',
+                status=STAGES[stage_index[i]][1],
+            ))
+            batch[-1].localize(tz)
+        with transaction.atomic():
+            Opportunity.objects.bulk_create(batch)
+        if progress:
+            progress('opportunities', stop)
+
+
+def clear_seeded() -> None:
+    """Delete all seeded rows."""
+    with transaction.atomic():
+        Opportunity.objects.filter(opportunity_id__startswith=SEED_PREFIX).delete()
+        Contact.objects.filter(contact_id__startswith=SEED_PREFIX).delete()
+        Pipeline.objects.filter(pipeline_id__startswith=SEED_PREFIX).delete()
+
+
+def _creation_offsets(rng: np.random.Generator, size: int, days: int) -> np.ndarray:
+    """
+    Seconds before now for `size` records: denser towards today (growing
+    business), with FUTURE_SHARE of them up to 30 days ahead (negative).
+    """
+    past = (1 - rng.power(2, size=size)) * days * 86400
+    future = -rng.random(size) * 30 * 86400
+    return np.where(rng.random(size) < FUTURE_SHARE, future, past)
@@ -0,0 +1,60 @@
+"""
+Measurement helpers shared by the benchmark commands.
+"""
+import resource
+import sys
+import time
+from typing import Dict, List, Optional
+
+from django.db import connection
+
+
+class QueryStats:
+    """execute_wrapper that counts queries and the time spent in them."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - started
+            self.count += 1
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def percentiles(samples: List[float], points=(50, 90, 95, 99)) -> Dict[str, float]:
+    """Nearest-rank percentiles of `samples`, plus min/max/mean."""
+    ordered = sorted(samples)
+    if not ordered:
+        return {}
+    result = {f"p{point}": ordered[min(len(ordered) - 1, max(0, -(-point * len(ordered) // 100) - 1))]
+              for point in points}
+    result.update(min=ordered[0], max=ordered[-1], mean=sum(ordered) / len(ordered))
+    return result
+
+
+def rows_scanned() -> Optional[int]:
+    """
+    Rows read from data_management tables in the current transaction
+    (sequential scans + index fetches), from pg_stat_xact_user_tables.
+
+    Returns None on databases other than PostgreSQL.
+    """
+    if connection.vendor != 'postgresql':
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT COALESCE(SUM(COALESCE(seq_tup_read, 0) + COALESCE(idx_tup_fetch, 0)), 0) "
+            "FROM pg_stat_xact_user_tables WHERE relname LIKE %s",
+            ['data_management_%']
+        )
+        return int(cursor.fetchone()[0])
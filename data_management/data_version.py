@@ -0,0 +1,184 @@
+"""
+Data version and ETags of the analytics endpoints.
+
+Every write of synced data (GHLSyncService batches, webhook events, XLSX
+imports) bumps a monotonically increasing version of its GHL location in
+the shared cache; writes without a location (imports) bump a shared one.
+Views decorated with `@conditional_get` send an ETag derived from those
+versions, the request's path and query parameters and the negotiated media
+type (with `Vary: Accept`), and answer a matching `If-None-Match` with 304
+before running any query:
+
+    @conditional_get
+    class DashboardAPIView(GenericAPIView):
+        ...
+
+ETags also change every DATA_ETAG_TTL seconds, because windows such as
+"this week" or "the next 14 days" move with the clock; this also bounds how
+long a missed bump (cache briefly unreachable) can serve stale 304s.
+
+The analytics tables have no location column, so the endpoints combine the
+versions of every connected location. A bump also counts as a write for
+the read replica router, so for REPLICA_MAX_LAG seconds afterwards the
+body sent with a new ETag is read from the primary, never from a replica
+that has not replayed the change yet.
+"""
+import functools
+import hashlib
+import inspect
+import logging
+import time
+from typing import List, Optional
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponseNotModified
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.utils.http import parse_etags, quote_etag
+
+from accounts.models import GHLAuthCredentials
+from kpi_backend.db_router import read_replica, recent_write, record_write
+
+logger = logging.getLogger('data_management.helpers')
+
+VERSION_KEY = 'data:version:{location_id}'
+# Version of the writes that have no location
+SHARED = '*'
+
+# Seconds the connected locations are cached per process
+LOCATIONS_TTL = 5 * 60
+
+_locations = (0.0, None)
+
+
+def _initial_version() -> int:
+    # Starting from the clock keeps the version increasing when the cache
+    # loses the key
+    return time.time_ns()
+
+
+def bump_data_version(location_id: Optional[str] = None) -> None:
+    """
+    Mark the synced data of a location as changed; call once the write is committed.
+
+    Args:
+        location_id: GHL location whose data changed, None when unknown
+    """
+    record_write()
+    key = VERSION_KEY.format(location_id=location_id or SHARED)
+    try:
+        cache.add(key, _initial_version(), timeout=None)
+        cache.incr(key)
+    except Exception as e:
+        logger.warning(f"Could not bump data version: {e}")
+
+
+def _connected_locations() -> List[str]:
+    global _locations
+    expires, cached = _locations
+    if cached is not None and time.monotonic() < expires:
+        return cached
+    locations = sorted(set(GHLAuthCredentials.objects.exclude(location_id__isnull=True)
+                           .exclude(location_id="").values_list('location_id', flat=True)))
+    _locations = (time.monotonic() + LOCATIONS_TTL, locations)
+    return locations
+
+
+def data_version(location_ids: Optional[List[str]] = None) -> Optional[str]:
+    """
+    Current data version of some locations, or None when the cache is unavailable.
+
+    Args:
+        location_ids: GHL locations, default every connected one; the
+            shared version is always included
+    """
+    if location_ids is None:
+        location_ids = _connected_locations()
+    keys = [VERSION_KEY.format(location_id=location_id) for location_id in [SHARED, *location_ids]]
+    try:
+        versions = cache.get_many(keys)
+        missing = [key for key in keys if key not in versions]
+        if missing:
+            for key in missing:
+                cache.add(key, _initial_version(), timeout=None)
+            versions.update(cache.get_many(missing))
+        return ",".join(str(versions[key]) for key in keys)
+    except Exception as e:
+        logger.warning(f"Could not read data version: {e}")
+        return None
+
+
+def data_etag(request) -> Optional[str]:
+    """Quoted ETag of a GET request for the current data version, or None."""
+    version = data_version()
+    if version is None:
+        return None
+    ttl = getattr(settings, 'DATA_ETAG_TTL', 60)
+    key = "\n".join([
+        str(version),
+        str(int(time.time() // ttl)),
+        request.path,
+        # DRF views can render the same data as JSON or HTML
+        getattr(request, 'accepted_media_type', None) or request.META.get('HTTP_ACCEPT', ''),
+        *sorted(f"{name}={value}" for name, value in request.GET.lists()),
+    ])
+    return quote_etag(hashlib.blake2b(key.encode(), digest_size=16).hexdigest())
+
+
+def _not_modified(request, etag: Optional[str]) -> bool:
+    if etag is None:
+        return False
+    # Weak comparison, as If-None-Match requires
+    etags = {tag.removeprefix('W/') for tag in parse_etags(request.META.get('HTTP_IF_NONE_MATCH', ''))}
+    return '*' in etags or etag in etags
+
+
+def _finish(response, etag: Optional[str]):
+    if etag is not None and response.status_code == 200:
+        response['ETag'] = etag
+        # Let browsers store the payload but revalidate it on every poll
+        patch_cache_control(response, private=True, no_cache=True)
+        patch_vary_headers(response, ['Accept'])
+    return response
+
+
+def _not_modified_response(etag: str):
+    response = HttpResponseNotModified()
+    response['ETag'] = etag
+    patch_vary_headers(response, ['Accept'])
+    return response
+
+
+def conditional_get(view):
+    """
+    ETag / If-None-Match support for the GET handler of a view class.
+
+    Wraps `get`, so on DRF views authentication and permissions run first.
+    Works on sync and async handlers. Right after a bump the handler reads
+    from the primary, as the ETag already names the new version.
+    """
+    get = view.get
+
+    if inspect.iscoroutinefunction(get):
+        @functools.wraps(get)
+        async def wrapped(self, request, *args, **kwargs):
+            etag = await sync_to_async(data_etag)(request)
+            if _not_modified(request, etag):
+                return _not_modified_response(etag)
+            # Async handlers pick their database with read_database(),
+            # which checks recent_write() itself
+            return _finish(await get(self, request, *args, **kwargs), etag)
+    else:
+        @functools.wraps(get)
+        def wrapped(self, request, *args, **kwargs):
+            etag = data_etag(request)
+            if _not_modified(request, etag):
+                return _not_modified_response(etag)
+            if recent_write():
+                with read_replica('default'):
+                    return _finish(get(self, request, *args, **kwargs), etag)
+            return _finish(get(self, request, *args, **kwargs), etag)
+
+    view.get = wrapped
+    return view
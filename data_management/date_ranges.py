@@ -0,0 +1,118 @@
+"""
+Date ranges of the analytics endpoints, in the GHL location's timezone.
+
+Requests give whole days (`start_date`, `end_date` as YYYY-MM-DD). They are
+turned into half-open, timezone-aware `[start, end)` bounds from local
+midnight to local midnight, so filters compare `created_timestamp` directly
+and can use its index, where `__date` lookups cast every row:
+
+    date_range = parse_date_range(request.query_params)
+    Opportunity.objects.filter(date_range.filter('created_timestamp'))
+"""
+import time
+import zoneinfo
+from datetime import date, datetime, timedelta, tzinfo
+from typing import Mapping, NamedTuple, Optional
+
+from django.db.models import Q
+from django.utils import timezone
+
+from accounts.models import GHLAuthCredentials
+from data_management.models import Opportunity
+
+
+# Seconds the location timezone is cached per process
+TIMEZONE_TTL = 5 * 60
+
+_timezone = (0.0, None)
+
+
+def location_timezone() -> tzinfo:
+    """Timezone of the GHL location (GHLAuthCredentials.timezone), else the default one."""
+    global _timezone
+    expires, cached = _timezone
+    if cached is not None and time.monotonic() < expires:
+        return cached
+
+    name = GHLAuthCredentials.objects.exclude(timezone__isnull=True).exclude(timezone="") \
+        .values_list('timezone', flat=True).first()
+    try:
+        zone = zoneinfo.ZoneInfo(name) if name else timezone.get_default_timezone()
+    except (zoneinfo.ZoneInfoNotFoundError, ValueError):
+        zone = timezone.get_default_timezone()
+    _timezone = (time.monotonic() + TIMEZONE_TTL, zone)
+    return zone
+
+
+def local_now() -> datetime:
+    return timezone.now().astimezone(location_timezone())
+
+
+def local_today() -> date:
+    return local_now().date()
+
+
+def midnight(day: date, tz: tzinfo = None) -> datetime:
+    """Start of `day` in `tz` (default: the location timezone)."""
+    return datetime.combine(day, datetime.min.time(), tzinfo=tz or location_timezone())
+
+
+class DateRange(NamedTuple):
+    """Aware `[start, end)` bounds; None is unbounded."""
+
+    start: Optional[datetime]
+    end: Optional[datetime]
+
+    def filter(self, field: str) -> Q:
+        condition = Q()
+        if self.start:
+            condition &= Q(**{f'{field}__gte': self.start})
+        if self.end:
+            condition &= Q(**{f'{field}__lt': self.end})
+        return condition
+
+    @property
+    def first_day(self) -> Optional[date]:
+        return self.start.date() if self.start else None
+
+    @property
+    def last_day(self) -> Optional[date]:
+        return (self.end - timedelta(microseconds=1)).date() if self.end else None
+
+
+def day_range(first_day: date = None, last_day: date = None, tz: tzinfo = None) -> DateRange:
+    """Whole local days `first_day` to `last_day`, both included."""
+    tz = tz or location_timezone()
+    return DateRange(
+        midnight(first_day, tz) if first_day else None,
+        midnight(last_day + timedelta(days=1), tz) if last_day else None,
+    )
+
+
+def default_date_range() -> DateRange:
+    """From the day of the first opportunity until today."""
+    tz = location_timezone()
+    first = Opportunity.objects.order_by('created_timestamp').values_list('created_timestamp', flat=True).first()
+    today = timezone.now().astimezone(tz).date()
+    return day_range(first.astimezone(tz).date() if first else today, today, tz)
+
+
+def parse_date_range(params: Mapping[str, str], default: DateRange = None) -> DateRange:
+    """
+    Range of the `start_date` and `end_date` (YYYY-MM-DD) parameters.
+
+    Args:
+        params: Query parameters
+        default: Used when either is missing (default: default_date_range())
+
+    Raises:
+        ValueError: When a date is not YYYY-MM-DD
+    """
+    start_date = params.get('start_date')
+    end_date = params.get('end_date')
+    if not start_date or not end_date:
+        return default or default_date_range()
+    return day_range(
+        datetime.strptime(start_date, '%Y-%m-%d').date(),
+        datetime.strptime(end_date, '%Y-%m-%d').date(),
+    )
@@ -0,0 +1,55 @@
+from rest_framework.exceptions import ValidationError
+
+from .date_ranges import parse_date_range
+
+
+# Frontend source buckets -> raw `created_by_source` values stored from GHL
+SOURCE_MAP = {
+    'Google Ads': ['Google Ads', 'Google Advertising', 'google Ads'],
+    'GBP Organic': ['Organic Google', 'Google Maps', 'Organic google'],
+    'Facebook Groups': ['FB Community Group', 'FB Community G', 'Facebook Community Group', 'Facebook Ad', 'Instagram'],
+    'Referrals': ['Client Referral', 'Client referral', 'Word of mouth', 'Word Of Mouth', 'Referral', 'BNI'],
+    'Door Knocking': ['Door Knocking', 'Door knocking']
+}
+
+
+def filter_opportunities(queryset, params):
+    """
+    Apply the opportunity list filters to a queryset.
+
+    Shared by the list API, the export API and the export command.
+
+    Args:
+        queryset: Opportunity queryset to filter
+        params: Mapping with optional `start_date`, `end_date` (YYYY-MM-DD),
+            `source` (a SOURCE_MAP bucket or raw contact source) and
+            `pipeline_name` (current stage name)
+
+    Returns:
+        Filtered queryset
+    """
+    try:
+        # Whole days in the location's timezone, as [start, end)
+        date_range = parse_date_range(params)
+    except ValueError:
+        raise ValidationError({
+            'error': 'Invalid date format',
+            'message': 'Please provide dates in YYYY-MM-DD format'
+        })
+
+    queryset = queryset.filter(date_range.filter('created_timestamp'))
+
+    source = params.get('source')
+    if source:
+        mapped_sources = SOURCE_MAP.get(source)
+        if mapped_sources:
+            queryset = queryset.filter(created_by_source__in=mapped_sources)
+        else:
+            # If no mapping found, fallback to exact match
+            queryset = queryset.filter(contact__source__iexact=source)
+
+    pipeline_stage = params.get('pipeline_name')
+    if pipeline_stage:
+        queryset = queryset.filter(current_stage__name=pipeline_stage)
+
+    return queryset
@@ -1,14 +1,21 @@
 import requests
 import time
+from contextlib import nullcontext
+from django.conf import settings
 from typing import List, Dict, Any, Optional
-from django.utils.dateparse import parse_datetime
 from django.db import transaction
-from django.utils.timezone import make_aware, now, is_naive
+from django.utils import timezone
 from datetime import datetime
-from data_management.models import Contact, Pipeline, PipelineStage, Opportunity
-from accounts.models import GHLAuthCredentials
+from data_management.data_version import bump_data_version
+from data_management.date_ranges import location_timezone
+from data_management.mapping import CONTACT_MAPPING, OPPORTUNITY_MAPPING, opportunity_lookups
+from data_management.models import Contact, Opportunity, OpportunityStageEvent, SyncRun
+from data_management.snapshot import notify_opportunities_changed
+from data_management.stage_events import stage_event
+from data_management.sync_runs import SyncRunRecorder
+from accounts.token_manager import token_manager, ghl_request
+from kpi_backend.metrics import SYNC_BATCH_DURATION, SYNC_BATCH_SIZE, SYNC_PAGES, SYNC_RECORDS
 import logging
-import pytz
 
 # logger = logging.getLogger(__name__)
 
@@ -20,16 +27,18 @@ class GHLSyncService:
     Service class to handle automated synchronization of contacts and opportunities
     from GoHighLevel API to local Django models.
     """
+
+    # Pause between pages to be respectful to the API
+    page_delay = 0.1
     
-    def __init__(self, location_id: str, access_token: str = None):
+    def __init__(self, location_id: str, access_token: str = None, columnar: bool = None):
         self.location_id = location_id
         self.access_token = access_token
-        self.base_url = "https://services.leadconnectorhq.com"
-        self.headers = {
-            "Accept": "application/json",
-            "Authorization": f"Bearer {access_token}",
-            "Version": "2021-07-28"
-        }
+        self.base_url = settings.GHL_API_BASE_URL
+        # Map records column by column with pandas (see data_management.mapping)
+        self.columnar = getattr(settings, 'GHL_SYNC_COLUMNAR', False) if columnar is None else columnar
+        # SyncRunRecorder of the current run, if any
+        self.run = None
     
     def sync_all_data(self):
         """
@@ -39,12 +48,16 @@ class GHLSyncService:
         
         try:
             # First, sync contacts
-            contacts = self.fetch_all_contacts()
-            self.sync_contacts_to_db(contacts)
+            with self._phase('fetch_contacts'):
+                contacts = self.fetch_all_contacts()
+            with self._phase('sync_contacts'):
+                self.sync_contacts_to_db(contacts)
             
             # Then, sync opportunities
-            opportunities = self.fetch_all_opportunities()
-            self.sync_opportunities_to_db(opportunities)
+            with self._phase('fetch_opportunities'):
+                opportunities = self.fetch_all_opportunities()
+            with self._phase('sync_opportunities'):
+                self.sync_opportunities_to_db(opportunities)
             
             logger.info("GHL data synchronization completed successfully!")
             
@@ -82,7 +95,7 @@ class GHLSyncService:
                 params["startAfterId"] = start_after_id
                 
             try:
-                response = requests.get(endpoint, headers=self.headers, params=params)
+                response = self._get(endpoint, params)
                 
                 if response.status_code != 200:
                     logger.error(f"Error Response: {response.status_code} - {response.text}")
@@ -96,6 +109,10 @@ class GHLSyncService:
                     break
                     
                 all_contacts.extend(contacts)
+                SYNC_PAGES.inc(kind='contacts')
+                if self.run:
+                    self.run.page(len(contacts))
+                SYNC_RECORDS.inc(len(contacts), kind='contacts')
                 logger.info(f"Retrieved {len(contacts)} contacts. Total so far: {len(all_contacts)}")
                 
                 # Update pagination cursors for next request
@@ -124,7 +141,7 @@ class GHLSyncService:
                 raise
                 
             # Add a small delay to be respectful to the API
-            time.sleep(0.1)
+            time.sleep(self.page_delay)
             
             # Safety check to prevent infinite loops
             if page_count > 1000:
@@ -164,7 +181,7 @@ class GHLSyncService:
                 params["startAfterId"] = start_after_id
                 
             try:
-                response = requests.get(endpoint, headers=self.headers, params=params)
+                response = self._get(endpoint, params)
                 
                 if response.status_code != 200:
                     logger.error(f"Error Response: {response.status_code} - {response.text}")
@@ -178,6 +195,10 @@ class GHLSyncService:
                     break
                     
                 all_opportunities.extend(opportunities)
+                SYNC_PAGES.inc(kind='opportunities')
+                if self.run:
+                    self.run.page(len(opportunities))
+                SYNC_RECORDS.inc(len(opportunities), kind='opportunities')
                 logger.info(f"Retrieved {len(opportunities)} opportunities. Total so far: {len(all_opportunities)}")
                 
                 # Update pagination cursors for next request
@@ -206,7 +227,7 @@ class GHLSyncService:
                 raise
                 
             # Add a small delay to be respectful to the API
-            time.sleep(0.1)
+            time.sleep(self.page_delay)
             
             # Safety check to prevent infinite loops
             if page_count > 1000:
@@ -231,55 +252,28 @@ class GHLSyncService:
         
         contacts_to_create = []
         contacts_to_update = []
+        records = [item for item in contact_data if item.get("id")]
+        skipped = len(contact_data) - len(records)
         
-        # Get existing contact IDs for efficient lookups
-        existing_contacts = {
-            contact.contact_id: contact 
-            for contact in Contact.objects.filter(
-                contact_id__in=[c.get('id') for c in contact_data if c.get('id')]
-            ).select_related()
-        }
+        # Primary keys of existing contacts; updates only need the pk
+        existing_contacts = dict(
+            Contact.objects.filter(
+                contact_id__in=[item["id"] for item in records]
+            ).values_list('contact_id', 'id')
+        )
 
-        for item in contact_data:
-            contact_id = item.get("id")
-            if not contact_id:
-                continue
-                
-            # Parse and handle date
-            date_added = self._parse_date(item.get("createdAt"))
-            
-            # Prepare contact data
-            contact_data_dict = {
-                'contact_id': contact_id,
-                'first_name': (item.get("firstName") or "").strip()[:100],
-                'last_name': (item.get("lastName") or "").strip()[:100],
-                'phone': (item.get("phone") or "").strip()[:20],
-                'email': (item.get("email") or "").strip() or None,
-                'address': (item.get("address") or "").strip()[:255],
-                'country': (item.get("country") or "").strip()[:10],
-                'date_added': date_added or now(),
-                'date_updated': now(),
-                'tags': item.get("tags", []),
-                'source': (item.get("source") or "ghl_api").strip()[:100],
-            }
-            
-            # Generate full_name_lowercase
-            full_name = f"{contact_data_dict['first_name']} {contact_data_dict['last_name']}"
-            contact_data_dict['full_name_lowercase'] = full_name.lower().strip()
-
-            if contact_id in existing_contacts:
-                # Update existing contact
-                existing_contact = existing_contacts[contact_id]
-                for key, value in contact_data_dict.items():
-                    if key != 'contact_id':  # Don't update the ID
-                        setattr(existing_contact, key, value)
-                contacts_to_update.append(existing_contact)
+        for values in CONTACT_MAPPING.many(records, columnar=self.columnar):
+            pk = existing_contacts.get(values['contact_id'])
+            if pk:
+                contacts_to_update.append(Contact(id=pk, **values))
             else:
-                # Create new contact
-                contacts_to_create.append(Contact(**contact_data_dict))
+                contacts_to_create.append(Contact(**values))
 
         # Perform bulk operations
-        with transaction.atomic():
+        SYNC_BATCH_SIZE.observe(len(contacts_to_create) + len(contacts_to_update), model='contact')
+        if self.run:
+            self.run.count(created=len(contacts_to_create), updated=len(contacts_to_update), skipped=skipped)
+        with SYNC_BATCH_DURATION.time(model='contact'), transaction.atomic():
             if contacts_to_create:
                 Contact.objects.bulk_create(contacts_to_create, ignore_conflicts=True)
                 logger.info(f"Created {len(contacts_to_create)} new contacts.")
@@ -294,6 +288,9 @@ class GHLSyncService:
                 )
                 logger.info(f"Updated {len(contacts_to_update)} existing contacts.")
 
+            # Also keeps replica reads on the primary for a while
+            transaction.on_commit(lambda: bump_data_version(self.location_id))
+
     def sync_opportunities_to_db(self, opportunity_data: List[Dict[str, Any]]):
         """
         Syncs opportunity data from API into the local Opportunity model.
@@ -309,87 +306,63 @@ class GHLSyncService:
         
         opportunities_to_create = []
         opportunities_to_update = []
+        records = [item for item in opportunity_data if item.get("id")]
+        skipped = len(opportunity_data) - len(records)
         
-        # Get existing opportunities for efficient lookups
+        # Primary key and stage of existing opportunities; updates only need the pk
         existing_opportunities = {
-            opp.opportunity_id: opp 
-            for opp in Opportunity.objects.filter(
-                opportunity_id__in=[o.get('id') for o in opportunity_data if o.get('id')]
-            ).select_related('contact', 'pipeline', 'current_stage')
+            opportunity_id: (pk, stage_id)
+            for opportunity_id, pk, stage_id in Opportunity.objects.filter(
+                opportunity_id__in=[item["id"] for item in records]
+            ).values_list('opportunity_id', 'id', 'current_stage_id')
         }
 
-        
-        
-        # Preload contacts, pipelines, and stages for efficient lookups
-        contact_lookup = {
-            contact.contact_id: contact 
-            for contact in Contact.objects.all()
-        }
-        pipeline_lookup = {
-            pipeline.pipeline_id: pipeline 
-            for pipeline in Pipeline.objects.all()
-        }
-        stage_lookup = {
-            stage.pipeline_stage_id: stage 
-            for stage in PipelineStage.objects.all()
-        }
+        # GHL id -> primary key of all contacts, pipelines and stages
+        lookups = opportunity_lookups()
+        now = timezone.now()
+        tz = location_timezone()
+        stage_events = []
+        new_records = []
 
-        for item in opportunity_data:
-            opportunity_id = item.get("id")
-            if not opportunity_id:
+        for item, values in zip(records, OPPORTUNITY_MAPPING.many(records, lookups, now, columnar=self.columnar)):
+            if values['contact_id'] is None:
+                logger.warning(f"Contact {item.get('contactId')} not found for opportunity {item['id']}")
+                skipped += 1
                 continue
-                
-            # Find related objects
-            contact_id = item.get("contactId")
-            pipeline_id = item.get("pipelineId")
-            stage_id = item.get("pipelineStageId")
-            
-            contact = contact_lookup.get(contact_id)
-            pipeline = pipeline_lookup.get(pipeline_id)
-            stage = stage_lookup.get(stage_id)
-            
-            if not contact:
-                logger.warning(f"Contact {contact_id} not found for opportunity {opportunity_id}")
-                continue
-                
-            # Parse dates
-            created_timestamp = self._parse_date(item.get("createdAt")) or now()
-            
-            # Prepare opportunity data
-            opportunity_data_dict = {
-                'opportunity_id': opportunity_id,
-                'contact': contact,
-                'pipeline': pipeline,
-                'current_stage': stage,
-                'created_by_source': (item.get("source") or "ghl_api").strip()[:50],
-                'created_by_channel': "ghl_api",
-                'source_id': (item.get("source") or "").strip()[:255],
-                'created_timestamp': created_timestamp,
-                'value': self._safe_float(item.get("monetaryValue")),
-                'assigned': (item.get("assignedTo") or "").strip()[:150],
-                'tags': str(item.get("tags", [])),
-                'engagement_score': self._safe_int(item.get("engagementScore")),
-                'status': (item.get("status") or "").strip()[:50] if item.get("status") else None,
-                'description': (item.get("name") or "").strip(),
-                'address': (item.get("address") or "").strip(),
-            }
 
-            if opportunity_id in existing_opportunities:
-                # Update existing opportunity
-                existing_opportunity = existing_opportunities[opportunity_id]
-                for key, value in opportunity_data_dict.items():
-                    if key != 'opportunity_id':  # Don't update the ID
-                        setattr(existing_opportunity, key, value)
-                opportunities_to_update.append(existing_opportunity)
+            pk, stage_id = existing_opportunities.get(values['opportunity_id'], (None, None))
+            opportunity = Opportunity(id=pk, **values)
+            opportunity.localize(tz)
+            if pk:
+                opportunities_to_update.append(opportunity)
+                event = stage_event(pk, values, stage_id, item, OpportunityStageEvent.SOURCE_SYNC, now)
+                if event:
+                    stage_events.append(event)
             else:
-                # Create new opportunity
-                opportunities_to_create.append(Opportunity(**opportunity_data_dict))
+                opportunities_to_create.append(opportunity)
+                new_records.append((item, values))
 
         # Perform bulk operations
-        with transaction.atomic():
+        SYNC_BATCH_SIZE.observe(len(opportunities_to_create) + len(opportunities_to_update), model='opportunity')
+        if self.run:
+            self.run.count(created=len(opportunities_to_create), updated=len(opportunities_to_update),
+                           skipped=skipped)
+        with SYNC_BATCH_DURATION.time(model='opportunity'), transaction.atomic():
             if opportunities_to_create:
                 Opportunity.objects.bulk_create(opportunities_to_create, ignore_conflicts=True)
                 logger.info(f"Created {len(opportunities_to_create)} new opportunities.")
+
+                # ignore_conflicts leaves the primary keys unset
+                created = dict(
+                    Opportunity.objects.filter(
+                        opportunity_id__in=[values['opportunity_id'] for item, values in new_records]
+                    ).values_list('opportunity_id', 'id')
+                )
+                for item, values in new_records:
+                    pk = created.get(values['opportunity_id'])
+                    event = stage_event(pk, values, None, item, OpportunityStageEvent.SOURCE_SYNC, now) if pk else None
+                    if event:
+                        stage_events.append(event)
             
             if opportunities_to_update:
                 # Bulk update existing opportunities
@@ -397,10 +370,41 @@ class GHLSyncService:
                     opportunities_to_update,
                     ['contact', 'pipeline', 'current_stage', 'created_by_source', 
                      'created_by_channel', 'source_id', 'created_timestamp', 'value', 
-                     'assigned', 'tags', 'engagement_score', 'status', 'description', 'address']
+                     'assigned', 'tags', 'engagement_score', 'status', 'description', 'address',
+                     'created_local_date', 'created_local_month']
                 )
                 logger.info(f"Updated {len(opportunities_to_update)} existing opportunities.")
 
+            if stage_events:
+                OpportunityStageEvent.objects.bulk_create(stage_events)
+                logger.info(f"Recorded {len(stage_events)} opportunity stage changes.")
+
+            changed = [opportunity.id for opportunity in opportunities_to_update]
+            if opportunities_to_create:
+                changed += created.values()
+            transaction.on_commit(lambda: notify_opportunities_changed(changed))
+            transaction.on_commit(lambda: bump_data_version(self.location_id))
+
+    def _get(self, endpoint: str, params: Dict[str, Any]) -> requests.Response:
+        """
+        GET an API endpoint, refreshing the access token once on a 401.
+        """
+        started = time.perf_counter()
+        response = ghl_request(
+            "GET", endpoint, location_id=self.location_id,
+            access_token=self.access_token, params=params
+        )
+        if self.run:
+            self.run.api_call(time.perf_counter() - started)
+        if response.token_refreshed:
+            # Our token was rejected; let the token manager supply it from now on
+            self.access_token = None
+        return response
+
+    def _phase(self, name: str):
+        """Time a phase of the current sync run, if one is being recorded."""
+        return self.run.phase(name) if self.run else nullcontext()
+
     def _extract_timestamp(self, record: Dict[str, Any]) -> Optional[int]:
         """
         Extract timestamp from a record for pagination purposes.
@@ -428,53 +432,6 @@ class GHLSyncService:
         return None
 
 
-    def _parse_date(self, date_str: str) -> Optional[datetime]:
-        """
-        Parse date string and return datetime in 'Australia/Sydney' timezone.
-
-        Args:
-            date_str: Date string from API
-
-        Returns:
-            Parsed timezone-aware datetime or None
-        """
-        AUSTRALIA_SYDNEY_TZ = pytz.timezone("Australia/Sydney")
-
-        if not date_str:
-            return None
-
-        try:
-            parsed_date = parse_datetime(date_str)
-            if parsed_date:
-                if is_naive(parsed_date):
-                    parsed_date = make_aware(parsed_date)
-                # Convert to Australia/Sydney timezone
-                parsed_date = parsed_date.astimezone(AUSTRALIA_SYDNEY_TZ)
-                return parsed_date
-        except Exception:
-            pass
-
-        return None
-
-    def _safe_float(self, value: Any) -> Optional[float]:
-        """Safely convert value to float."""
-        if value is None or value == "":
-            return None
-        try:
-            return float(value)
-        except (ValueError, TypeError):
-            return None
-
-    def _safe_int(self, value: Any) -> int:
-        """Safely convert value to int."""
-        if value is None or value == "":
-            return 0
-        try:
-            return int(float(value))
-        except (ValueError, TypeError):
-            return 0
-
-
 # Convenience functions for easy usage
 def sync_ghl_contacts_and_opportunities(location_id: str, access_token: str = None):
     """
@@ -485,20 +442,18 @@ def sync_ghl_contacts_and_opportunities(location_id: str, access_token: str = No
         access_token (str): GHL API access token
     """
     if not access_token:
-        # Try to get from credentials model if not provided
+        # Try to get from the token manager if not provided
         try:
-            credentials = GHLAuthCredentials.objects.first()
-            if credentials:
-                access_token = credentials.access_token
-            else:
-                raise ValueError("No access token provided and no credentials found in database")
+            access_token = token_manager.get_access_token(location_id)
         except Exception as e:
             raise ValueError(f"Could not retrieve access token: {e}")
     
     print("location_id:", location_id)
     
     sync_service = GHLSyncService(location_id, access_token)
-    sync_service.sync_all_data()
+    with SyncRunRecorder(location_id, SyncRun.MODE_FULL) as run:
+        sync_service.run = run
+        sync_service.sync_all_data()
 
 
 def sync_ghl_contacts_only(location_id: str, access_token: str = None):
@@ -511,17 +466,17 @@ def sync_ghl_contacts_only(location_id: str, access_token: str = None):
     """
     if not access_token:
         try:
-            credentials = GHLAuthCredentials.objects.first()
-            if credentials:
-                access_token = credentials.access_token
-            else:
-                raise ValueError("No access token provided and no credentials found in database")
+            access_token = token_manager.get_access_token(location_id)
         except Exception as e:
             raise ValueError(f"Could not retrieve access token: {e}")
     
     sync_service = GHLSyncService(location_id, access_token)
-    contacts = sync_service.fetch_all_contacts()
-    sync_service.sync_contacts_to_db(contacts)
+    with SyncRunRecorder(location_id, SyncRun.MODE_CONTACTS) as run:
+        sync_service.run = run
+        with run.phase('fetch_contacts'):
+            contacts = sync_service.fetch_all_contacts()
+        with run.phase('sync_contacts'):
+            sync_service.sync_contacts_to_db(contacts)
 
 
 def sync_ghl_opportunities_only(location_id: str, access_token: str = None):
@@ -534,14 +489,14 @@ def sync_ghl_opportunities_only(location_id: str, access_token: str = None):
     """
     if not access_token:
         try:
-            credentials = GHLAuthCredentials.objects.first()
-            if credentials:
-                access_token = credentials.access_token
-            else:
-                raise ValueError("No access token provided and no credentials found in database")
+            access_token = token_manager.get_access_token(location_id)
         except Exception as e:
             raise ValueError(f"Could not retrieve access token: {e}")
     
     sync_service = GHLSyncService(location_id, access_token)
-    opportunities = sync_service.fetch_all_opportunities()
-    sync_service.sync_opportunities_to_db(opportunities)
\ No newline at end of file
+    with SyncRunRecorder(location_id, SyncRun.MODE_OPPORTUNITIES) as run:
+        sync_service.run = run
+        with run.phase('fetch_opportunities'):
+            opportunities = sync_service.fetch_all_opportunities()
+        with run.phase('sync_opportunities'):
+            sync_service.sync_opportunities_to_db(opportunities)
@@ -0,0 +1,324 @@
+"""
+Bulk import of GHL contact/opportunity exports (CSV or XLSX).
+
+Files are read in chunks (pandas chunked CSV, openpyxl read-only XLSX), and
+each chunk is normalized with vectorized pandas operations. Foreign keys are
+resolved with one query per chunk, and rows are written with bulk_create /
+bulk_update in one transaction per chunk. Rows that cannot be imported are
+reported with their line number instead of aborting the import.
+"""
+import os
+from dataclasses import dataclass, field
+from typing import Dict, Iterator, List, Tuple
+
+import pandas as pd
+from django.conf import settings
+from django.db import transaction
+from django.utils.timezone import now
+from openpyxl import load_workbook
+
+from data_management.data_version import bump_data_version
+from data_management.date_ranges import location_timezone
+from data_management.models import Contact, Opportunity, OpportunityStageEvent, Pipeline, PipelineStage
+from data_management.snapshot import notify_opportunities_changed
+from data_management.stage_events import stage_event
+
+
+DEFAULT_CHUNK_SIZE = 5000
+
+# Export column -> model field
+CONTACT_COLUMNS = {
+    'Contact Id': 'contact_id',
+    'First Name': 'first_name',
+    'Last Name': 'last_name',
+    'Email': 'email',
+    'Phone': 'phone',
+    'Address (full)': 'address',
+    'Country': 'country',
+    'Source': 'source',
+    'Created': 'date_added',
+}
+
+OPPORTUNITY_COLUMNS = {
+    'Opportunity ID': 'opportunity_id',
+    'Contact ID': 'contact_ref',
+    'Pipeline ID': 'pipeline_ref',
+    'Pipeline Stage ID': 'stage_ref',
+    'Created on': 'created_timestamp',
+    'source': 'source',
+    'Lead Value': 'value',
+    'assigned': 'assigned',
+    'tags': 'tags',
+    'Engagement Score': 'engagement_score',
+    'status': 'status',
+    'Job Description': 'description',
+    'Street Address': 'address',
+}
+
+CONTACT_UPDATE_FIELDS = [
+    'first_name', 'last_name', 'full_name_lowercase', 'email', 'phone', 'address',
+    'country', 'source', 'date_added', 'date_updated',
+]
+OPPORTUNITY_UPDATE_FIELDS = [
+    'contact', 'pipeline', 'current_stage', 'created_by_source', 'created_by_channel',
+    'source_id', 'created_timestamp', 'value', 'assigned', 'tags', 'engagement_score',
+    'status', 'description', 'address', 'created_local_date', 'created_local_month',
+]
+
+
+@dataclass
+class ImportResult:
+    rows: int = 0
+    created: int = 0
+    updated: int = 0
+    # (line number in the file, record id, message)
+    errors: List[Tuple[int, str, str]] = field(default_factory=list)
+
+
+def read_chunks(path: str, chunk_size: int = DEFAULT_CHUNK_SIZE) -> Iterator[pd.DataFrame]:
+    """
+    Yield the rows of a CSV or XLSX file as DataFrames of strings.
+
+    The index of each frame is the line number of the row in the file
+    (the header being line 1).
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if extension in ('.xlsx', '.xlsm'):
+        yield from _read_xlsx_chunks(path, chunk_size)
+        return
+
+    line = 2
+    for chunk in pd.read_csv(path, dtype=str, keep_default_na=False, chunksize=chunk_size):
+        chunk.index = pd.RangeIndex(line, line + len(chunk))
+        line += len(chunk)
+        yield chunk
+
+
+def _read_xlsx_chunks(path: str, chunk_size: int) -> Iterator[pd.DataFrame]:
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        header = [str(value).strip() if value is not None else '' for value in next(rows, ())]
+        line = 2
+        buffer = []
+        for row in rows:
+            buffer.append(row)
+            if len(buffer) == chunk_size:
+                yield _xlsx_frame(buffer, header, line)
+                line += len(buffer)
+                buffer = []
+        if buffer:
+            yield _xlsx_frame(buffer, header, line)
+    finally:
+        workbook.close()
+
+
+def _xlsx_frame(rows, header, line) -> pd.DataFrame:
+    frame = pd.DataFrame.from_records(rows, columns=header, index=pd.RangeIndex(line, line + len(rows)))
+    # Same representation as the CSV reader: strings, '' for empty cells
+    # (datetimes keep their ISO form so they parse like CSV dates)
+    return frame.apply(
+        lambda column: column.map(lambda value: '' if value is None else
+                                  value.isoformat() if hasattr(value, 'isoformat') else str(value))
+    )
+
+
+def _select(chunk: pd.DataFrame, columns: Dict[str, str]) -> pd.DataFrame:
+    """Rename export columns to field names, adding missing ones as ''."""
+    frame = chunk.reindex(columns=list(columns), fill_value='').rename(columns=columns)
+    return frame.apply(lambda column: column.astype(str).str.strip())
+
+
+def _parse_datetimes(column: pd.Series) -> pd.Series:
+    """Vectorized datetime parsing; naive values are in TIME_ZONE, invalid ones NaT."""
+    parsed = pd.to_datetime(column.replace('', None), errors='coerce', format='mixed')
+    if not isinstance(parsed.dtype, pd.DatetimeTZDtype):
+        if parsed.dtype == object:
+            # Mix of aware and naive values: normalize everything through UTC
+            parsed = pd.to_datetime(column.replace('', None), errors='coerce', format='mixed', utc=True)
+        else:
+            parsed = parsed.dt.tz_localize(settings.TIME_ZONE, ambiguous='NaT', nonexistent='shift_forward')
+    return parsed
+
+
+def _datetimes(column: pd.Series, default) -> List:
+    return [default if pd.isna(value) else value.to_pydatetime() for value in _parse_datetimes(column)]
+
+
+def _drop_duplicates(frame: pd.DataFrame, key: str, result: ImportResult) -> pd.DataFrame:
+    """Report and drop rows without an id or repeating an id (the last row wins)."""
+    missing = frame[key] == ''
+    for line in frame.index[missing]:
+        result.errors.append((int(line), '', f"missing {key}"))
+    frame = frame[~missing]
+
+    duplicated = frame.duplicated(key, keep='last')
+    for line, record_id in frame.loc[duplicated, key].items():
+        result.errors.append((int(line), record_id, "duplicate id in file, a later row was used"))
+    return frame[~duplicated]
+
+
+def _upsert(model, objects: List, fields: List[str]) -> None:
+    """
+    Update existing rows in bulk.
+
+    INSERT ... ON CONFLICT (id) DO UPDATE on the known primary keys is much
+    faster than bulk_update(), whose CASE WHEN per field grows with the batch.
+    """
+    model.objects.bulk_create(objects, batch_size=1000, update_conflicts=True,
+                              unique_fields=['id'], update_fields=fields)
+
+
+def _stage_values(opportunity: Opportunity) -> Dict[str, int]:
+    return {'pipeline_id': opportunity.pipeline_id, 'current_stage_id': opportunity.current_stage_id}
+
+
+def import_contacts(chunk: pd.DataFrame, result: ImportResult, dry_run: bool = False) -> None:
+    """Normalize one chunk of a contact export and upsert it."""
+    result.rows += len(chunk)
+    frame = _drop_duplicates(_select(chunk, CONTACT_COLUMNS), 'contact_id', result)
+    if frame.empty:
+        return
+
+    timestamp = now()
+    frame['first_name'] = frame['first_name'].str.slice(0, 100)
+    frame['last_name'] = frame['last_name'].str.slice(0, 100)
+    frame['full_name_lowercase'] = (frame['first_name'] + ' ' + frame['last_name']).str.lower().str.strip()
+    # Phone numbers read as floats by spreadsheets end in ".0"
+    frame['phone'] = frame['phone'].str.replace(r'\.0$', '', regex=True).str.slice(0, 20)
+    frame['address'] = frame['address'].str.slice(0, 255)
+    frame['country'] = frame['country'].str.slice(0, 10)
+    frame['source'] = frame['source'].str.slice(0, 100)
+    date_added = _datetimes(frame['date_added'], timestamp)
+
+    existing = dict(
+        Contact.objects.filter(contact_id__in=frame['contact_id'].tolist()).values_list('contact_id', 'id')
+    )
+
+    to_create, to_update = [], []
+    for record, added in zip(frame.itertuples(index=False), date_added):
+        contact = Contact(
+            id=existing.get(record.contact_id),
+            contact_id=record.contact_id,
+            first_name=record.first_name,
+            last_name=record.last_name,
+            full_name_lowercase=record.full_name_lowercase,
+            email=record.email or None,
+            phone=record.phone,
+            address=record.address,
+            country=record.country,
+            tags=[],
+            source=record.source,
+            date_added=added,
+            date_updated=timestamp,
+        )
+        (to_update if contact.id else to_create).append(contact)
+
+    if not dry_run:
+        with transaction.atomic():
+            Contact.objects.bulk_create(to_create, batch_size=1000)
+            _upsert(Contact, to_update, CONTACT_UPDATE_FIELDS)
+            transaction.on_commit(bump_data_version)
+    result.created += len(to_create)
+    result.updated += len(to_update)
+
+
+class OpportunityImporter:
+    """
+    Upserts chunks of an opportunity export.
+
+    Pipelines and stages are small and loaded once; contacts are resolved
+    with one query per chunk.
+    """
+
+    def __init__(self):
+        self.pipelines = dict(Pipeline.objects.exclude(pipeline_id=None).values_list('pipeline_id', 'id'))
+        self.stages = dict(PipelineStage.objects.exclude(pipeline_stage_id=None)
+                           .values_list('pipeline_stage_id', 'id'))
+
+    def __call__(self, chunk: pd.DataFrame, result: ImportResult, dry_run: bool = False) -> None:
+        result.rows += len(chunk)
+        frame = _drop_duplicates(_select(chunk, OPPORTUNITY_COLUMNS), 'opportunity_id', result)
+        if frame.empty:
+            return
+
+        contacts = dict(
+            Contact.objects.filter(contact_id__in=frame['contact_ref'].unique().tolist())
+            .values_list('contact_id', 'id')
+        )
+        frame['contact_pk'] = frame['contact_ref'].map(contacts)
+        unresolved = frame['contact_pk'].isna()
+        for line, record in frame.loc[unresolved, ['opportunity_id', 'contact_ref']].iterrows():
+            result.errors.append((int(line), record['opportunity_id'], f"unknown contact {record['contact_ref']!r}"))
+        frame = frame[~unresolved]
+        if frame.empty:
+            return
+
+        frame['pipeline_pk'] = frame['pipeline_ref'].map(self.pipelines)
+        frame['stage_pk'] = frame['stage_ref'].map(self.stages)
+        values = pd.to_numeric(frame['value'], errors='coerce')
+        frame['value'] = values.astype(object).where(values.notna(), None)
+        scores = pd.to_numeric(frame['engagement_score'], errors='coerce')
+        frame['engagement_score'] = scores.fillna(0).astype(int)
+        frame['source'] = frame['source'].str.slice(0, 50)
+        frame['assigned'] = frame['assigned'].str.slice(0, 150)
+        timestamp = now()
+        created = _datetimes(frame['created_timestamp'], timestamp)
+
+        # Primary key and stage of existing opportunities
+        existing = {
+            opportunity_id: (pk, stage_id)
+            for opportunity_id, pk, stage_id in Opportunity.objects.filter(
+                opportunity_id__in=frame['opportunity_id'].tolist()
+            ).values_list('opportunity_id', 'id', 'current_stage_id')
+        }
+
+        tz = location_timezone()
+        to_create, to_update, stage_events = [], [], []
+        for record, created_timestamp in zip(frame.itertuples(index=False), created):
+            pk, stage_id = existing.get(record.opportunity_id, (None, None))
+            opportunity = Opportunity(
+                id=pk,
+                opportunity_id=record.opportunity_id,
+                contact_id=int(record.contact_pk),
+                pipeline_id=None if pd.isna(record.pipeline_pk) else int(record.pipeline_pk),
+                current_stage_id=None if pd.isna(record.stage_pk) else int(record.stage_pk),
+                created_by_source=record.source,
+                created_by_channel='xlsx_import',
+                source_id=record.source,
+                created_timestamp=created_timestamp,
+                value=record.value,
+                assigned=record.assigned,
+                tags=record.tags,
+                engagement_score=record.engagement_score,
+                status=record.status or None,
+                description=record.description,
+                address=record.address,
+            )
+            opportunity.localize(tz)
+            if pk:
+                to_update.append(opportunity)
+                # Exports carry no stage change time
+                event = stage_event(pk, _stage_values(opportunity), stage_id, {},
+                                    OpportunityStageEvent.SOURCE_IMPORT, timestamp)
+                if event:
+                    stage_events.append(event)
+            else:
+                to_create.append(opportunity)
+
+        if not dry_run:
+            with transaction.atomic():
+                Opportunity.objects.bulk_create(to_create, batch_size=1000)
+                _upsert(Opportunity, to_update, OPPORTUNITY_UPDATE_FIELDS)
+                # New opportunities entered their stage when they were created
+                stage_events += [
+                    event for opportunity in to_create
+                    if (event := stage_event(opportunity.pk, _stage_values(opportunity), None, {},
+                                             OpportunityStageEvent.SOURCE_IMPORT, opportunity.created_timestamp))
+                ]
+                OpportunityStageEvent.objects.bulk_create(stage_events, batch_size=1000)
+                changed = [opportunity.pk for opportunity in to_create + to_update]
+                transaction.on_commit(lambda: notify_opportunities_changed(changed))
+                transaction.on_commit(bump_data_version)
+        result.created += len(to_create)
+        result.updated += len(to_update)
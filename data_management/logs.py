@@ -0,0 +1,380 @@
+"""
+Helpers for reading the sync/Django log files without loading them whole.
+
+`tail()` seeks backwards from the end of the file in blocks, so showing the
+last N lines costs O(N) regardless of file size, and continues into the
+rotated segments (`.1`, `.2`, ...) when the current file is too short.
+`follow()` yields new lines as they are appended, surviving rotation.
+
+`IndexedRotatingFileHandler` additionally writes a sidecar `<file>.idx` with
+one fixed-size entry (timestamp, byte offset, level, logger hash) per record,
+which `search()` memory-maps to filter by time/level/logger without scanning
+the log files themselves.
+"""
+import os
+import time
+import zlib
+from datetime import datetime
+from logging.handlers import RotatingFileHandler
+from typing import Any, Dict, Iterator, List, Optional
+
+import numpy as np
+
+
+# Rotating handler segments are `<name>`, `<name>.1`, ... `<name>.<backupCount>`
+MAX_SEGMENTS = 10
+
+LEVELS = {
+    'DEBUG': 10,
+    'INFO': 20,
+    'WARNING': 30,
+    'ERROR': 40,
+    'CRITICAL': 50,
+}
+
+
+def log_segments(path: str) -> List[str]:
+    """Return the existing segments of a log file, newest first."""
+    segments = [path] if os.path.exists(path) else []
+    for index in range(1, MAX_SEGMENTS + 1):
+        rotated = f"{path}.{index}"
+        if not os.path.exists(rotated):
+            break
+        segments.append(rotated)
+    return segments
+
+
+def line_level(line: str) -> Optional[int]:
+    """
+    Return the numeric level of a record's first line, or None for
+    continuation lines (tracebacks, multi-line messages).
+
+    Both the `verbose` and `simple` formatters start with the level name.
+    """
+    name = line.split(' ', 1)[0]
+    return LEVELS.get(name)
+
+
+def iter_lines_reversed(path: str, block_size: int = 64 * 1024) -> Iterator[str]:
+    """Yield the lines of a file from last to first, reading backwards in blocks."""
+    with open(path, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        position = f.tell()
+        remainder = b''
+
+        while position > 0:
+            read_size = min(block_size, position)
+            position -= read_size
+            f.seek(position)
+            block = f.read(read_size) + remainder
+            lines = block.split(b'\n')
+            # The first piece may be a partial line; keep it for the next block
+            remainder = lines.pop(0)
+            for line in reversed(lines):
+                yield line.decode('utf-8', errors='replace')
+
+        yield remainder.decode('utf-8', errors='replace')
+
+
+def _matches(record: List[str], min_level: Optional[int], contains: Optional[str]) -> bool:
+    if min_level is not None:
+        level = line_level(record[0])
+        if level is None or level < min_level:
+            return False
+    if contains and not any(contains in line for line in record):
+        return False
+    return True
+
+
+def tail(path: str, lines: int = 100, level: Optional[str] = None,
+         contains: Optional[str] = None, include_rotated: bool = True) -> List[str]:
+    """
+    Return the last `lines` lines of a log, optionally filtered.
+
+    Args:
+        path: Path of the current log file
+        lines: Number of lines to return
+        level: Minimum level name (e.g. "WARNING")
+        contains: Only keep records containing this substring
+        include_rotated: Continue into rotated segments if needed
+
+    Returns:
+        Matching lines in chronological order. Filters are applied per
+        record, so a traceback is kept or dropped with its header line.
+    """
+    min_level = LEVELS.get(level.upper()) if level else None
+    filtered = min_level is not None or bool(contains)
+    segments = log_segments(path) if include_rotated else [path]
+
+    collected: List[str] = []
+    for segment in segments:
+        pending: List[str] = []
+        first = True
+        for line in iter_lines_reversed(segment):
+            if first:
+                first = False
+                # Trailing newline at EOF produces an empty last piece
+                if line == '':
+                    continue
+
+            if not filtered:
+                collected.append(line)
+            else:
+                pending.append(line)
+                if line_level(line) is None:
+                    continue
+                record = pending[::-1]
+                pending = []
+                if _matches(record, min_level, contains):
+                    collected.extend(reversed(record))
+
+            if len(collected) >= lines:
+                return collected[:lines][::-1]
+
+    return collected[::-1]
+
+
+def follow(path: str, level: Optional[str] = None, contains: Optional[str] = None,
+           poll_interval: float = 1.0, keepalive: float = 15.0,
+           max_duration: float = 300.0) -> Iterator[Optional[str]]:
+    """
+    Yield lines appended to a log file, like `tail -F`.
+
+    Yields None when nothing was written for `keepalive` seconds so callers
+    can send heartbeats. Stops after `max_duration` seconds; SSE clients
+    reconnect automatically.
+    """
+    min_level = LEVELS.get(level.upper()) if level else None
+    started = last_output = time.monotonic()
+    keep_record = True
+    buffer = b''
+
+    f = open(path, 'rb')
+    try:
+        f.seek(0, os.SEEK_END)
+        while time.monotonic() - started < max_duration:
+            data = f.read()
+            if data:
+                buffer += data
+                *complete, buffer = buffer.split(b'\n')
+                for raw in complete:
+                    line = raw.decode('utf-8', errors='replace')
+                    if line_level(line) is not None:
+                        keep_record = _matches([line], min_level, None)
+                    if keep_record and (not contains or contains in line):
+                        last_output = time.monotonic()
+                        yield line
+                continue
+
+            # Reopen when the file has been rotated or truncated
+            try:
+                stat = os.stat(path)
+                if stat.st_ino != os.fstat(f.fileno()).st_ino or stat.st_size < f.tell():
+                    f.close()
+                    f = open(path, 'rb')
+                    buffer = b''
+                    continue
+            except FileNotFoundError:
+                pass
+
+            if time.monotonic() - last_output >= keepalive:
+                last_output = time.monotonic()
+                yield None
+            time.sleep(poll_interval)
+    finally:
+        f.close()
+
+
+# --- Sidecar index -----------------------------------------------------------
+
+INDEX_SUFFIX = '.idx'
+
+# One entry per log record, appended by IndexedRotatingFileHandler
+INDEX_DTYPE = np.dtype([
+    ('timestamp', '<f8'),   # record.created (epoch seconds)
+    ('offset', '<u8'),      # byte offset of the record in the log file
+    ('level', '<u2'),       # record.levelno
+    ('logger', '<u4'),      # crc32 of the logger name, 0 if unknown
+])
+
+
+def logger_hash(name: str) -> int:
+    return zlib.crc32(name.encode())
+
+
+class IndexedRotatingFileHandler(RotatingFileHandler):
+    """
+    RotatingFileHandler that maintains a sidecar index for `search()`.
+
+    Index entries are appended with a single unbuffered write to a file
+    opened in append mode, so concurrent processes logging to the same file
+    do not corrupt each other's entries. Index files are rotated together
+    with their log segments.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.index_stream = None
+
+    def emit(self, record):
+        try:
+            if self.shouldRollover(record):
+                self.doRollover()
+            if self.stream is None:
+                self.stream = self._open()
+
+            msg = self.format(record) + self.terminator
+            self.stream.write(msg)
+            self.stream.flush()
+
+            # In append mode the fd position is the end of what we just wrote,
+            # even when other processes append to the same file.
+            end = os.lseek(self.stream.fileno(), 0, os.SEEK_CUR)
+            size = len(msg.encode(self.stream.encoding or 'utf-8', errors='replace'))
+            self._write_index(record, end - size)
+        except Exception:
+            self.handleError(record)
+
+    def _write_index(self, record, offset):
+        if self.index_stream is None:
+            self.index_stream = open(self.baseFilename + INDEX_SUFFIX, 'ab', buffering=0)
+        entry = np.array(
+            [(record.created, offset, record.levelno, logger_hash(record.name))],
+            dtype=INDEX_DTYPE
+        )
+        self.index_stream.write(entry.tobytes())
+
+    def _close_index(self):
+        if self.index_stream is not None:
+            self.index_stream.close()
+            self.index_stream = None
+
+    def doRollover(self):
+        self._close_index()
+        if self.backupCount > 0:
+            for i in range(self.backupCount - 1, 0, -1):
+                sfn = f"{self.baseFilename}.{i}{INDEX_SUFFIX}"
+                dfn = f"{self.baseFilename}.{i + 1}{INDEX_SUFFIX}"
+                if os.path.exists(sfn):
+                    os.replace(sfn, dfn)
+            sfn = self.baseFilename + INDEX_SUFFIX
+            if os.path.exists(sfn):
+                os.replace(sfn, f"{self.baseFilename}.1{INDEX_SUFFIX}")
+        super().doRollover()
+
+    def close(self):
+        self.acquire()
+        try:
+            self._close_index()
+        finally:
+            self.release()
+        super().close()
+
+
+def build_index(path: str) -> None:
+    """
+    Build the sidecar index for a log segment written without one, by
+    scanning it once. Logger names are not recoverable from the file, so
+    their hash is stored as 0.
+    """
+    entries = []
+    offset = 0
+    with open(path, 'rb') as f:
+        for raw in f:
+            line = raw.decode('utf-8', errors='replace')
+            level = line_level(line)
+            if level is not None:
+                # "<LEVEL> <YYYY-MM-DD HH:MM:SS,mmm> ..."
+                parts = line.split(' ', 3)
+                try:
+                    created = datetime.strptime(f"{parts[1]} {parts[2]}", '%Y-%m-%d %H:%M:%S,%f').timestamp()
+                except (IndexError, ValueError):
+                    created = entries[-1][0] if entries else 0.0
+                entries.append((created, offset, level, 0))
+            offset += len(raw)
+
+    tmp_path = f"{path}{INDEX_SUFFIX}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(np.array(entries, dtype=INDEX_DTYPE).tobytes())
+    os.replace(tmp_path, path + INDEX_SUFFIX)
+
+
+def load_index(path: str) -> np.ndarray:
+    """Memory-map the sidecar index of a log segment, building it if missing."""
+    index_path = path + INDEX_SUFFIX
+    if not os.path.exists(index_path):
+        build_index(path)
+
+    # Ignore a partially written trailing entry
+    count = os.path.getsize(index_path) // INDEX_DTYPE.itemsize
+    if count == 0:
+        return np.empty(0, dtype=INDEX_DTYPE)
+    return np.memmap(index_path, dtype=INDEX_DTYPE, mode='r', shape=(count,))
+
+
+def search(path: str, start: Optional[float] = None, end: Optional[float] = None,
+           level: Optional[str] = None, logger: Optional[str] = None,
+           contains: Optional[str] = None, limit: int = 200) -> List[Dict[str, Any]]:
+    """
+    Search a log file and its rotated segments through their sidecar indexes.
+
+    Time, level and logger filters are evaluated on the memory-mapped index
+    with vectorized comparisons; only matching records are read from the log
+    files, and only to apply the `contains` filter and return their text.
+
+    Args:
+        path: Path of the current log file
+        start, end: Epoch seconds bounds (inclusive start, exclusive end)
+        level: Minimum level name
+        logger: Exact logger name
+        contains: Substring the record must contain
+        limit: Maximum number of records to return
+
+    Returns:
+        Matching records, newest first, as dicts with `file`, `timestamp`,
+        `level` and `message`.
+    """
+    min_level = LEVELS.get(level.upper()) if level else None
+    level_names = {value: name for name, value in LEVELS.items()}
+    results: List[Dict[str, Any]] = []
+
+    for segment in log_segments(path):
+        index = load_index(segment)
+        if not len(index):
+            continue
+
+        # Records end where the next one (by offset) starts
+        index = index[np.argsort(index['offset'], kind='stable')]
+        offsets = index['offset']
+        ends = np.append(offsets[1:], np.uint64(os.path.getsize(segment)))
+
+        mask = np.ones(len(index), dtype=bool)
+        if start is not None:
+            mask &= index['timestamp'] >= start
+        if end is not None:
+            mask &= index['timestamp'] < end
+        if min_level is not None:
+            mask &= index['level'] >= min_level
+        if logger:
+            mask &= index['logger'] == logger_hash(logger)
+
+        candidates = np.flatnonzero(mask)[::-1]
+        if not len(candidates):
+            continue
+
+        with open(segment, 'rb') as f:
+            for i in candidates:
+                f.seek(int(offsets[i]))
+                text = f.read(int(ends[i] - offsets[i])).decode('utf-8', errors='replace').rstrip('\n')
+                if contains and contains not in text:
+                    continue
+                results.append({
+                    'file': os.path.basename(segment),
+                    'timestamp': datetime.fromtimestamp(float(index['timestamp'][i])).astimezone().isoformat(),
+                    'level': level_names.get(int(index['level'][i]), str(int(index['level'][i]))),
+                    'message': text,
+                })
+                if len(results) >= limit:
+                    return results
+
+    return results
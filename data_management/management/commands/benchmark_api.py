@@ -0,0 +1,121 @@
+import json
+import time
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client
+from django.urls import reverse
+from django.utils.timezone import now
+
+from data_management.bench.stats import QueryStats, percentiles, rows_scanned
+from data_management.models import Contact, Opportunity
+
+
+ENDPOINTS = {
+    'dashboard': 'dashboard-api',
+    'revenue-metrics': 'revenue-metrics',
+    'opportunities': 'opportunity-list',
+}
+
+
+def date_ranges(today: date):
+    """Date-range shapes to benchmark, as query parameters."""
+    def span(start, end=today):
+        return {'start_date': start.isoformat(), 'end_date': end.isoformat()}
+
+    quarter_start = date(today.year, ((today.month - 1) // 3) * 3 + 1, 1)
+    return {
+        'default': {},
+        'last_7_days': span(today - timedelta(days=7)),
+        'last_30_days': span(today - timedelta(days=30)),
+        'month_to_date': span(today.replace(day=1)),
+        'quarter_to_date': span(quarter_start),
+        'last_365_days': span(today - timedelta(days=365)),
+        'all_time': span(date(2000, 1, 1)),
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        "Time the dashboard, revenue metrics and opportunity list endpoints across "
+        "date-range shapes; report latency percentiles, query count and rows scanned."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--runs', type=int, default=20, help="Timed requests per case")
+        parser.add_argument('--warmup', type=int, default=2)
+        parser.add_argument('--endpoint', action='append', choices=list(ENDPOINTS),
+                            help="Endpoint to benchmark (repeatable, default all)")
+        parser.add_argument('--range', dest='ranges', action='append',
+                            help="Date-range shape to benchmark (repeatable, default all)")
+        parser.add_argument('--output', '-o', help="Write the results as JSON to this file")
+
+    def handle(self, *args, **options):
+        shapes = date_ranges(now().date())
+        selected_ranges = options['ranges'] or list(shapes)
+        unknown = set(selected_ranges) - set(shapes)
+        if unknown:
+            raise CommandError(f"Unknown range(s) {', '.join(sorted(unknown))}; choose from {', '.join(shapes)}")
+
+        client = Client(SERVER_NAME='localhost')
+        results = []
+
+        for endpoint in options['endpoint'] or list(ENDPOINTS):
+            url = reverse(ENDPOINTS[endpoint])
+            for shape in selected_ranges:
+                params = shapes[shape]
+
+                for _ in range(options['warmup']):
+                    client.get(url, params)
+
+                # One instrumented request for query count and rows scanned;
+                # pg_stat_xact_* counters are per transaction.
+                stats = QueryStats()
+                with transaction.atomic():
+                    scanned_before = rows_scanned()
+                    with connection.execute_wrapper(stats):
+                        response = client.get(url, params)
+                    scanned_after = rows_scanned()
+
+                latencies = []
+                for _ in range(options['runs']):
+                    started = time.perf_counter()
+                    client.get(url, params)
+                    latencies.append((time.perf_counter() - started) * 1000)
+
+                results.append({
+                    'endpoint': endpoint,
+                    'range': shape,
+                    'status': response.status_code,
+                    'queries': stats.count,
+                    'db_ms': round(stats.duration * 1000, 2),
+                    'rows_scanned': (scanned_after - scanned_before) if scanned_before is not None else None,
+                    'response_bytes': len(response.content),
+                    'latency_ms': {key: round(value, 2) for key, value in percentiles(latencies).items()},
+                })
+
+        self.stdout.write(f"{'endpoint':<17}{'range':<17}{'status':>7}{'queries':>8}"
+                          f"{'rows':>11}{'p50 ms':>10}{'p95 ms':>10}{'max ms':>10}")
+        for row in results:
+            latency = row['latency_ms']
+            self.stdout.write(
+                f"{row['endpoint']:<17}{row['range']:<17}{row['status']:>7}{row['queries']:>8}"
+                f"{row['rows_scanned'] if row['rows_scanned'] is not None else '-':>11}"
+                f"{latency.get('p50', 0):>10.1f}{latency.get('p95', 0):>10.1f}{latency.get('max', 0):>10.1f}"
+            )
+
+        if options['output']:
+            payload = {
+                'meta': {
+                    'timestamp': now().isoformat(),
+                    'database': connection.vendor,
+                    'opportunities': Opportunity.objects.count(),
+                    'contacts': Contact.objects.count(),
+                    'runs': options['runs'],
+                },
+                'results': results,
+            }
+            with open(options['output'], 'w') as f:
+                json.dump(payload, f, indent=2)
+            self.stderr.write(self.style.SUCCESS(f"Wrote results to {options['output']}"))
@@ -0,0 +1,87 @@
+import json
+import time
+
+import pytz
+from django.core.management.base import BaseCommand
+from django.utils.dateparse import parse_datetime as django_parse_datetime
+from django.utils.timezone import is_naive, make_aware, now
+
+from data_management.bench.fake_ghl import PIPELINE_ID, STAGE_IDS, contact_record, opportunity_record
+from data_management.mapping import CONTACT_MAPPING, OPPORTUNITY_MAPPING, parse_datetime
+
+
+def reference_parse_date(date_str):
+    """The per-call parser the sync used before data_management.mapping."""
+    if not date_str:
+        return None
+    parsed = django_parse_datetime(date_str)
+    if parsed and is_naive(parsed):
+        parsed = make_aware(parsed)
+    return parsed.astimezone(pytz.timezone("Australia/Sydney")) if parsed else None
+
+
+def reference_contact(item):
+    """The inline contact mapping the sync used before data_management.mapping."""
+    values = {
+        'contact_id': item.get("id"),
+        'first_name': (item.get("firstName") or "").strip()[:100],
+        'last_name': (item.get("lastName") or "").strip()[:100],
+        'phone': (item.get("phone") or "").strip()[:20],
+        'email': (item.get("email") or "").strip() or None,
+        'address': (item.get("address") or "").strip()[:255],
+        'country': (item.get("country") or "").strip()[:10],
+        'date_added': reference_parse_date(item.get("createdAt")) or now(),
+        'date_updated': now(),
+        'tags': item.get("tags", []),
+        'source': (item.get("source") or "ghl_api").strip()[:100],
+    }
+    values['full_name_lowercase'] = f"{values['first_name']} {values['last_name']}".lower().strip()
+    return values
+
+
+class Command(BaseCommand):
+    help = "Micro-benchmark the GHL record mapping (microseconds per record, best of --repeat)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--records', type=int, default=20000)
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--output', '-o', help="Write the results as JSON to this file")
+
+    def handle(self, *args, **options):
+        count = options['records']
+        contacts = [contact_record(i) for i in range(count)]
+        opportunities = [opportunity_record(i, count) for i in range(count)]
+        dates = [record['createdAt'] for record in contacts]
+        # Synthetic lookups so no database access is measured
+        lookups = {
+            'contact': {record['id']: i for i, record in enumerate(contacts)},
+            'pipeline': {PIPELINE_ID: 1},
+            'stage': {stage_id: i for i, stage_id in enumerate(STAGE_IDS)},
+        }
+
+        cases = [
+            ('parse_date (reference)', lambda: [reference_parse_date(value) for value in dates]),
+            ('parse_datetime', lambda: [parse_datetime(value) for value in dates]),
+            ('contact (reference)', lambda: [reference_contact(record) for record in contacts]),
+            ('contact one()', lambda: [CONTACT_MAPPING.one(record) for record in contacts]),
+            ('contact many()', lambda: CONTACT_MAPPING.many(contacts)),
+            ('opportunity one()', lambda: [OPPORTUNITY_MAPPING.one(record, lookups) for record in opportunities]),
+            ('opportunity many()', lambda: OPPORTUNITY_MAPPING.many(opportunities, lookups)),
+        ]
+
+        results = []
+        for name, run in cases:
+            timings = []
+            for _ in range(options['repeat']):
+                started = time.perf_counter()
+                run()
+                timings.append(time.perf_counter() - started)
+            results.append({'case': name, 'us_per_record': round(min(timings) / count * 1e6, 3)})
+
+        self.stdout.write(f"{'case':<26}{'us/record':>12}")
+        for result in results:
+            self.stdout.write(f"{result['case']:<26}{result['us_per_record']:>12.3f}")
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump({'records': count, 'results': results}, f, indent=2)
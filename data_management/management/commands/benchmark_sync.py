@@ -0,0 +1,114 @@
+import json
+import time
+from contextlib import contextmanager
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test import override_settings
+
+from data_management.bench.fake_ghl import FakeGHLServer
+from data_management.bench.stats import QueryStats, peak_rss_mb
+from data_management.helpers import GHLSyncService
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark GHLSyncService against a local fake GHL API and report "
+        "throughput, peak RSS, query count and DB time per phase."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--contacts', type=int, default=5000)
+        parser.add_argument('--opportunities', type=int, default=5000)
+        parser.add_argument('--latency-ms', type=float, default=0, help="Per request latency of the fake API")
+        parser.add_argument('--error-rate', type=float, default=0, help="Fraction of requests answered with 500")
+        parser.add_argument('--rate-limit', type=int, default=0, help="Requests per second before answering 429")
+        parser.add_argument('--page-delay', type=float, default=0, help="Override GHLSyncService.page_delay")
+        parser.add_argument('--columnar', action='store_true', help="Map records column by column with pandas")
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', '-o', help="Write the results as JSON to this file")
+        parser.add_argument('--keep', action='store_true', help="Keep the synced rows instead of rolling back")
+
+    def handle(self, *args, **options):
+        server = FakeGHLServer(
+            contacts=options['contacts'],
+            opportunities=options['opportunities'],
+            latency=options['latency_ms'] / 1000,
+            error_rate=options['error_rate'],
+            rate_limit=options['rate_limit'],
+            seed=options['seed'],
+        )
+
+        service = GHLSyncService('bench-location', access_token='bench', columnar=options['columnar'])
+        service.base_url = server.url
+        service.page_delay = options['page_delay']
+
+        phases = []
+
+        @contextmanager
+        def phase(name, records):
+            stats = QueryStats()
+            started = time.perf_counter()
+            with connection.execute_wrapper(stats):
+                yield
+            elapsed = time.perf_counter() - started
+            count = records()
+            phases.append({
+                'phase': name,
+                'records': count,
+                'seconds': round(elapsed, 3),
+                'records_per_sec': round(count / elapsed, 1) if elapsed else None,
+                'queries': stats.count,
+                'db_seconds': round(stats.duration, 3),
+                'peak_rss_mb': round(peak_rss_mb(), 1),
+            })
+
+        # Token refreshes after a 401 go to the fake server too
+        with server, override_settings(GHL_API_BASE_URL=server.url, GHL_TOKEN_URL=f"{server.url}/oauth/token"):
+            try:
+                with transaction.atomic():
+                    data = {}
+                    with phase('fetch_contacts', lambda: len(data['contacts'])):
+                        data['contacts'] = service.fetch_all_contacts()
+                    with phase('sync_contacts', lambda: len(data['contacts'])):
+                        service.sync_contacts_to_db(data['contacts'])
+                    del data['contacts']
+
+                    with phase('fetch_opportunities', lambda: len(data['opportunities'])):
+                        data['opportunities'] = service.fetch_all_opportunities()
+                    with phase('sync_opportunities', lambda: len(data['opportunities'])):
+                        service.sync_opportunities_to_db(data['opportunities'])
+
+                    if not options['keep']:
+                        raise Rollback
+            except Rollback:
+                pass
+
+        result = {
+            'options': {key: options[key] for key in (
+                'contacts', 'opportunities', 'latency_ms', 'error_rate', 'rate_limit', 'page_delay', 'columnar', 'seed'
+            )},
+            'server': server.stats,
+            'phases': phases,
+        }
+
+        self.stdout.write(f"{'phase':<22}{'records':>9}{'seconds':>10}{'rec/s':>11}"
+                          f"{'queries':>9}{'db s':>9}{'rss MB':>9}")
+        for row in phases:
+            self.stdout.write(
+                f"{row['phase']:<22}{row['records']:>9}{row['seconds']:>10.3f}"
+                f"{row['records_per_sec'] or 0:>11.1f}{row['queries']:>9}"
+                f"{row['db_seconds']:>9.3f}{row['peak_rss_mb']:>9.1f}"
+            )
+        self.stdout.write(f"API requests: {server.stats['requests']} "
+                          f"(500s: {server.stats['errors']}, 429s: {server.stats['rate_limited']}, "
+                          f"token refreshes: {server.stats['token_refreshes']})")
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(result, f, indent=2)
+            self.stderr.write(self.style.SUCCESS(f"Wrote results to {options['output']}"))
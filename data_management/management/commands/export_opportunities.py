@@ -0,0 +1,58 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.exceptions import ValidationError
+
+from data_management.exports import (
+    CONTENT_TYPES, EXPORT_CHUNK_SIZE, export_rows, iter_csv, iter_ndjson, write_xlsx,
+)
+from data_management.filters import filter_opportunities
+from data_management.models import Opportunity
+
+
+class Command(BaseCommand):
+    help = "Export opportunities to CSV, NDJSON or XLSX using the opportunity list filters."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', dest='export_format', choices=list(CONTENT_TYPES), default='csv')
+        parser.add_argument('--output', '-o', help="Output file (defaults to stdout for csv/ndjson)")
+        parser.add_argument('--start-date', help="YYYY-MM-DD")
+        parser.add_argument('--end-date', help="YYYY-MM-DD")
+        parser.add_argument('--source', help="Source bucket (see SOURCE_MAP) or raw contact source")
+        parser.add_argument('--pipeline-name', help="Current stage name")
+        parser.add_argument('--chunk-size', type=int, default=EXPORT_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        export_format = options['export_format']
+        output = options['output']
+
+        if export_format == 'xlsx' and not output:
+            raise CommandError("--output is required for xlsx exports")
+
+        params = {
+            'start_date': options['start_date'],
+            'end_date': options['end_date'],
+            'source': options['source'],
+            'pipeline_name': options['pipeline_name'],
+        }
+        try:
+            queryset = filter_opportunities(Opportunity.objects.all(), params)
+        except ValidationError as e:
+            raise CommandError(str(e.detail))
+
+        rows = export_rows(queryset, chunk_size=options['chunk_size'])
+
+        if export_format == 'xlsx':
+            write_xlsx(rows, output)
+        else:
+            stream = iter_csv(rows) if export_format == 'csv' else iter_ndjson(rows)
+            out = open(output, 'wb') if output else sys.stdout.buffer
+            try:
+                for chunk in stream:
+                    out.write(chunk)
+            finally:
+                if output:
+                    out.close()
+
+        if output:
+            self.stderr.write(self.style.SUCCESS(f"Exported opportunities to {output}"))
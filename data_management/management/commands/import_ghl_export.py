@@ -0,0 +1,50 @@
+import csv
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from data_management.imports import DEFAULT_CHUNK_SIZE, ImportResult, OpportunityImporter, import_contacts, read_chunks
+
+
+class Command(BaseCommand):
+    help = ("Import a GHL contacts or opportunities export (CSV or XLSX) in chunks. "
+            "Import contacts before the opportunities referencing them.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=['contacts', 'opportunities'])
+        parser.add_argument('path')
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+        parser.add_argument('--errors', help="CSV file for rows that could not be imported "
+                                             "(default: <path>.errors.csv)")
+        parser.add_argument('--dry-run', action='store_true', help="Parse and validate without writing")
+
+    def handle(self, *args, **options):
+        path = options['path']
+        if not os.path.exists(path):
+            raise CommandError(f"{path} does not exist")
+        if options['chunk_size'] < 1:
+            raise CommandError("--chunk-size must be >= 1")
+
+        import_chunk = import_contacts if options['kind'] == 'contacts' else OpportunityImporter()
+        result = ImportResult()
+        started = time.perf_counter()
+
+        for chunk in read_chunks(path, options['chunk_size']):
+            import_chunk(chunk, result, dry_run=options['dry_run'])
+            self.stderr.write(f"{result.rows} rows, {time.perf_counter() - started:.1f}s")
+
+        errors_path = options['errors'] or f"{os.path.splitext(path)[0]}.errors.csv"
+        if result.errors:
+            with open(errors_path, 'w', newline='') as f:
+                writer = csv.writer(f)
+                writer.writerow(['line', 'id', 'error'])
+                writer.writerows(sorted(result.errors))
+
+        summary = (f"{result.rows} rows in {time.perf_counter() - started:.1f}s: "
+                   f"{result.created} created, {result.updated} updated, {len(result.errors)} errors")
+        if options['dry_run']:
+            summary += " (dry run, nothing written)"
+        self.stderr.write(self.style.SUCCESS(summary))
+        if result.errors:
+            self.stderr.write(self.style.WARNING(f"Rows not imported written to {errors_path}"))
@@ -0,0 +1,50 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from data_management.bench.seed import clear_seeded, seed
+
+
+class Command(BaseCommand):
+    help = "Seed synthetic pipelines, contacts and opportunities for local benchmarking."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--opportunities', type=int, default=10000)
+        parser.add_argument('--contacts', type=int, help="Defaults to 80%% of --opportunities")
+        parser.add_argument('--pipelines', type=int, default=1)
+        parser.add_argument('--days', type=int, default=730, help="How far back creation dates go")
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--clear', action='store_true', help="Delete previously seeded rows first")
+        parser.add_argument('--clear-only', action='store_true', help="Delete seeded rows and exit")
+
+    def handle(self, *args, **options):
+        if options['opportunities'] < 0 or options['pipelines'] < 1 or options['batch_size'] < 1:
+            raise CommandError("--opportunities must be >= 0, --pipelines and --batch-size >= 1")
+
+        if options['clear'] or options['clear_only']:
+            clear_seeded()
+            self.stderr.write("Deleted previously seeded rows")
+            if options['clear_only']:
+                return
+
+        started = time.perf_counter()
+        report_every = max(options['opportunities'] // 20, options['batch_size'])
+
+        def progress(model, count):
+            if count % report_every < options['batch_size']:
+                self.stderr.write(f"{model}: {count}")
+
+        seed(
+            opportunities=options['opportunities'],
+            contacts=options['contacts'],
+            pipelines=options['pipelines'],
+            days=options['days'],
+            batch_size=options['batch_size'],
+            random_seed=options['seed'],
+            progress=progress,
+        )
+
+        self.stderr.write(self.style.SUCCESS(
+            f"Seeded {options['opportunities']} opportunities in {time.perf_counter() - started:.1f}s"
+        ))
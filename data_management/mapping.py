@@ -0,0 +1,465 @@
+"""
+GHL record -> model field mapping, shared by the full sync and the webhooks.
+
+A mapping is a dict of model field -> field spec. `compile_mapping` turns it
+into one generated Python function (the way dataclasses generates __init__)
+that maps a whole batch of records, with every field expression inlined, so
+there is no per-field loop, lookup or call on the hot path:
+
+    values = CONTACT_MAPPING.one(record)
+    rows = OPPORTUNITY_MAPPING.many(records, lookups=opportunity_lookups())
+
+Large batches can instead be mapped column by column with pandas
+(`many(..., columnar=True)` or `columns()`), which trims, truncates, coerces
+numbers and parses timestamps as vectorized column operations.
+"""
+import copy
+import zoneinfo
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+import numpy as np
+import pandas as pd
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime as django_parse_datetime
+
+from data_management.models import Contact, Pipeline, PipelineStage
+
+
+SYDNEY_TZ = zoneinfo.ZoneInfo("Australia/Sydney")
+
+
+def parse_datetime(value: Any) -> Optional[datetime]:
+    """
+    Parse a GHL date string and return it in the 'Australia/Sydney' timezone.
+
+    GHL sends ISO-8601 (`2024-05-01T03:04:05.678Z`), which
+    datetime.fromisoformat parses natively; other formats go through
+    Django's parser. Naive values are taken to be in the default timezone.
+
+    Args:
+        value: Date string from the API
+
+    Returns:
+        Timezone-aware datetime, or None when empty or invalid
+    """
+    if not value or not isinstance(value, str):
+        return None
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        try:
+            parsed = django_parse_datetime(value)
+        except ValueError:
+            return None
+        if parsed is None:
+            return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.get_default_timezone())
+    return parsed.astimezone(SYDNEY_TZ)
+
+
+def to_float(value: Any) -> Optional[float]:
+    """Safely convert value to float."""
+    if value is None or value == "":
+        return None
+    try:
+        return float(value)
+    except (ValueError, TypeError):
+        return None
+
+
+def to_int(value: Any) -> int:
+    """Safely convert value to int."""
+    if value is None or value == "":
+        return 0
+    try:
+        return int(float(value))
+    except (ValueError, TypeError):
+        return 0
+
+
+def _frame(records: List[Dict[str, Any]]) -> pd.DataFrame:
+    """
+    DataFrame of records with the values as given (object columns).
+
+    Missing keys are NaN and explicit nulls stay None, so specs can tell
+    `_get(key, default)` cases apart the way the row mode does.
+    """
+    keys = dict.fromkeys(key for record in records for key in record)
+    return pd.DataFrame(
+        {key: pd.Series([record.get(key, np.nan) for record in records], dtype=object) for key in keys},
+        index=pd.RangeIndex(len(records)),
+    )
+
+
+def _source(frame: pd.DataFrame, key: str) -> pd.Series:
+    if key in frame:
+        return frame[key]
+    return pd.Series(np.nan, index=frame.index, dtype=object)
+
+
+def _present(column: pd.Series) -> pd.Series:
+    """Rows where `value or default` would keep the value."""
+    return column.notna() & (column != '')
+
+
+def _absent(value: Any) -> bool:
+    """The key is not in the record (see _frame)."""
+    return isinstance(value, float) and value != value
+
+
+def parse_datetime_column(column: pd.Series, now: datetime) -> List[datetime]:
+    """
+    Vectorized parse_datetime: ISO-8601 strings to datetimes in 'Australia/Sydney'.
+
+    Args:
+        column: Date strings; anything else counts as missing
+        now: Value for missing or invalid dates
+
+    Returns:
+        List of timezone-aware datetimes
+    """
+    text = column.where(column.map(lambda value: isinstance(value, str) and value != '')).astype(object)
+    aware = text.str.contains(r'(?:Z|[+-]\d\d:?\d\d)$', na=False)
+    naive = text.notna() & ~aware
+
+    parsed = pd.Series(pd.NaT, index=column.index, dtype='datetime64[ns, UTC]')
+    if aware.any():
+        parsed[aware] = pd.to_datetime(text[aware], utc=True, errors='coerce', format='ISO8601')
+    if naive.any():
+        local = pd.to_datetime(text[naive], errors='coerce', format='ISO8601')
+        parsed[naive] = local.dt.tz_localize(
+            timezone.get_default_timezone(), ambiguous='NaT', nonexistent='NaT'
+        ).dt.tz_convert('UTC')
+
+    values = parsed.dt.tz_convert(SYDNEY_TZ).array.to_pydatetime()
+    values = np.where(parsed.isna().to_numpy(), now, values)
+
+    # Whatever pandas could not parse goes through parse_datetime, which
+    # also tries Django's parser, so both modes agree on unusual formats
+    for position in np.flatnonzero((text.notna() & parsed.isna()).to_numpy()):
+        values[position] = parse_datetime(text.iloc[position]) or now
+    return values.tolist()
+
+
+# Field specs. `expression()` returns Python source evaluated per record,
+# where `_get` is the record's .get, `_now` the batch timestamp and earlier
+# fields are available as local variables. `column()` computes the same
+# values for a whole DataFrame of records, returning a Series, a list, or a
+# scalar shared by every row.
+
+class Value:
+    """The raw value of `key`."""
+
+    def __init__(self, key: str, default: Any = None):
+        self.key = key
+        self.default = default
+
+    def expression(self) -> str:
+        # repr() keeps mutable defaults like [] fresh for every record
+        return f"_get({self.key!r}, {self.default!r})"
+
+    def column(self, frame, columns, lookups, now):
+        default = self.default
+        return _source(frame, self.key).map(lambda value: copy.copy(default) if _absent(value) else value)
+
+
+class Text:
+    """Stripped string, truncated to `max_length`; None instead of '' when `null`."""
+
+    def __init__(self, key: str, max_length: int = None, default: str = "", null: bool = False):
+        self.key = key
+        self.max_length = max_length
+        self.default = default
+        self.null = null
+
+    def expression(self) -> str:
+        source = f"(_get({self.key!r}) or {self.default!r}).strip()"
+        if self.max_length:
+            source += f"[:{self.max_length}]"
+        return f"({source} or None)" if self.null else source
+
+    def column(self, frame, columns, lookups, now):
+        values = _source(frame, self.key)
+        values = values.where(_present(values), self.default).astype(str).str.strip()
+        if self.max_length:
+            values = values.str.slice(0, self.max_length)
+        return values.where(values != '', None) if self.null else values
+
+
+class DateTime:
+    """Date of the first non-empty `keys`, or the batch timestamp when invalid."""
+
+    def __init__(self, *keys: str):
+        self.keys = keys
+
+    def expression(self) -> str:
+        values = " or ".join(f"_get({key!r})" for key in self.keys)
+        return f"parse_datetime({values}) or _now"
+
+    def column(self, frame, columns, lookups, now):
+        values = _source(frame, self.keys[0])
+        for key in self.keys[1:]:
+            values = values.where(_present(values), _source(frame, key))
+        return parse_datetime_column(values, now)
+
+
+def _numeric(column: pd.Series) -> pd.Series:
+    return pd.to_numeric(column.where(_present(column)), errors='coerce').astype('float64')
+
+
+class Float:
+    def __init__(self, key: str):
+        self.key = key
+
+    def expression(self) -> str:
+        return f"to_float(_get({self.key!r}))"
+
+    def column(self, frame, columns, lookups, now):
+        values = _numeric(_source(frame, self.key))
+        return values.astype(object).where(values.notna(), None)
+
+
+class Int:
+    def __init__(self, key: str):
+        self.key = key
+
+    def expression(self) -> str:
+        return f"to_int(_get({self.key!r}))"
+
+    def column(self, frame, columns, lookups, now):
+        values = _numeric(_source(frame, self.key)).replace([np.inf, -np.inf], np.nan).fillna(0)
+        return np.trunc(values).astype('int64')
+
+
+class Now:
+    """The batch timestamp."""
+
+    def expression(self) -> str:
+        return "_now"
+
+    def column(self, frame, columns, lookups, now):
+        return now
+
+
+class Const:
+    def __init__(self, value: Any):
+        self.value = value
+
+    def expression(self) -> str:
+        return repr(self.value)
+
+    def column(self, frame, columns, lookups, now):
+        return self.value
+
+
+class Related:
+    """Primary key of the row whose GHL id is `key`, from lookups[`lookup`]."""
+
+    def __init__(self, key: str, lookup: str):
+        self.key = key
+        self.lookup = lookup
+
+    def expression(self) -> str:
+        return f"_lookup_{self.lookup}.get(_get({self.key!r}))"
+
+    def column(self, frame, columns, lookups, now):
+        keys = _source(frame, self.key)
+        keys = keys.where(keys.notna(), None)
+        return keys.map(lookups.get(self.lookup, {})).astype('Int64').astype(object).where(
+            lambda values: values.notna(), None)
+
+
+class Str:
+    """str() of the raw value of `key`."""
+
+    def __init__(self, key: str, default: Any = None):
+        self.key = key
+        self.default = default
+
+    def expression(self) -> str:
+        return f"str(_get({self.key!r}, {self.default!r}))"
+
+    def column(self, frame, columns, lookups, now):
+        default = str(self.default)
+        return _source(frame, self.key).map(lambda value: default if _absent(value) else str(value))
+
+
+class Expression:
+    """
+    Python source over earlier fields, e.g. `first_name.lower()`.
+
+    `column` is the vectorized equivalent, called with the earlier columns.
+    """
+
+    def __init__(self, source: str, column: Callable[[Dict[str, Any]], Any] = None):
+        self.source = source
+        self.vectorized = column
+
+    def expression(self) -> str:
+        return self.source
+
+    def column(self, frame, columns, lookups, now):
+        if self.vectorized is None:
+            raise NotImplementedError(f"No column form for expression {self.source!r}")
+        return self.vectorized(columns)
+
+
+class Mapping:
+    """A compiled mapping; see `compile_mapping`."""
+
+    def __init__(self, name: str, fields: Dict[str, Any], many, source: str):
+        self.name = name
+        self.specs = fields
+        self.fields = list(fields)
+        self._many = many
+        self.source = source
+
+    def many(self, records: Iterable[Dict[str, Any]], lookups: Dict[str, Dict[str, int]] = None,
+             now: datetime = None, columnar: bool = False) -> List[Dict[str, Any]]:
+        """
+        Map a batch of GHL records to dicts of model field values.
+
+        Args:
+            records: Records from the GHL API
+            lookups: GHL id -> primary key dicts for Related fields
+            now: Timestamp for Now fields and missing dates (default: now())
+            columnar: Map column by column with pandas instead of row by row
+
+        Returns:
+            One dict per record
+        """
+        if columnar:
+            columns = self.columns(records, lookups, now)
+            fields = list(columns)
+            return [dict(zip(fields, row)) for row in zip(*columns.values())]
+        return self._many(records, lookups or {}, now or timezone.now())
+
+    def columns(self, records: Iterable[Dict[str, Any]], lookups: Dict[str, Dict[str, int]] = None,
+                now: datetime = None) -> Dict[str, Iterable]:
+        """
+        Map a batch of GHL records column by column.
+
+        Args:
+            records: Records from the GHL API
+            lookups: GHL id -> primary key dicts for Related fields
+            now: Timestamp for Now fields and missing dates (default: now())
+
+        Returns:
+            Model field -> values of every record, as Python objects
+        """
+        frame = _frame(list(records))
+        lookups = lookups or {}
+        now = now or timezone.now()
+
+        columns = {}
+        for field, spec in self.specs.items():
+            columns[field] = spec.column(frame, columns, lookups, now)
+
+        length = len(frame)
+        return {
+            field: values.tolist() if isinstance(values, (pd.Series, np.ndarray))
+            else values if isinstance(values, list) else [values] * length
+            for field, values in columns.items()
+        }
+
+    def one(self, record: Dict[str, Any], lookups: Dict[str, Dict[str, int]] = None,
+            now: datetime = None) -> Dict[str, Any]:
+        """Map a single GHL record."""
+        return self.many((record,), lookups, now)[0]
+
+
+def compile_mapping(name: str, fields: Dict[str, Any]) -> Mapping:
+    """
+    Generate the batch function of a mapping.
+
+    Args:
+        name: Used for the generated function's name
+        fields: Model field -> spec, in evaluation order
+
+    Returns:
+        Mapping
+    """
+    lookups = sorted({spec.lookup for spec in fields.values() if isinstance(spec, Related)})
+    lines = [f"def map_{name}(_records, _lookups, _now):"]
+    lines += [f"    _lookup_{lookup} = _lookups.get({lookup!r}, {{}})" for lookup in lookups]
+    lines += [
+        "    _result = []",
+        "    _append = _result.append",
+        "    for _record in _records:",
+        "        _get = _record.get",
+    ]
+    lines += [f"        {field} = {spec.expression()}" for field, spec in fields.items()]
+    lines.append("        _append({" + ", ".join(f"{field!r}: {field}" for field in fields) + "})")
+    lines.append("    return _result")
+    source = "\n".join(lines)
+
+    namespace = {'parse_datetime': parse_datetime, 'to_float': to_float, 'to_int': to_int}
+    exec(compile(source, f"<mapping {name}>", "exec"), namespace)
+    return Mapping(name, fields, namespace[f"map_{name}"], source)
+
+
+CONTACT_MAPPING = compile_mapping('contact', {
+    'contact_id': Value('id'),
+    'first_name': Text('firstName', 100),
+    'last_name': Text('lastName', 100),
+    'phone': Text('phone', 20),
+    'email': Text('email', null=True),
+    'address': Text('address', 255),
+    'country': Text('country', 10),
+    'date_added': DateTime('dateAdded', 'createdAt'),
+    'date_updated': Now(),
+    'tags': Value('tags', []),
+    'source': Text('source', 100, default='ghl_api'),
+    'full_name_lowercase': Expression(
+        "f'{first_name} {last_name}'.lower().strip()",
+        column=lambda columns: (columns['first_name'] + ' ' + columns['last_name']).str.lower().str.strip(),
+    ),
+})
+
+OPPORTUNITY_MAPPING = compile_mapping('opportunity', {
+    'opportunity_id': Value('id'),
+    'contact_id': Related('contactId', 'contact'),
+    'pipeline_id': Related('pipelineId', 'pipeline'),
+    'current_stage_id': Related('pipelineStageId', 'stage'),
+    'created_by_source': Text('source', 50, default='ghl_api'),
+    'created_by_channel': Const('ghl_api'),
+    'source_id': Text('source', 255),
+    'created_timestamp': DateTime('createdAt'),
+    'value': Float('monetaryValue'),
+    'assigned': Text('assignedTo', 150),
+    'tags': Str('tags', []),
+    'engagement_score': Int('engagementScore'),
+    'status': Text('status', 50, null=True),
+    'description': Text('name'),
+    'address': Text('address'),
+})
+
+
+def opportunity_lookups(records: List[Dict[str, Any]] = None) -> Dict[str, Dict[str, int]]:
+    """
+    GHL id -> primary key dicts for the contact, pipeline and stage of opportunities.
+
+    Args:
+        records: Only load the rows these records reference (default: all rows)
+
+    Returns:
+        Lookups for OPPORTUNITY_MAPPING
+    """
+    relations = (
+        ('contact', Contact, 'contact_id', 'contactId'),
+        ('pipeline', Pipeline, 'pipeline_id', 'pipelineId'),
+        ('stage', PipelineStage, 'pipeline_stage_id', 'pipelineStageId'),
+    )
+    lookups = {}
+    for name, model, id_field, key in relations:
+        queryset = model.objects.all()
+        if records is not None:
+            ids = {record.get(key) for record in records} - {None, ''}
+            if not ids:
+                lookups[name] = {}
+                continue
+            queryset = queryset.filter(**{f'{id_field}__in': ids})
+        lookups[name] = dict(queryset.values_list(id_field, 'id'))
+    return lookups
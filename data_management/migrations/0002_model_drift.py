@@ -0,0 +1,110 @@
+"""
+Schema changes made to the models before migrations were kept up to date.
+
+Deployed databases usually have these columns already, created by
+migrations that were never committed. The SQL therefore only adds what is
+missing, and `migrate` works on both fresh and existing databases. To
+record the migration without running it instead:
+
+    python manage.py migrate data_management 0002_model_drift --fake
+"""
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('data_management', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunSQL(
+                    """
+                    ALTER TABLE "data_management_contact"
+                        ADD COLUMN IF NOT EXISTS "contact_id" varchar(150) DEFAULT '0' NOT NULL,
+                        ALTER COLUMN "email" DROP NOT NULL;
+                    ALTER TABLE "data_management_contact" ALTER COLUMN "contact_id" DROP DEFAULT;
+                    ALTER TABLE "data_management_opportunity"
+                        ADD COLUMN IF NOT EXISTS "address" text NULL,
+                        ADD COLUMN IF NOT EXISTS "assigned" varchar(150) NULL,
+                        ADD COLUMN IF NOT EXISTS "description" text NULL,
+                        ADD COLUMN IF NOT EXISTS "engagement_score" integer DEFAULT 0 NOT NULL,
+                        ADD COLUMN IF NOT EXISTS "opportunity_id" varchar(150) DEFAULT '0' NOT NULL,
+                        ADD COLUMN IF NOT EXISTS "status" varchar NULL,
+                        ADD COLUMN IF NOT EXISTS "tags" text NULL,
+                        ADD COLUMN IF NOT EXISTS "value" double precision NULL;
+                    ALTER TABLE "data_management_opportunity"
+                        ALTER COLUMN "engagement_score" DROP DEFAULT,
+                        ALTER COLUMN "opportunity_id" DROP DEFAULT;
+                    ALTER TABLE "data_management_pipeline" ADD COLUMN IF NOT EXISTS "pipeline_id" varchar NULL;
+                    ALTER TABLE "data_management_pipelinestage" ADD COLUMN IF NOT EXISTS "pipeline_stage_id" varchar NULL;
+                    """,
+                    migrations.RunSQL.noop,
+                ),
+            ],
+            state_operations=[
+                migrations.AddField(
+                    model_name='contact',
+                    name='contact_id',
+                    field=models.CharField(default=0, max_length=150),
+                ),
+                migrations.AddField(
+                    model_name='opportunity',
+                    name='address',
+                    field=models.TextField(blank=True, null=True),
+                ),
+                migrations.AddField(
+                    model_name='opportunity',
+                    name='assigned',
+                    field=models.CharField(blank=True, max_length=150, null=True),
+                ),
+                migrations.AddField(
+                    model_name='opportunity',
+                    name='description',
+                    field=models.TextField(blank=True, null=True),
+                ),
+                migrations.AddField(
+                    model_name='opportunity',
+                    name='engagement_score',
+                    field=models.IntegerField(default=0),
+                ),
+                migrations.AddField(
+                    model_name='opportunity',
+                    name='opportunity_id',
+                    field=models.CharField(default=0, max_length=150),
+                ),
+                migrations.AddField(
+                    model_name='opportunity',
+                    name='status',
+                    field=models.CharField(blank=True, null=True),
+                ),
+                migrations.AddField(
+                    model_name='opportunity',
+                    name='tags',
+                    field=models.TextField(blank=True, null=True),
+                ),
+                migrations.AddField(
+                    model_name='opportunity',
+                    name='value',
+                    field=models.FloatField(blank=True, null=True),
+                ),
+                migrations.AddField(
+                    model_name='pipeline',
+                    name='pipeline_id',
+                    field=models.CharField(blank=True, null=True),
+                ),
+                migrations.AddField(
+                    model_name='pipelinestage',
+                    name='pipeline_stage_id',
+                    field=models.CharField(blank=True, null=True),
+                ),
+                migrations.AlterField(
+                    model_name='contact',
+                    name='email',
+                    field=models.EmailField(blank=True, max_length=254, null=True),
+                ),
+            ],
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.1 on 2026-10-19 01:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('data_management', '0002_model_drift'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SyncRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('location_id', models.CharField(db_index=True, max_length=100)),
+                ('mode', models.CharField(choices=[('full', 'Contacts and opportunities'), ('contacts', 'Contacts only'), ('opportunities', 'Opportunities only')], max_length=20)),
+                ('status', models.CharField(choices=[('running', 'Running'), ('success', 'Success'), ('failed', 'Failed')], default='running', max_length=20)),
+                ('started_at', models.DateTimeField(db_index=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('duration_seconds', models.FloatField(blank=True, null=True)),
+                ('pages', models.IntegerField(default=0)),
+                ('records_fetched', models.IntegerField(default=0)),
+                ('records_created', models.IntegerField(default=0)),
+                ('records_updated', models.IntegerField(default=0)),
+                ('records_skipped', models.IntegerField(default=0)),
+                ('api_seconds', models.FloatField(default=0)),
+                ('db_seconds', models.FloatField(default=0)),
+                ('transform_seconds', models.FloatField(default=0)),
+                ('peak_memory_mb', models.FloatField(blank=True, null=True)),
+                ('phases', models.JSONField(default=dict)),
+                ('error', models.TextField(blank=True)),
+            ],
+            options={
+                'ordering': ['-started_at'],
+            },
+        ),
+    ]
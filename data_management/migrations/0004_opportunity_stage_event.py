@@ -0,0 +1,48 @@
+# Generated by Django 5.2.1 on 2026-10-19 01:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def seed_current_stages(apps, schema_editor):
+    """Start the log with the stage each opportunity is in now, as of its creation."""
+    Opportunity = apps.get_model('data_management', 'Opportunity')
+    OpportunityStageEvent = apps.get_model('data_management', 'OpportunityStageEvent')
+    opportunities = Opportunity.objects.filter(current_stage__isnull=False).values_list(
+        'id', 'pipeline_id', 'current_stage_id', 'created_timestamp'
+    )
+    OpportunityStageEvent.objects.bulk_create(
+        (
+            OpportunityStageEvent(opportunity_id=pk, pipeline_id=pipeline_id, to_stage_id=stage_id,
+                                  occurred_at=created, source='sync')
+            for pk, pipeline_id, stage_id, created in opportunities.iterator()
+        ),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('data_management', '0003_sync_run'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OpportunityStageEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('occurred_at', models.DateTimeField()),
+                ('source', models.CharField(choices=[('sync', 'Sync'), ('webhook', 'Webhook')], max_length=20)),
+                ('from_stage', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='data_management.pipelinestage')),
+                ('opportunity', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stage_events', to='data_management.opportunity')),
+                ('pipeline', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='data_management.pipeline')),
+                ('to_stage', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='data_management.pipelinestage')),
+            ],
+            options={
+                'ordering': ['occurred_at', 'id'],
+                'indexes': [models.Index(fields=['opportunity', 'occurred_at'], name='data_manage_opportu_876912_idx'), models.Index(fields=['to_stage', 'occurred_at'], name='data_manage_to_stag_633a12_idx'), models.Index(fields=['occurred_at'], name='data_manage_occurre_d829ab_idx')],
+            },
+        ),
+        migrations.RunPython(seed_current_stages, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.1 on 2026-10-19 01:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('data_management', '0004_opportunity_stage_event'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='opportunity',
+            index=models.Index(fields=['current_stage', 'created_timestamp'], name='data_manage_current_caf83e_idx'),
+        ),
+    ]
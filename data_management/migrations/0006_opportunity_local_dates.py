@@ -0,0 +1,54 @@
+# Generated by Django 5.2.1 on 2026-10-19 01:49
+
+import zoneinfo
+
+from django.db import migrations, models
+from django.db.models import DateField
+from django.db.models.functions import TruncDate, TruncMonth
+from django.utils import timezone
+
+
+def backfill_local_dates(apps, schema_editor):
+    """Set the local creation day and month of existing opportunities in the location's timezone."""
+    GHLAuthCredentials = apps.get_model('accounts', 'GHLAuthCredentials')
+    Opportunity = apps.get_model('data_management', 'Opportunity')
+    name = GHLAuthCredentials.objects.exclude(timezone__isnull=True).exclude(timezone="") \
+        .values_list('timezone', flat=True).first()
+    try:
+        tz = zoneinfo.ZoneInfo(name) if name else timezone.get_default_timezone()
+    except (zoneinfo.ZoneInfoNotFoundError, ValueError):
+        tz = timezone.get_default_timezone()
+    Opportunity.objects.update(
+        created_local_date=TruncDate('created_timestamp', tzinfo=tz),
+        created_local_month=TruncMonth('created_timestamp', output_field=DateField(), tzinfo=tz),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0003_token_expires_at'),
+        ('data_management', '0005_opportunity_stage_created_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='opportunity',
+            name='created_local_date',
+            field=models.DateField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='opportunity',
+            name='created_local_month',
+            field=models.DateField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='opportunity',
+            index=models.Index(fields=['created_local_date'], name='data_manage_created_ae238a_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='opportunity',
+            index=models.Index(fields=['created_local_month'], name='data_manage_created_476fe3_idx'),
+        ),
+        migrations.RunPython(backfill_local_dates, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.1 on 2026-10-19 02:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('data_management', '0006_opportunity_local_dates'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='opportunitystageevent',
+            name='source',
+            field=models.CharField(choices=[('sync', 'Sync'), ('webhook', 'Webhook'), ('import', 'Import')], max_length=20),
+        ),
+    ]
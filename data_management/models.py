@@ -58,6 +58,133 @@ class Opportunity(models.Model):
     status = models.CharField(null=True, blank=True)
     description = models.TextField(null=True, blank=True)
     address = models.TextField(null=True, blank=True)
+    # Creation day and first day of its month in the location's timezone,
+    # set from created_timestamp by localize()
+    created_local_date = models.DateField(null=True, blank=True)
+    created_local_month = models.DateField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # Per-stage counts and sums over a creation date range
+            models.Index(fields=['current_stage', 'created_timestamp']),
+            models.Index(fields=['created_local_date']),
+            models.Index(fields=['created_local_month']),
+        ]
 
     def __str__(self):
         return f"Opportunity for {self.contact.first_name}"
+
+    def localize(self, tz=None):
+        """
+        Set created_local_date and created_local_month from created_timestamp.
+
+        Bulk writes skip save() and must call this on every instance.
+
+        Args:
+            tz: Timezone of the location (default: location_timezone())
+        """
+        if self.created_timestamp is None:
+            self.created_local_date = self.created_local_month = None
+            return
+        if tz is None:
+            from data_management.date_ranges import location_timezone
+            tz = location_timezone()
+        self.created_local_date = self.created_timestamp.astimezone(tz).date()
+        self.created_local_month = self.created_local_date.replace(day=1)
+
+    def save(self, *args, **kwargs):
+        self.localize()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'created_timestamp' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'created_local_date', 'created_local_month'}
+        super().save(*args, **kwargs)
+
+
+class OpportunityStageEvent(models.Model):
+    """
+    Append-only log of opportunity stage changes, written by the sync, the
+    opportunity webhooks and the export importer whenever they see
+    `current_stage` change.
+    """
+
+    SOURCE_SYNC = 'sync'
+    SOURCE_WEBHOOK = 'webhook'
+    SOURCE_IMPORT = 'import'
+    SOURCE_CHOICES = [
+        (SOURCE_SYNC, 'Sync'),
+        (SOURCE_WEBHOOK, 'Webhook'),
+        (SOURCE_IMPORT, 'Import'),
+    ]
+
+    opportunity = models.ForeignKey(Opportunity, on_delete=models.CASCADE, related_name="stage_events")
+    pipeline = models.ForeignKey(Pipeline, on_delete=models.SET_NULL, null=True, blank=True, related_name="+")
+    # None for the first stage an opportunity is seen in
+    from_stage = models.ForeignKey(PipelineStage, on_delete=models.SET_NULL, null=True, blank=True,
+                                   related_name="+")
+    to_stage = models.ForeignKey(PipelineStage, on_delete=models.SET_NULL, null=True, blank=True,
+                                 related_name="+")
+    occurred_at = models.DateTimeField()
+    source = models.CharField(max_length=20, choices=SOURCE_CHOICES)
+
+    class Meta:
+        ordering = ['occurred_at', 'id']
+        indexes = [
+            models.Index(fields=['opportunity', 'occurred_at']),
+            models.Index(fields=['to_stage', 'occurred_at']),
+            models.Index(fields=['occurred_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.opportunity_id}: {self.from_stage_id} -> {self.to_stage_id} at {self.occurred_at:%Y-%m-%d %H:%M}"
+
+
+class SyncRun(models.Model):
+    """One GHL sync, written by GHLSyncService through SyncRunRecorder."""
+
+    MODE_FULL = 'full'
+    MODE_CONTACTS = 'contacts'
+    MODE_OPPORTUNITIES = 'opportunities'
+    MODE_CHOICES = [
+        (MODE_FULL, 'Contacts and opportunities'),
+        (MODE_CONTACTS, 'Contacts only'),
+        (MODE_OPPORTUNITIES, 'Opportunities only'),
+    ]
+
+    STATUS_RUNNING = 'running'
+    STATUS_SUCCESS = 'success'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_SUCCESS, 'Success'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
+    location_id = models.CharField(max_length=100, db_index=True)
+    mode = models.CharField(max_length=20, choices=MODE_CHOICES)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_RUNNING)
+    started_at = models.DateTimeField(db_index=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    duration_seconds = models.FloatField(null=True, blank=True)
+
+    pages = models.IntegerField(default=0)
+    records_fetched = models.IntegerField(default=0)
+    records_created = models.IntegerField(default=0)
+    records_updated = models.IntegerField(default=0)
+    records_skipped = models.IntegerField(default=0)
+
+    # Where the time went: GHL API calls, database queries, and mapping
+    # records to model instances in between
+    api_seconds = models.FloatField(default=0)
+    db_seconds = models.FloatField(default=0)
+    transform_seconds = models.FloatField(default=0)
+    peak_memory_mb = models.FloatField(null=True, blank=True)
+
+    # Per phase (fetch_contacts, sync_contacts, ...) timings and counts
+    phases = models.JSONField(default=dict)
+    error = models.TextField(blank=True)
+
+    class Meta:
+        ordering = ['-started_at']
+
+    def __str__(self):
+        return f"{self.mode} sync of {self.location_id} at {self.started_at:%Y-%m-%d %H:%M} ({self.status})"
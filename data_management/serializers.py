@@ -1,28 +1,50 @@
 from rest_framework import serializers
 
 
-class RevenueTrendSerializer(serializers.Serializer):
+class AggregateSerializer(serializers.Serializer):
+    """
+    Read-only serializer for the pre-computed dashboard dicts.
+
+    The views already build JSON-native values (rounded floats, ints and
+    strings), so rather than running every field's ``to_representation``
+    this only keeps the declared keys and recurses into nested serializers.
+    """
+
+    def to_representation(self, instance):
+        data = {}
+        for name, field in self.fields.items():
+            value = instance.get(name)
+            if value is not None:
+                if isinstance(field, serializers.ListSerializer):
+                    value = [field.child.to_representation(item) for item in value]
+                elif isinstance(field, serializers.BaseSerializer):
+                    value = field.to_representation(value)
+            data[name] = value
+        return data
+
+
+class RevenueTrendSerializer(AggregateSerializer):
     month = serializers.CharField()
     year = serializers.IntegerField()
     value = serializers.FloatField()
 
 
-class CashCollectedSerializer(serializers.Serializer):
+class CashCollectedSerializer(AggregateSerializer):
     total = serializers.FloatField()
     timeframe = serializers.CharField()
 
 
-class ProjectedRevenueSerializer(serializers.Serializer):
+class ProjectedRevenueSerializer(AggregateSerializer):
     week1 = serializers.FloatField()
     week2 = serializers.FloatField()
     total = serializers.FloatField()
 
 
-class PipelineValueSerializer(serializers.Serializer):
+class PipelineValueSerializer(AggregateSerializer):
     total = serializers.FloatField()
 
 
-class SalesPerformanceSerializer(serializers.Serializer):
+class SalesPerformanceSerializer(AggregateSerializer):
     leads_generated = serializers.IntegerField()
     quotes_sent = serializers.IntegerField()
     jobs_booked = serializers.IntegerField()
@@ -32,19 +54,19 @@ class SalesPerformanceSerializer(serializers.Serializer):
     # jobs_won = serializers.FloatField()
 
 
-class LeadSourceSerializer(serializers.Serializer):
+class LeadSourceSerializer(AggregateSerializer):
     source = serializers.CharField()
     count = serializers.IntegerField()
     value = serializers.FloatField()
 
 
-class CashflowSnapshotSerializer(serializers.Serializer):
+class CashflowSnapshotSerializer(AggregateSerializer):
     this_week = serializers.FloatField()
     this_month = serializers.FloatField()
     next_30_days = serializers.FloatField()
 
 
-class DashboardSerializer(serializers.Serializer):
+class DashboardSerializer(AggregateSerializer):
     revenue_trend = RevenueTrendSerializer(many=True)
     cash_collected = CashCollectedSerializer()
     projected_revenue = ProjectedRevenueSerializer()
@@ -55,7 +77,7 @@ class DashboardSerializer(serializers.Serializer):
 
 
 
-class RevenueMetricsSerializer(serializers.Serializer):
+class RevenueMetricsSerializer(AggregateSerializer):
     revenue_ytd = serializers.FloatField()
     revenue_mtd = serializers.FloatField()
     revenue_qtd = serializers.FloatField()
@@ -100,10 +122,40 @@ class ContactSerializer(serializers.ModelSerializer):
 
 
 class OpportunitySerializer(serializers.ModelSerializer):
+    """
+    Opportunity serializer with optional sparse fieldsets.
+
+    ``fields`` limits the output to the given field names and ``expand``
+    lists the relations rendered as nested objects; relations that are
+    selected but not expanded are rendered as their primary key. With
+    neither argument every field is returned with all relations expanded.
+    """
     contact = ContactSerializer(read_only=True)
     pipeline = PipelineSerializer(read_only=True)
     current_stage = PipelineStageSerializer(read_only=True)
-    
+
+    # relation name -> related fields needed to render it expanded
+    EXPANDABLE = {
+        'contact': ('contact',),
+        'pipeline': ('pipeline',),
+        'current_stage': ('current_stage', 'current_stage__pipeline'),
+    }
+
+    def __init__(self, *args, fields=None, expand=None, **kwargs):
+        super().__init__(*args, **kwargs)
+
+        if fields is None and expand is None:
+            return
+
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+        expand = set(expand or ())
+        for name in self.EXPANDABLE:
+            if name in self.fields and name not in expand:
+                self.fields[name] = serializers.PrimaryKeyRelatedField(read_only=True)
+
     class Meta:
         model = Opportunity
         fields = [
@@ -111,4 +163,24 @@ class OpportunitySerializer(serializers.ModelSerializer):
             'created_by_source', 'created_by_channel', 'source_id', 
             'created_timestamp', 'value', 'assigned', 'tags', 
             'engagement_score', 'status', 'description', 'address'
-        ]
\ No newline at end of file
+        ]
+
+from .models import SyncRun
+
+
+class SyncRunSerializer(serializers.ModelSerializer):
+    records_per_second = serializers.SerializerMethodField()
+
+    class Meta:
+        model = SyncRun
+        fields = [
+            'id', 'location_id', 'mode', 'status', 'started_at', 'finished_at',
+            'duration_seconds', 'pages', 'records_fetched', 'records_created',
+            'records_updated', 'records_skipped', 'records_per_second', 'api_seconds',
+            'db_seconds', 'transform_seconds', 'peak_memory_mb', 'phases', 'error'
+        ]
+
+    def get_records_per_second(self, obj):
+        if not obj.duration_seconds:
+            return None
+        return round(obj.records_fetched / obj.duration_seconds, 1)
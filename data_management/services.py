@@ -1,10 +1,10 @@
 from django.db.models import Count, Sum, Avg, F, Q, Case, When, Value, IntegerField, DecimalField
 from django.db.models.functions import TruncMonth
-from django.utils import timezone
 from datetime import datetime, timedelta, date
 import calendar
 import decimal
 
+from .date_ranges import day_range, local_today
 from .models import Pipeline, PipelineStage, Contact, Opportunity
 
 
@@ -16,7 +16,7 @@ class DashboardService:
     @staticmethod
     def get_revenue_ytd():
         """Calculate revenue year-to-date"""
-        today = timezone.now().date()
+        today = local_today()
         year_start = date(today.year, 1, 1)
         
         # In a real implementation, this would query your revenue model
@@ -29,7 +29,7 @@ class DashboardService:
     @staticmethod
     def get_revenue_mtd():
         """Calculate revenue month-to-date"""
-        today = timezone.now().date()
+        today = local_today()
         month_start = date(today.year, today.month, 1)
         
         # Mock implementation
@@ -38,7 +38,7 @@ class DashboardService:
     @staticmethod
     def get_revenue_qtd():
         """Calculate revenue quarter-to-date"""
-        today = timezone.now().date()
+        today = local_today()
         quarter = (today.month - 1) // 3 + 1
         quarter_start = date(today.year, 3 * quarter - 2, 1)
         
@@ -68,7 +68,7 @@ class DashboardService:
     @staticmethod
     def get_monthly_revenue_trend():
         """Get revenue trend by month for the current year"""
-        current_year = timezone.now().year
+        current_year = local_today().year
         months = []
         
         # In a real implementation, you would query your data with something like:
@@ -83,7 +83,7 @@ class DashboardService:
             month_name = calendar.month_name[month]
             # Generate some example data with variation
             base = 40000
-            if month <= timezone.now().month:
+            if month <= local_today().month:
                 # Past and current months have "actual" data
                 revenue = decimal.Decimal(str(base + (month * 5000) + (month % 3) * 8000))
             else:
@@ -102,8 +102,7 @@ class DashboardService:
         """Count leads generated in the given date range"""
         # Use the Contact model's creation date
         return Contact.objects.filter(
-            date_added__date__gte=start_date,
-            date_added__date__lte=end_date
+            day_range(start_date, end_date).filter('date_added')
         ).count()
     
     @staticmethod
@@ -113,8 +112,7 @@ class DashboardService:
         # This is a simplified example - you would need to adjust based on your actual data model
         quote_stages = PipelineStage.objects.filter(name__icontains='quote')
         return Opportunity.objects.filter(
-            created_timestamp__date__gte=start_date,
-            created_timestamp__date__lte=end_date,
+            day_range(start_date, end_date).filter('created_timestamp'),
             current_stage__in=quote_stages
         ).count()
     
@@ -127,8 +125,7 @@ class DashboardService:
             Q(name__icontains='booked') | Q(name__icontains='confirmed')
         )
         return Opportunity.objects.filter(
-            created_timestamp__date__gte=start_date,
-            created_timestamp__date__lte=end_date,
+            day_range(start_date, end_date).filter('created_timestamp'),
             current_stage__in=booked_stages
         ).count()
     
@@ -137,8 +134,7 @@ class DashboardService:
         """Get breakdown of leads by source"""
         # Query opportunities grouped by source
         sources = Opportunity.objects.filter(
-            created_timestamp__date__gte=start_date,
-            created_timestamp__date__lte=end_date
+            day_range(start_date, end_date).filter('created_timestamp')
         ).values('created_by_source').annotate(count=Count('id')).order_by('-count')
         
         result = []
@@ -163,7 +159,7 @@ class DashboardService:
     @staticmethod
     def get_cashflow_snapshot():
         """Get cashflow snapshot data"""
-        today = timezone.now().date()
+        today = local_today()
         week_start = today - timedelta(days=today.weekday())
         month_start = date(today.year, today.month, 1)
         
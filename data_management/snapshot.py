@@ -0,0 +1,433 @@
+"""
+Per-process columnar snapshot of opportunities for the dashboard KPIs.
+
+Every dashboard and revenue KPI is a count or sum over a `created_timestamp`
+range with a few categorical filters. With OPPORTUNITY_SNAPSHOT set, each
+worker keeps opportunities as NumPy arrays sorted by creation time, so a
+range is two `searchsorted` calls and the filters are masks over the slice.
+Sums and counts by status alone come from prefix sums over the rows of
+each status instead, so they cost two lookups per status whatever the
+length of the range:
+
+    count, total = aggregate_opportunities(start, end, statuses=['won'])
+    totals = aggregate_windows({'ytd': {'start': year_start}, 'mtd': {'start': month_start}})
+
+The sync, the webhooks and the importer call
+`notify_opportunities_changed(ids)` after writing. That bumps a version in
+the shared cache and stores the changed ids under it; workers check the
+version at most every CHECK_INTERVAL seconds and re-read only those rows,
+or reload everything when the change list is gone or was too large to
+store.
+
+Without OPPORTUNITY_SNAPSHOT, or while the shared cache is unreachable and
+the version cannot be checked, the same functions run the equivalent query.
+"""
+import logging
+import threading
+import time
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Q, Sum
+from django.utils import timezone
+
+from data_management.models import Opportunity
+from kpi_backend.db_router import record_write
+from kpi_backend.metrics import CACHE_REQUESTS
+
+logger = logging.getLogger('data_management.helpers')
+
+
+VERSION_KEY = "opportunity-snapshot:version"
+CHANGES_KEY = "opportunity-snapshot:changes:{version}"
+
+# Seconds between version checks, and how long change lists are kept
+CHECK_INTERVAL = 1.0
+CHANGES_TIMEOUT = 60 * 60
+# Larger changes make workers reload instead of patching
+MAX_PATCH = 10000
+
+FIELDS = ('id', 'created_timestamp', 'value', 'status', 'created_by_source', 'current_stage__name')
+
+
+def _micros(value: datetime) -> int:
+    """Epoch microseconds; naive values are in the default timezone like in queries."""
+    if timezone.is_naive(value):
+        value = timezone.make_aware(value)
+    return int(value.timestamp() * 1_000_000)
+
+
+class SnapshotUnavailable(Exception):
+    """The snapshot cannot tell whether it is current because the cache is unreachable."""
+
+
+class Categories:
+    """
+    Codes for the distinct values of a categorical column.
+
+    Codes are only ever added, under a lock, so the columns of older
+    snapshot versions stay valid while requests read them.
+    """
+
+    def __init__(self):
+        self.values: List[Optional[str]] = []
+        self.codes: Dict[Optional[str], int] = {}
+        self._lock = threading.Lock()
+
+    def encode(self, values: Iterable[Optional[str]]) -> np.ndarray:
+        codes = self.codes
+        with self._lock:
+            for value in values:
+                if value not in codes:
+                    codes[value] = len(self.values)
+                    self.values.append(value)
+        return np.fromiter((codes[value] for value in values), dtype=np.int32)
+
+    def matching(self, wanted: Sequence[str], ignore_case: bool = False) -> np.ndarray:
+        """Codes of the values in `wanted`."""
+        with self._lock:
+            codes = list(self.codes.items())
+        if ignore_case:
+            wanted = {value.lower() for value in wanted}
+            return np.array([code for value, code in codes
+                             if value is not None and value.lower() in wanted], dtype=np.int32)
+        codes = dict(codes)
+        return np.array([codes[value] for value in wanted if value in codes], dtype=np.int32)
+
+
+class Columns:
+    """Immutable arrays of one snapshot version, sorted by timestamp."""
+
+    def __init__(self, ids, timestamps, values, statuses, sources, stages):
+        self.ids = ids
+        self.timestamps = timestamps
+        self.values = values
+        self.statuses = statuses
+        self.sources = sources
+        self.stages = stages
+        self._prefix = None
+        self._prefix_lock = threading.Lock()
+
+    def prefix(self) -> Tuple[np.ndarray, List[Tuple[np.ndarray, np.ndarray]]]:
+        """
+        Prefix sums, built once on first use: rows [low, high) sum to
+        `total[high] - total[low]`. Each status code gets the timestamps of
+        its own rows and the prefix sums of their values, so memory stays
+        linear in the number of rows however many statuses there are.
+
+        Returns:
+            (total value, (timestamps, value prefix sums) per status code)
+        """
+        if self._prefix is not None:
+            return self._prefix
+        with self._prefix_lock:
+            if self._prefix is not None:
+                return self._prefix
+            values = np.nan_to_num(self.values)
+            total = np.zeros(len(values) + 1)
+            np.cumsum(values, out=total[1:])
+
+            # A stable sort keeps the rows of each status in timestamp order
+            order = np.argsort(self.statuses, kind='stable')
+            size = int(self.statuses.max()) + 1 if len(self.statuses) else 0
+            bounds = np.searchsorted(self.statuses[order], np.arange(size + 1, dtype=np.int32))
+            by_status = []
+            for code in range(size):
+                rows = order[bounds[code]:bounds[code + 1]]
+                sums = np.zeros(len(rows) + 1)
+                np.cumsum(values[rows], out=sums[1:])
+                by_status.append((self.timestamps[rows], sums))
+            self._prefix = (total, by_status)
+            return self._prefix
+
+
+class OpportunitySnapshot:
+    """
+    Columnar copy of the opportunities of this process.
+
+    Use the module level `opportunity_snapshot` instance.
+    """
+
+    def __init__(self):
+        self.statuses = Categories()
+        self.sources = Categories()
+        self.stages = Categories()
+        self._columns: Optional[Columns] = None
+        self._version = None
+        self._checked = 0.0
+        self._lock = threading.Lock()
+
+    def _rows(self, queryset) -> Columns:
+        rows = list(queryset.values_list(*FIELDS))
+        ids, timestamps, values, statuses, sources, stages = zip(*rows) if rows else ((),) * 6
+        return Columns(
+            ids=np.array(ids, dtype=np.int64),
+            timestamps=np.array([_micros(value) for value in timestamps], dtype=np.int64),
+            values=np.array([np.nan if value is None else value for value in values], dtype=np.float64),
+            statuses=self.statuses.encode(statuses),
+            sources=self.sources.encode(sources),
+            stages=self.stages.encode(stages),
+        )
+
+    def load(self) -> None:
+        """Read every opportunity."""
+        self._columns = self._rows(Opportunity.objects.order_by('created_timestamp', 'id'))
+        logger.info(f"Loaded opportunity snapshot with {len(self._columns.ids)} rows")
+
+    def patch(self, ids: Sequence[int]) -> None:
+        """Re-read the opportunities `ids`; the ones that no longer exist are dropped."""
+        current = self._columns
+        keep = ~np.isin(current.ids, np.asarray(ids, dtype=np.int64))
+        changed = self._rows(Opportunity.objects.filter(id__in=ids))
+
+        def merge(name):
+            return np.concatenate([getattr(current, name)[keep], getattr(changed, name)])
+
+        timestamps = merge('timestamps')
+        order = np.argsort(timestamps, kind='stable')
+        self._columns = Columns(**{
+            name: merge(name)[order] if name != 'timestamps' else timestamps[order]
+            for name in ('ids', 'timestamps', 'values', 'statuses', 'sources', 'stages')
+        })
+
+    def refresh(self) -> Columns:
+        """
+        Load or patch the snapshot if it is missing or has changed; return its columns.
+
+        Raises:
+            SnapshotUnavailable: When the shared cache is unreachable
+        """
+        if self._columns is not None and time.monotonic() - self._checked < CHECK_INTERVAL:
+            return self._columns
+
+        with self._lock:
+            if self._columns is not None and time.monotonic() - self._checked < CHECK_INTERVAL:
+                return self._columns
+
+            try:
+                version = cache.get(VERSION_KEY)
+            except Exception as e:
+                logger.warning(f"Could not check opportunity snapshot version: {e}")
+                raise SnapshotUnavailable() from e
+
+            if self._columns is None:
+                self.load()
+                CACHE_REQUESTS.inc(cache='opportunity_snapshot', result='miss')
+            elif version != self._version:
+                changes = None
+                if self._version is not None and version is not None and version > self._version:
+                    keys = [CHANGES_KEY.format(version=number) for number in range(self._version + 1, version + 1)]
+                    try:
+                        found = cache.get_many(keys)
+                    except Exception as e:
+                        # Reload rather than guess what changed
+                        logger.warning(f"Could not read opportunity snapshot changes: {e}")
+                        found = {}
+                    if len(found) == len(keys) and all(ids is not None for ids in found.values()):
+                        changes = {pk for ids in found.values() for pk in ids}
+                if changes is None:
+                    self.load()
+                    CACHE_REQUESTS.inc(cache='opportunity_snapshot', result='miss')
+                else:
+                    self.patch(sorted(changes))
+                    CACHE_REQUESTS.inc(cache='opportunity_snapshot', result='hit_shared')
+            else:
+                CACHE_REQUESTS.inc(cache='opportunity_snapshot', result='hit_local')
+
+            self._version = version
+            self._checked = time.monotonic()
+            return self._columns
+
+    @staticmethod
+    def _bounds(timestamps: np.ndarray, start: Optional[datetime], end: Optional[datetime]) -> Tuple[int, int]:
+        low = np.searchsorted(timestamps, _micros(start), 'left') if start else 0
+        high = np.searchsorted(timestamps, _micros(end), 'left') if end else len(timestamps)
+        return int(low), int(high)
+
+    def select(self, start: datetime = None, end: datetime = None, statuses: Sequence[str] = None,
+               stage_names: Sequence[str] = None, sources: Sequence[str] = None,
+               ignore_case: bool = False) -> Tuple[Columns, slice, Optional[np.ndarray]]:
+        """
+        Rows created in `[start, end)` matching the filters.
+
+        Returns:
+            (columns, slice of the range, mask over the slice or None)
+        """
+        columns = self.refresh()
+        rows = slice(*self._bounds(columns.timestamps, start, end))
+
+        mask = None
+        for codes, categories, wanted in (
+            (columns.statuses, self.statuses, statuses),
+            (columns.stages, self.stages, stage_names),
+            (columns.sources, self.sources, sources),
+        ):
+            if wanted is None:
+                continue
+            matches = np.isin(codes[rows], categories.matching(wanted, ignore_case))
+            mask = matches if mask is None else mask & matches
+        return columns, rows, mask
+
+    def aggregate(self, start: datetime = None, end: datetime = None, statuses: Sequence[str] = None,
+                  ignore_case: bool = False, **filters) -> Tuple[int, float]:
+        """(count, sum of value) of the rows `select` returns."""
+        if not any(wanted is not None for wanted in filters.values()):
+            columns = self.refresh()
+            total, by_status = columns.prefix()
+            if statuses is None:
+                low, high = self._bounds(columns.timestamps, start, end)
+                return high - low, float(total[high] - total[low])
+            count, value = 0, 0.0
+            for code in self.statuses.matching(statuses, ignore_case):
+                if code >= len(by_status):
+                    continue
+                timestamps, sums = by_status[code]
+                low, high = self._bounds(timestamps, start, end)
+                count += high - low
+                value += sums[high] - sums[low]
+            return count, float(value)
+
+        columns, rows, mask = self.select(start, end, statuses=statuses, ignore_case=ignore_case, **filters)
+        values = columns.values[rows]
+        if mask is not None:
+            values = values[mask]
+        return len(values), float(np.nansum(values))
+
+    def breakdown(self, start: datetime = None, end: datetime = None,
+                  **filters) -> List[Tuple[Optional[str], int, float]]:
+        """(source, count, sum of value) per `created_by_source`, by descending count."""
+        columns, rows, mask = self.select(start, end, **filters)
+        codes, values = columns.sources[rows], columns.values[rows]
+        if mask is not None:
+            codes, values = codes[mask], values[mask]
+        size = len(self.sources.values)
+        counts = np.bincount(codes, minlength=size)
+        sums = np.bincount(codes, weights=np.nan_to_num(values), minlength=size)
+        order = np.argsort(-counts, kind='stable')
+        return [(self.sources.values[code], int(counts[code]), float(sums[code]))
+                for code in order if counts[code]]
+
+
+opportunity_snapshot = OpportunitySnapshot()
+
+
+def snapshot_enabled() -> bool:
+    return getattr(settings, 'OPPORTUNITY_SNAPSHOT', False)
+
+
+def notify_opportunities_changed(ids: Optional[Iterable[int]] = None) -> None:
+    """
+    Tell every worker's snapshot that opportunities were written or deleted.
+
+    Also keeps replica-routed reads on the primary until the replica has
+    replayed the change (kpi_backend.db_router.record_write).
+
+    Args:
+        ids: Primary keys of the changed opportunities; None when too many
+            changed to list, which makes workers reload
+    """
+    if ids is not None:
+        ids = list(ids)
+        if not ids:
+            return
+        if len(ids) > MAX_PATCH:
+            ids = None
+    record_write()
+    try:
+        cache.add(VERSION_KEY, 0, timeout=None)
+        version = cache.incr(VERSION_KEY)
+        cache.set(CHANGES_KEY.format(version=version), ids, timeout=CHANGES_TIMEOUT)
+    except Exception as e:
+        # Workers reload once the version key is back
+        logger.warning(f"Could not publish opportunity changes: {e}")
+
+
+def _condition(start: datetime = None, end: datetime = None, statuses: Sequence[str] = None,
+               stage_names: Sequence[str] = None, sources: Sequence[str] = None, ignore_case: bool = False) -> Q:
+    condition = Q()
+    if start:
+        condition &= Q(created_timestamp__gte=start)
+    if end:
+        condition &= Q(created_timestamp__lt=end)
+    if statuses is not None:
+        if ignore_case:
+            any_status = Q(pk__in=[])
+            for status in statuses:
+                any_status |= Q(status__iexact=status)
+            condition &= any_status
+        else:
+            condition &= Q(status__in=statuses)
+    if stage_names is not None:
+        condition &= Q(current_stage__name__in=stage_names)
+    if sources is not None:
+        condition &= Q(created_by_source__in=sources)
+    return condition
+
+
+def _filtered(start: datetime = None, end: datetime = None, **filters):
+    return Opportunity.objects.filter(_condition(start, end, **filters))
+
+
+def aggregate_opportunities(start: datetime = None, end: datetime = None, **filters) -> Tuple[int, float]:
+    """
+    Count and sum the value of opportunities created in `[start, end)`.
+
+    Args:
+        start, end: Aware bounds (see date_ranges), either may be None
+        statuses, stage_names, sources: Allowed `status`,
+            `current_stage.name` and `created_by_source` values
+        ignore_case: Compare statuses case-insensitively
+
+    Returns:
+        (count, total value)
+    """
+    if snapshot_enabled():
+        try:
+            return opportunity_snapshot.aggregate(start, end, **filters)
+        except SnapshotUnavailable:
+            pass
+    result = _filtered(start, end, **filters).aggregate(count=Count('id'), total=Sum('value'))
+    return result['count'], result['total'] or 0.0
+
+
+def opportunities_by_source(start: datetime = None, end: datetime = None,
+                            **filters) -> List[Tuple[Optional[str], int, float]]:
+    """(created_by_source, count, total value) of the matching opportunities, by descending count."""
+    if snapshot_enabled():
+        try:
+            return opportunity_snapshot.breakdown(start, end, **filters)
+        except SnapshotUnavailable:
+            pass
+    rows = (
+        _filtered(start, end, **filters).values('created_by_source')
+        .annotate(count=Count('id'), total=Sum('value')).order_by('-count')
+    )
+    return [(row['created_by_source'], row['count'], row['total'] or 0.0) for row in rows]
+
+
+def aggregate_windows(windows: Dict[str, Dict]) -> Dict[str, Tuple[int, float]]:
+    """
+    `aggregate_opportunities` for several windows at once.
+
+    Args:
+        windows: Name -> aggregate_opportunities keyword arguments
+
+    Returns:
+        Name -> (count, total value); from the snapshot's prefix sums, or
+        else from one query with a filtered aggregate per window
+    """
+    if snapshot_enabled():
+        try:
+            return {name: opportunity_snapshot.aggregate(**window) for name, window in windows.items()}
+        except SnapshotUnavailable:
+            pass
+    aggregates = {}
+    for name, window in windows.items():
+        condition = _condition(**window) or None
+        aggregates[f'{name}_count'] = Count('id', filter=condition)
+        aggregates[f'{name}_total'] = Sum('value', filter=condition)
+    result = Opportunity.objects.aggregate(**aggregates)
+    return {name: (result[f'{name}_count'], result[f'{name}_total'] or 0.0) for name in windows}
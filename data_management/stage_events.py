@@ -0,0 +1,273 @@
+"""
+Opportunity stage-change log and the analytics computed over it.
+
+The sync, the opportunity webhooks and the importer append an
+`OpportunityStageEvent` whenever an opportunity shows up in a different
+stage than the one stored, so funnels, conversion and time-in-stage are
+answered from the log instead of from `current_stage`, which only knows
+where opportunities are now.
+`current_stage_totals` covers the charts that are about where they are now.
+"""
+from collections import defaultdict
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from django.db import connection
+from django.db.models import Count, F, Max, Q, Sum
+from django.db.models.functions import Lead
+from django.db.models.expressions import Window
+
+from data_management.mapping import parse_datetime
+from data_management.models import OpportunityStageEvent, PipelineStage
+
+
+def stage_event(opportunity_id: int, values: Dict[str, Any], from_stage_id: Optional[int],
+                record: Dict[str, Any], source: str, now: datetime) -> Optional[OpportunityStageEvent]:
+    """
+    Build the event for an opportunity entering the stage in `values`.
+
+    Args:
+        opportunity_id: Primary key of the opportunity
+        values: Mapped opportunity fields (see OPPORTUNITY_MAPPING)
+        from_stage_id: Stage stored before this update, None if new
+        record: The GHL record, for its `lastStageChangeAt`
+        source: OpportunityStageEvent.SOURCE_*
+        now: Time of the change when GHL does not say
+
+    Returns:
+        Unsaved OpportunityStageEvent, or None when the stage did not change
+    """
+    to_stage_id = values['current_stage_id']
+    if to_stage_id is None or to_stage_id == from_stage_id:
+        return None
+    return OpportunityStageEvent(
+        opportunity_id=opportunity_id,
+        pipeline_id=values['pipeline_id'],
+        from_stage_id=from_stage_id,
+        to_stage_id=to_stage_id,
+        occurred_at=parse_datetime(record.get('lastStageChangeAt')) or now,
+        source=source,
+    )
+
+
+def _stages(pipeline_id: int = None, funnel: bool = False):
+    stages = PipelineStage.objects.select_related('pipeline').order_by('pipeline_id', 'position')
+    if funnel:
+        stages = stages.filter(show_in_funnel=True, pipeline__show_in_funnel=True)
+    if pipeline_id:
+        stages = stages.filter(pipeline_id=pipeline_id)
+    return list(stages)
+
+
+def _group_by_pipeline(stages, row) -> List[Dict[str, Any]]:
+    pipelines = {}
+    for stage in stages:
+        pipeline = pipelines.setdefault(stage.pipeline_id, {
+            'pipeline_id': stage.pipeline_id,
+            'pipeline': stage.pipeline.name,
+            'stages': [],
+        })
+        pipeline['stages'].append({
+            'stage_id': stage.pk,
+            'stage': stage.name,
+            'position': stage.position,
+            **row(stage),
+        })
+    return list(pipelines.values())
+
+
+def _rate(part: int, whole: int) -> Optional[float]:
+    return round(part / whole * 100, 2) if whole else None
+
+
+def stage_funnel(start: datetime, end: datetime, pipeline_id: int = None) -> List[Dict[str, Any]]:
+    """
+    Funnel over the `show_in_funnel` stages of each pipeline.
+
+    An opportunity has reached a stage when it entered that stage or a later
+    one (by position) in `[start, end)`.
+
+    Returns:
+        Per pipeline, its funnel stages with `entered`, `reached` and
+        `conversion` (% of the previous stage's `reached`)
+    """
+    stages = _stages(pipeline_id, funnel=True)
+    events = OpportunityStageEvent.objects.filter(occurred_at__gte=start, occurred_at__lt=end, to_stage__in=stages)
+
+    entered = dict(
+        events.values('to_stage').annotate(count=Count('opportunity', distinct=True))
+        .values_list('to_stage', 'count')
+    )
+
+    # Furthest funnel position each opportunity reached, counted per pipeline
+    furthest = (
+        events.annotate(stage_pipeline=F('to_stage__pipeline_id'))
+        .values('opportunity_id', 'stage_pipeline')
+        .annotate(furthest=Max('to_stage__position'))
+    )
+    sql, params = furthest.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT stage_pipeline, furthest, COUNT(*) FROM ({sql}) AS furthest "
+            f"GROUP BY stage_pipeline, furthest",
+            params
+        )
+        furthest_counts = cursor.fetchall()
+
+    reached = defaultdict(int)
+    for stage in stages:
+        reached[stage.pk] = sum(
+            count for pipeline, position, count in furthest_counts
+            if pipeline == stage.pipeline_id and position >= stage.position
+        )
+
+    previous, last = {}, {}
+    for stage in stages:
+        previous[stage.pk] = last.get(stage.pipeline_id)
+        last[stage.pipeline_id] = stage.pk
+
+    return _group_by_pipeline(stages, lambda stage: {
+        'entered': entered.get(stage.pk, 0),
+        'reached': reached[stage.pk],
+        'conversion': _rate(reached[stage.pk], reached[previous[stage.pk]])
+        if previous[stage.pk] else None,
+    })
+
+
+def _stays(select: str, start: datetime, end: datetime, stages, group_by: str) -> List[tuple]:
+    """
+    Aggregate the stays in `stages` entered in `[start, end)`.
+
+    A stay is an event with the opportunity's next event, from LEAD() over
+    its events: `left_at` and `next_stage_id` are NULL while it lasts.
+    `select` and `group_by` are SQL over the columns `to_stage_id`,
+    `occurred_at`, `left_at` and `next_stage_id`.
+    """
+    window = {
+        'partition_by': [F('opportunity_id')],
+        'order_by': [F('occurred_at').asc(), F('id').asc()],
+    }
+    # Earlier events can't be anyone's next event, so only those are dropped
+    # before the window; the end of the range is applied outside it
+    stays = (
+        OpportunityStageEvent.objects.filter(occurred_at__gte=start)
+        .annotate(
+            left_at=Window(Lead('occurred_at'), **window),
+            next_stage_id=Window(Lead('to_stage_id'), **window),
+        )
+        .values('to_stage_id', 'occurred_at', 'left_at', 'next_stage_id')
+    )
+    sql, params = stays.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT {select} FROM ({sql}) AS stays "
+            f"WHERE occurred_at < %s AND to_stage_id = ANY(%s) GROUP BY {group_by}",
+            (*params, end, [stage.pk for stage in stages])
+        )
+        return cursor.fetchall()
+
+
+def stage_conversion(start: datetime, end: datetime, pipeline_id: int = None) -> List[Dict[str, Any]]:
+    """
+    Where opportunities went after each stage.
+
+    Returns:
+        Per pipeline and stage, how many stays in it began in
+        `[start, end)` (`entered`), and the stages they moved on to
+        (`exits`), each with its count and % of `entered`
+    """
+    stages = _stages(pipeline_id)
+    # Opportunities can move on to a stage of another pipeline
+    names = dict(PipelineStage.objects.values_list('id', 'name'))
+
+    entered = defaultdict(int)
+    exits = defaultdict(list)
+    rows = _stays("to_stage_id, next_stage_id, COUNT(*)", start, end, stages, "to_stage_id, next_stage_id")
+    for stage_id, next_stage_id, count in sorted(rows, key=lambda row: -row[2]):
+        entered[stage_id] += count
+        if next_stage_id is not None:
+            exits[stage_id].append((next_stage_id, count))
+
+    return _group_by_pipeline(stages, lambda stage: {
+        'entered': entered[stage.pk],
+        'exits': [
+            {
+                'stage_id': next_stage_id,
+                'stage': names.get(next_stage_id),
+                'count': count,
+                'rate': _rate(count, entered[stage.pk]),
+            }
+            for next_stage_id, count in exits[stage.pk]
+        ],
+    })
+
+
+def stage_velocity(start: datetime, end: datetime, pipeline_id: int = None) -> List[Dict[str, Any]]:
+    """
+    Time spent in each stage.
+
+    Returns:
+        Per pipeline and stage, how many stays in it began in
+        `[start, end)` (`entered`), how many of them ended (`exited`) or
+        did not (`still_in_stage`), and the average and median hours of
+        the ended ones
+    """
+    stages = _stages(pipeline_id)
+    duration = "EXTRACT(EPOCH FROM left_at - occurred_at)"
+    rows = {
+        row[0]: row[1:] for row in _stays(
+            f"to_stage_id, COUNT(*), COUNT(left_at), AVG({duration}), "
+            f"PERCENTILE_CONT(0.5) WITHIN GROUP (ORDER BY {duration})",
+            start, end, stages, "to_stage_id"
+        )
+    }
+
+    def hours(seconds):
+        return round(float(seconds) / 3600, 2) if seconds is not None else None
+
+    def row(stage):
+        entered, exited, average, median = rows.get(stage.pk, (0, 0, None, None))
+        return {
+            'entered': entered,
+            'exited': exited,
+            'still_in_stage': entered - exited,
+            'avg_hours': hours(average),
+            'median_hours': hours(median),
+        }
+
+    return _group_by_pipeline(stages, row)
+
+
+def current_stage_totals(start: datetime, end: datetime, pipeline_id: int = None,
+                         flag: str = 'show_in_funnel') -> List[Dict[str, Any]]:
+    """
+    Opportunities created in `[start, end)`, by current stage.
+
+    One GROUP BY over the stages whose pipeline and stage have `flag` set
+    (show_in_funnel or show_in_pie_chart), so stages without opportunities
+    are included with zeros.
+
+    Returns:
+        Per pipeline, its stages by position with `count`, `value` and
+        `share` (% of the pipeline's count)
+    """
+    in_range = Q(opportunity__created_timestamp__gte=start, opportunity__created_timestamp__lt=end)
+    stages = (
+        PipelineStage.objects.filter(**{flag: True, f'pipeline__{flag}': True})
+        .select_related('pipeline')
+        .annotate(count=Count('opportunity', filter=in_range), value=Sum('opportunity__value', filter=in_range))
+        .order_by('pipeline_id', 'position')
+    )
+    if pipeline_id:
+        stages = stages.filter(pipeline_id=pipeline_id)
+    stages = list(stages)
+
+    totals = defaultdict(int)
+    for stage in stages:
+        totals[stage.pipeline_id] += stage.count
+
+    return _group_by_pipeline(stages, lambda stage: {
+        'count': stage.count,
+        'value': round(stage.value or 0, 2),
+        'share': _rate(stage.count, totals[stage.pipeline_id]),
+    })
@@ -0,0 +1,129 @@
+"""
+Records every GHL sync as a `SyncRun` row.
+
+The recorder only adds counters and perf_counter() calls to the sync, plus
+one execute_wrapper for DB time, so it stays on for every run. Peak memory
+is the process RSS high-water mark; set SYNC_RUN_TRACEMALLOC to measure the
+Python heap peak of the run itself with tracemalloc instead, at the cost of
+slower allocations.
+"""
+import logging
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import connection
+from django.utils.timezone import now
+
+from data_management.bench.stats import QueryStats, peak_rss_mb
+from data_management.models import SyncRun
+
+logger = logging.getLogger('data_management.helpers')
+
+
+class SyncRunRecorder:
+    """
+    Context manager creating a SyncRun and filling it in as the sync runs.
+
+        with SyncRunRecorder(location_id, SyncRun.MODE_FULL) as run:
+            service.run = run
+            service.sync_all_data()
+    """
+
+    def __init__(self, location_id: str, mode: str, trace_memory: bool = None):
+        self.location_id = location_id
+        self.mode = mode
+        self.trace_memory = (getattr(settings, 'SYNC_RUN_TRACEMALLOC', False)
+                             if trace_memory is None else trace_memory)
+        self.sync_run = None
+        self.queries = QueryStats()
+        self.api_seconds = 0.0
+        self.transform_seconds = 0.0
+        self.pages = 0
+        self.counts = {'fetched': 0, 'created': 0, 'updated': 0, 'skipped': 0}
+        self.phases = {}
+        self._started = None
+        self._wrapper = None
+        self._started_tracing = False
+
+    def __enter__(self):
+        self.sync_run = SyncRun.objects.create(
+            location_id=self.location_id,
+            mode=self.mode,
+            started_at=now(),
+        )
+        self._started = time.perf_counter()
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+        self._wrapper = connection.execute_wrapper(self.queries)
+        self._wrapper.__enter__()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._wrapper.__exit__(exc_type, exc, tb)
+
+        if self._started_tracing:
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            peak_memory = peak / (1024 * 1024)
+        else:
+            peak_memory = peak_rss_mb()
+
+        run = self.sync_run
+        run.status = SyncRun.STATUS_FAILED if exc_type else SyncRun.STATUS_SUCCESS
+        run.error = f"{exc_type.__name__}: {exc}" if exc_type else ''
+        run.finished_at = now()
+        run.duration_seconds = time.perf_counter() - self._started
+        run.pages = self.pages
+        run.records_fetched = self.counts['fetched']
+        run.records_created = self.counts['created']
+        run.records_updated = self.counts['updated']
+        run.records_skipped = self.counts['skipped']
+        run.api_seconds = self.api_seconds
+        run.db_seconds = self.queries.duration
+        run.transform_seconds = self.transform_seconds
+        run.peak_memory_mb = round(peak_memory, 1)
+        run.phases = self.phases
+        try:
+            run.save()
+        except Exception as e:
+            # Never hide the sync's own outcome behind a bookkeeping failure
+            logger.error(f"Could not save sync run {run.pk}: {e}")
+        return False
+
+    @contextmanager
+    def phase(self, name: str):
+        """
+        Time a phase. Time in `sync_*` phases not spent in the database is
+        counted as transform time.
+        """
+        started = time.perf_counter()
+        db_before, queries_before, api_before = self.queries.duration, self.queries.count, self.api_seconds
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - started
+            db_seconds = self.queries.duration - db_before
+            api_seconds = self.api_seconds - api_before
+            if name.startswith('sync_'):
+                self.transform_seconds += max(seconds - db_seconds, 0)
+            self.phases[name] = {
+                'seconds': round(seconds, 3),
+                'api_seconds': round(api_seconds, 3),
+                'db_seconds': round(db_seconds, 3),
+                'queries': self.queries.count - queries_before,
+            }
+
+    def api_call(self, seconds: float) -> None:
+        self.api_seconds += seconds
+
+    def page(self, records: int) -> None:
+        self.pages += 1
+        self.counts['fetched'] += records
+
+    def count(self, created: int = 0, updated: int = 0, skipped: int = 0) -> None:
+        self.counts['created'] += created
+        self.counts['updated'] += updated
+        self.counts['skipped'] += skipped
@@ -1,3 +1,439 @@
-from django.test import TestCase
+import logging
+import os
+import random
+import tempfile
+import time
+import zoneinfo
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from unittest import mock
 
-# Create your tests here.
+import pandas as pd
+from django.core.cache import cache
+from django.db.models import Q
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from accounts.models import GHLAuthCredentials
+from data_management import data_version, date_ranges, logs, snapshot
+from data_management.imports import ImportResult, OpportunityImporter
+from data_management.mapping import CONTACT_MAPPING, OPPORTUNITY_MAPPING
+from data_management.models import Contact, Opportunity, OpportunityStageEvent, Pipeline, PipelineStage
+from kpi_backend import db_router
+
+
+NOW = datetime(2026, 1, 1, tzinfo=dt_timezone.utc)
+
+LOOKUPS = {
+    'contact': {'c1': 1, 'c2': 2},
+    'pipeline': {'p1': 10},
+    'stage': {'s1': 100, 's2': 101},
+}
+
+CONTACTS = [
+    {'id': 'c1', 'firstName': ' Ada ', 'lastName': 'Lovelace', 'email': 'ada@example.com',
+     'phone': '+61400000000', 'dateAdded': '2024-05-01T03:04:05.678Z', 'tags': ['vip'], 'source': 'Referral'},
+    {'id': 'c2', 'firstName': None, 'lastName': '', 'email': '', 'tags': None, 'source': None,
+     'dateAdded': None, 'createdAt': '2024-05-01 03:04:05'},
+    {'id': 'c3', 'dateAdded': '2024-05-01T03:04:05+10:00', 'country': 'AUSTRALIA'},
+    {'id': 'c4', 'dateAdded': '2024-05-01T03:04:05,5+00:00', 'address': ' 1 Long Street ' * 30},
+    {'id': 'c5', 'dateAdded': 'not a date', 'createdAt': '2024-05-01'},
+    {'id': 'c6', 'dateAdded': '01/05/2024'},
+    {'id': 'c7', 'dateAdded': '2024-10-06T02:30:00'},
+]
+
+OPPORTUNITIES = [
+    {'id': 'o1', 'contactId': 'c1', 'pipelineId': 'p1', 'pipelineStageId': 's1', 'source': 'Google Ads',
+     'createdAt': '2024-05-01T03:04:05.678Z', 'monetaryValue': 1200.5, 'assignedTo': 'u1',
+     'tags': ['a', 'b'], 'engagementScore': '7.9', 'status': 'open', 'name': 'Deal'},
+    {'id': 'o2', 'contactId': 'c2', 'pipelineId': 'missing', 'pipelineStageId': None, 'source': '',
+     'createdAt': None, 'monetaryValue': '', 'tags': None, 'engagementScore': None, 'status': ''},
+    {'id': 'o3', 'contactId': 'unknown', 'createdAt': '2024-05-01 03:04:05', 'monetaryValue': 'abc',
+     'engagementScore': 'x'},
+    {'id': 'o4', 'contactId': 'c1', 'pipelineStageId': 's2', 'createdAt': 'yesterday', 'monetaryValue': '99'},
+    {'id': 'o5', 'contactId': 'c2', 'createdAt': '2024-05-01T03:04:05,25Z', 'engagementScore': 3},
+]
+
+
+class MappingParityTests(SimpleTestCase):
+    """The columnar mode must store exactly what the row mode stores."""
+
+    def assertSameRows(self, mapping, records, lookups=None):
+        rows = mapping.many(records, lookups, NOW)
+        columnar = mapping.many(records, lookups, NOW, columnar=True)
+        self.assertEqual(len(rows), len(columnar))
+        for record, row, column_row in zip(records, rows, columnar):
+            with self.subTest(id=record['id']):
+                self.assertEqual(row, column_row)
+                for field, value in row.items():
+                    self.assertIs(type(value), type(column_row[field]), field)
+
+    def test_contacts(self):
+        self.assertSameRows(CONTACT_MAPPING, CONTACTS)
+
+    def test_opportunities(self):
+        self.assertSameRows(OPPORTUNITY_MAPPING, OPPORTUNITIES, LOOKUPS)
+
+    def test_explicit_null_and_missing_keys(self):
+        rows = OPPORTUNITY_MAPPING.many([{'id': 'a', 'tags': None}, {'id': 'b'}], LOOKUPS, NOW, columnar=True)
+        self.assertEqual([row['tags'] for row in rows], ['None', '[]'])
+        rows = CONTACT_MAPPING.many([{'id': 'a', 'tags': None}, {'id': 'b'}], None, NOW, columnar=True)
+        self.assertEqual([row['tags'] for row in rows], [None, []])
+
+    def test_django_date_formats(self):
+        row, = OPPORTUNITY_MAPPING.many([{'id': 'a', 'createdAt': '2024-05-01T03:04:05,25Z'}], LOOKUPS, NOW,
+                                        columnar=True)
+        self.assertEqual(row['created_timestamp'], datetime(2024, 5, 1, 3, 4, 5, 250000, tzinfo=dt_timezone.utc))
+
+
+def _contact():
+    return Contact.objects.create(contact_id='c1', first_name='Ada', last_name='Lovelace', full_name_lowercase='ada',
+                                  phone='', address='', country='', source='', date_added=NOW, date_updated=NOW)
+
+
+class OpportunityImportStageEventTests(TestCase):
+
+    def setUp(self):
+        _contact()
+        pipeline = Pipeline.objects.create(name='Sales', pipeline_id='p1', date_added=NOW, date_updated=NOW)
+        self.new, self.won = (
+            PipelineStage.objects.create(pipeline=pipeline, name=name, pipeline_stage_id=ref, position=position)
+            for position, (name, ref) in enumerate([('New', 's1'), ('Won', 's2')])
+        )
+
+    def _import(self, stage_ref):
+        chunk = pd.DataFrame([{
+            'Opportunity ID': 'o1', 'Contact ID': 'c1', 'Pipeline ID': 'p1', 'Pipeline Stage ID': stage_ref,
+            'Created on': '2024-05-01T03:04:05Z', 'Lead Value': '100',
+        }])
+        OpportunityImporter()(chunk, ImportResult())
+
+    def test_stage_changes_are_logged(self):
+        self._import('s1')
+        self._import('s1')
+        self._import('s2')
+        opportunity = Opportunity.objects.get(opportunity_id='o1')
+        events = list(OpportunityStageEvent.objects.order_by('id')
+                      .values_list('opportunity_id', 'from_stage_id', 'to_stage_id', 'source'))
+        self.assertEqual(events, [
+            (opportunity.pk, None, self.new.pk, OpportunityStageEvent.SOURCE_IMPORT),
+            (opportunity.pk, self.new.pk, self.won.pk, OpportunityStageEvent.SOURCE_IMPORT),
+        ])
+        self.assertEqual(OpportunityStageEvent.objects.order_by('id').first().occurred_at,
+                         datetime(2024, 5, 1, 3, 4, 5, tzinfo=dt_timezone.utc))
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+                   REPLICA_MAX_LAG=5.0)
+class ReadDatabaseTests(SimpleTestCase):
+
+    def setUp(self):
+        cache.clear()
+        patcher = mock.patch.object(db_router, 'replica_configured', return_value=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def read_database(self, lag=0.0, at=None):
+        with mock.patch.object(db_router, 'replica_lag', return_value=lag), \
+                mock.patch.object(db_router.time, 'time', return_value=at or time.time()):
+            return db_router.read_database()
+
+    def test_replica_when_healthy(self):
+        self.assertEqual(self.read_database(), db_router.REPLICA)
+
+    def test_primary_right_after_a_write(self):
+        db_router.record_write()
+        self.assertEqual(self.read_database(lag=0.0), 'default')
+        self.assertEqual(self.read_database(lag=0.0, at=time.time() + 6), db_router.REPLICA)
+
+    def test_primary_when_replica_lags_or_is_down(self):
+        self.assertEqual(self.read_database(lag=6.0), 'default')
+        self.assertEqual(self.read_database(lag=None), 'default')
+
+    def test_unconfigured(self):
+        with mock.patch.object(db_router, 'replica_configured', return_value=False):
+            self.assertEqual(db_router.read_database(), 'default')
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+                   REPLICA_MAX_LAG=5.0)
+class ConditionalGetTests(TestCase):
+    url = '/api/data/opportunities/?fields=opportunity_id'
+
+    def setUp(self):
+        cache.clear()
+        data_version._locations = (0.0, None)
+        GHLAuthCredentials.objects.create(user_id='u', location_id='loc', access_token='a', refresh_token='r',
+                                          expires_in=0)
+        self.contact = _contact()
+
+    def add(self, opportunity_id):
+        Opportunity.objects.create(contact=self.contact, opportunity_id=opportunity_id, created_by_source='',
+                                   created_by_channel='', source_id='', created_timestamp=NOW)
+
+    def get(self, etag=None):
+        headers = {'HTTP_IF_NONE_MATCH': etag} if etag else {}
+        return self.client.get(self.url, **headers)
+
+    def ids(self, response):
+        return [row['opportunity_id'] for row in response.json()['results']]
+
+    def test_not_modified_until_bumped(self):
+        self.add('o1')
+        response = self.get()
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        self.assertEqual(self.get(etag).status_code, 304)
+
+        self.add('o2')
+        data_version.bump_data_version('loc')
+        response = self.get(etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(sorted(self.ids(response)), ['o1', 'o2'])
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(self.get(response['ETag']).status_code, 304)
+
+    def test_media_types_have_their_own_etags(self):
+        json_response = self.client.get(self.url, HTTP_ACCEPT='application/json')
+        html_response = self.client.get(self.url, HTTP_ACCEPT='text/html')
+        self.assertEqual(html_response['Content-Type'], 'text/html; charset=utf-8')
+        self.assertNotEqual(json_response['ETag'], html_response['ETag'])
+        self.assertIn('Accept', json_response['Vary'])
+
+        response = self.client.get(self.url, HTTP_ACCEPT='text/html', HTTP_IF_NONE_MATCH=json_response['ETag'])
+        self.assertEqual(response.status_code, 200)
+        not_modified = self.client.get(self.url, HTTP_ACCEPT='application/json',
+                                       HTTP_IF_NONE_MATCH=json_response['ETag'])
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertIn('Accept', not_modified['Vary'])
+
+    def test_versions_are_per_location(self):
+        etag = self.get()['ETag']
+        data_version.bump_data_version('other')
+        self.assertEqual(self.get(etag).status_code, 304)
+        data_version.bump_data_version()
+        self.assertEqual(self.get(etag).status_code, 200)
+
+    def test_fresh_data_is_read_from_the_primary_after_a_bump(self):
+        # There is no replica database here: reads routed to it would fail
+        with mock.patch.object(db_router, 'replica_configured', return_value=True), \
+                mock.patch.object(db_router, 'replica_lag', return_value=0.0):
+            self.add('o1')
+            data_version.bump_data_version('loc')
+            response = self.get()
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(self.ids(response), ['o1'])
+            self.assertEqual(self.get(response['ETag']).status_code, 304)
+
+
+SYDNEY = zoneinfo.ZoneInfo('Australia/Sydney')
+
+
+@mock.patch.object(date_ranges, 'location_timezone', return_value=SYDNEY)
+class ParseDateRangeTests(SimpleTestCase):
+
+    def assertBounds(self, date_range, start, end):
+        self.assertEqual((date_range.start.astimezone(dt_timezone.utc), date_range.end.astimezone(dt_timezone.utc)),
+                         (start, end))
+
+    def test_local_midnights(self, _):
+        date_range = date_ranges.parse_date_range({'start_date': '2026-01-01', 'end_date': '2026-01-31'})
+        self.assertBounds(date_range, datetime(2025, 12, 31, 13, tzinfo=dt_timezone.utc),
+                          datetime(2026, 1, 31, 13, tzinfo=dt_timezone.utc))
+        self.assertEqual((date_range.first_day, date_range.last_day), (date(2026, 1, 1), date(2026, 1, 31)))
+
+    def test_daylight_saving_days(self, _):
+        # Clocks go forward on 2025-10-05 and back on 2026-04-05
+        for day, hours in (('2025-10-05', 23), ('2026-04-05', 25), ('2026-04-06', 24)):
+            with self.subTest(day=day):
+                date_range = date_ranges.parse_date_range({'start_date': day, 'end_date': day})
+                start, end = (bound.astimezone(dt_timezone.utc) for bound in date_range)
+                self.assertEqual(end - start, timedelta(hours=hours))
+                self.assertEqual(date_range.first_day, date_range.last_day)
+                self.assertEqual(date_range.end.astimezone(SYDNEY).time(), datetime.min.time())
+
+    def test_half_open(self, _):
+        date_range = date_ranges.parse_date_range({'start_date': '2025-10-04', 'end_date': '2025-10-05'})
+        self.assertEqual(date_range.filter('created_timestamp'),
+                         Q(created_timestamp__gte=date_range.start) & Q(created_timestamp__lt=date_range.end))
+        # Consecutive ranges meet without a gap or an overlap
+        following = date_ranges.parse_date_range({'start_date': '2025-10-06', 'end_date': '2025-10-06'})
+        self.assertEqual(date_range.end, following.start)
+
+    def test_invalid_and_missing_dates(self, _):
+        with self.assertRaises(ValueError):
+            date_ranges.parse_date_range({'start_date': '05/10/2025', 'end_date': '2025-10-06'})
+        default = date_ranges.DateRange(None, None)
+        self.assertIs(date_ranges.parse_date_range({'start_date': '2025-10-06'}, default), default)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class OpportunitySnapshotParityTests(TestCase):
+    """aggregate_opportunities and friends must give the same answers with and without the snapshot."""
+
+    @classmethod
+    def setUpTestData(cls):
+        rng = random.Random(1)
+        contact = _contact()
+        pipeline = Pipeline.objects.create(name='Sales', pipeline_id='p1', date_added=NOW, date_updated=NOW)
+        stages = [PipelineStage.objects.create(pipeline=pipeline, name=name, position=position)
+                  for position, name in enumerate(['New', 'Quoted', 'Won'])]
+        Opportunity.objects.bulk_create(
+            Opportunity(contact=contact, pipeline=pipeline, opportunity_id=f'o{i}',
+                        current_stage=rng.choice(stages + [None]),
+                        created_by_source=rng.choice(['Google Ads', 'Referral', '']), created_by_channel='',
+                        source_id='', created_timestamp=NOW - timedelta(hours=rng.uniform(-48, 24 * 400)),
+                        value=rng.choice([None, round(rng.uniform(0, 1000), 2)]),
+                        status=rng.choice(['won', 'Won', 'open', 'lost', None]))
+            for i in range(500)
+        )
+
+    def setUp(self):
+        cache.clear()
+        patcher = mock.patch.object(snapshot, 'opportunity_snapshot', snapshot.OpportunitySnapshot())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def both(self, function, *args, **kwargs):
+        with override_settings(OPPORTUNITY_SNAPSHOT=False):
+            expected = function(*args, **kwargs)
+        with override_settings(OPPORTUNITY_SNAPSHOT=True):
+            return expected, function(*args, **kwargs)
+
+    def assertAggregatesEqual(self, expected, actual):
+        self.assertEqual(expected[0], actual[0])
+        self.assertAlmostEqual(expected[1], actual[1], places=6)
+
+    def test_aggregate_opportunities(self):
+        month = NOW - timedelta(days=30)
+        for filters in (
+            {},
+            {'start': month},
+            {'start': month, 'end': NOW},
+            {'end': NOW - timedelta(days=365)},
+            {'start': month, 'statuses': ['won']},
+            {'statuses': ['won'], 'ignore_case': True},
+            {'statuses': ['missing']},
+            {'start': month, 'statuses': ['won', 'open'], 'stage_names': ['Won']},
+            {'sources': ['Referral'], 'stage_names': ['New', 'Quoted']},
+        ):
+            with self.subTest(**filters):
+                self.assertAggregatesEqual(*self.both(snapshot.aggregate_opportunities, **filters))
+
+    def test_aggregate_windows_and_sources(self):
+        windows = {'all': {}, 'month': {'start': NOW - timedelta(days=30)},
+                   'won': {'statuses': ['won', 'Won'], 'end': NOW}}
+        expected, actual = self.both(snapshot.aggregate_windows, windows)
+        for name in windows:
+            self.assertAggregatesEqual(expected[name], actual[name])
+
+        expected, actual = self.both(snapshot.opportunities_by_source, NOW - timedelta(days=90), NOW)
+        self.assertEqual({source: count for source, count, _ in expected},
+                         {source: count for source, count, _ in actual})
+
+    def test_patched_snapshot(self):
+        with override_settings(OPPORTUNITY_SNAPSHOT=True):
+            snapshot.aggregate_opportunities()
+        changed = Opportunity.objects.filter(status='open').order_by('id')[:5]
+        ids = [opportunity.pk for opportunity in changed]
+        Opportunity.objects.filter(pk__in=ids[:3]).update(status='won', value=10, created_timestamp=NOW)
+        Opportunity.objects.filter(pk__in=ids[3:]).delete()
+        snapshot.notify_opportunities_changed(ids)
+        with mock.patch.object(snapshot, 'CHECK_INTERVAL', 0):
+            self.assertAggregatesEqual(*self.both(snapshot.aggregate_opportunities, statuses=['won']))
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class OpportunitySnapshotCacheDownTests(TestCase):
+    """Without the shared cache the snapshot cannot tell if it is current, so the queries answer."""
+
+    def setUp(self):
+        cache.clear()
+        patcher = mock.patch.object(snapshot, 'opportunity_snapshot', snapshot.OpportunitySnapshot())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        contact = _contact()
+        for i, status in enumerate(['won', 'won', 'open']):
+            Opportunity.objects.create(contact=contact, opportunity_id=f'o{i}', created_by_source='Referral',
+                                       created_by_channel='', source_id='', created_timestamp=NOW, value=100,
+                                       status=status)
+
+    def cache_down(self):
+        down = mock.Mock(**{'get.side_effect': ConnectionError('cache down'),
+                            'get_many.side_effect': ConnectionError('cache down')})
+        return mock.patch.object(snapshot, 'cache', down)
+
+    @override_settings(OPPORTUNITY_SNAPSHOT=True)
+    def test_aggregates_fall_back_to_queries(self):
+        snapshot.aggregate_opportunities()
+        Opportunity.objects.filter(status='open').update(status='won')
+        with self.cache_down(), mock.patch.object(snapshot, 'CHECK_INTERVAL', 0):
+            self.assertEqual(snapshot.aggregate_opportunities(statuses=['won']), (3, 300.0))
+            self.assertEqual(snapshot.aggregate_windows({'won': {'statuses': ['won']}}), {'won': (3, 300.0)})
+            self.assertEqual(snapshot.opportunities_by_source(), [('Referral', 3, 300.0)])
+
+    @override_settings(OPPORTUNITY_SNAPSHOT=True)
+    def test_dashboard_answers(self):
+        with self.cache_down():
+            for url in ('/api/data/dashboard/', '/api/data/revenue-metrics/'):
+                with self.subTest(url=url):
+                    self.assertEqual(self.client.get(url).status_code, 200)
+
+
+class LogsTests(SimpleTestCase):
+    """tail() and search() over a log with a rotated segment."""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'sync.log')
+
+        handler = logs.IndexedRotatingFileHandler(self.path, maxBytes=400, backupCount=3)
+        handler.setFormatter(logging.Formatter('{levelname} {asctime} {message}', style='{'))
+        self.addCleanup(handler.close)
+        for name in ('data_management.helpers', 'accounts.tasks'):
+            logger = logging.Logger(name)
+            logger.addHandler(handler)
+            setattr(self, name.split('.')[0], logger)
+
+        for i in range(6):
+            self.data_management.info(f"batch {i}")
+        self.accounts.error("webhook failed\nTraceback (most recent call last):\nKeyError: 'id'")
+        for i in range(6, 12):
+            self.data_management.info(f"batch {i}")
+        self.data_management.warning("slow batch 12")
+
+    def test_fixture_is_rotated(self):
+        self.assertGreater(len(logs.log_segments(self.path)), 1)
+
+    def test_tail_continues_into_rotated_segments(self):
+        lines = logs.tail(self.path, lines=100)
+        messages = [line.split(' ', 3)[-1] for line in lines]
+        self.assertEqual(messages[0], 'batch 0')
+        self.assertEqual(messages[-1], 'slow batch 12')
+        self.assertEqual(len(lines), 16)
+        self.assertEqual(logs.tail(self.path, lines=2), lines[-2:])
+
+    def test_tail_keeps_tracebacks_with_their_record(self):
+        lines = logs.tail(self.path, level='ERROR')
+        self.assertEqual(len(lines), 3)
+        self.assertTrue(lines[0].startswith('ERROR'))
+        self.assertEqual(lines[-1], "KeyError: 'id'")
+        self.assertEqual(logs.tail(self.path, contains='KeyError'), lines)
+
+    def test_search(self):
+        records = logs.search(self.path, level='WARNING')
+        self.assertEqual([record['level'] for record in records], ['WARNING', 'ERROR'])
+        self.assertIn("KeyError: 'id'", records[1]['message'])
+        self.assertNotEqual(records[0]['file'], records[1]['file'])
+
+        self.assertEqual(len(logs.search(self.path, logger='accounts.tasks')), 1)
+        self.assertEqual([record['message'].split(' ', 3)[-1] for record in logs.search(self.path, contains='batch 1')],
+                         ['slow batch 12', 'batch 11', 'batch 10', 'batch 1'])
+        self.assertEqual(len(logs.search(self.path, limit=3)), 3)
+        self.assertEqual(logs.search(self.path, start=time.time() + 60), [])
+
+    def test_search_builds_missing_indexes(self):
+        expected = logs.search(self.path, level='WARNING')
+        for segment in logs.log_segments(self.path):
+            os.remove(segment + logs.INDEX_SUFFIX)
+        records = logs.search(self.path, level='WARNING')
+        self.assertEqual([record['message'] for record in records], [record['message'] for record in expected])
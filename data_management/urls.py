@@ -1,11 +1,25 @@
 from django.urls import path
-from .views import DashboardAPIView,view_logs, RevenueMetricsView,OpportunityListGenericView
+from .views import (
+    DashboardAPIView,view_logs, search_logs, RevenueMetricsView,OpportunityListGenericView, OpportunityExportView,
+    SyncRunListView, SyncRunTrendsView, StageFunnelView, StageConversionView, StageVelocityView,
+    FunnelChartView, PieChartView, AsyncDashboardView,
+)
 
 urlpatterns = [
     path('dashboard/', DashboardAPIView.as_view(), name='dashboard-api'),
+    path('dashboard/async/', AsyncDashboardView.as_view(), name='dashboard-async'),
     path('admin/logs/', view_logs, name='view_logs'),
+    path('admin/logs/search/', search_logs, name='search_logs'),
     path("revenue-metrics/", RevenueMetricsView.as_view(), name="revenue-metrics"),
     path('opportunities/', OpportunityListGenericView.as_view(), name='opportunity-list'),
+    path('opportunities/export/<str:export_format>/', OpportunityExportView.as_view(), name='opportunity-export'),
+    path('sync-runs/', SyncRunListView.as_view(), name='sync-run-list'),
+    path('sync-runs/trends/', SyncRunTrendsView.as_view(), name='sync-run-trends'),
+    path('stages/funnel/', StageFunnelView.as_view(), name='stage-funnel'),
+    path('stages/conversion/', StageConversionView.as_view(), name='stage-conversion'),
+    path('stages/velocity/', StageVelocityView.as_view(), name='stage-velocity'),
+    path('charts/funnel/', FunnelChartView.as_view(), name='funnel-chart'),
+    path('charts/pie/', PieChartView.as_view(), name='pie-chart'),
 
     # path("get-details/")
 ]
\ No newline at end of file
@@ -5,139 +5,12 @@
 # from django.db import transaction
 # from django.utils.timezone import make_aware,now, is_naive
 
+# Contact/opportunity exports are imported with `manage.py import_ghl_export`
+# (see data_management/imports.py), which replaced the row-by-row
+# fetch_contact_xlsx / fetch_opportunities_xlsx importers.
 
 
 
-# def fetch_contact_xlsx():
-  
-#     filepath = "/Users/rojinsaji/Downloads/antonio_contacts.xlsx"
-
-#     try:
-#         df = pd.read_excel(filepath)
-#     except Exception as e:
-#         print(f"Error reading Excel file: {e}")
-#         return
-
-#     for _, row in df.iterrows():
-#         # print(row)
-#         # break
-        
-#         try:
-#             first_name = str(row.get("First Name", "")).strip()
-#             contact_id = str(row.get("Contact Id", "")).strip()
-#             last_name = str(row.get("Last Name", "")).strip()
-#             full_name_lowercase = f"{first_name} {last_name}".lower()
-#             email = str(row.get("Email", "")).strip()
-#             phone = str(row.get("Phone", "")).strip().split(".")[0]  # Remove decimal
-#             address = str(row.get("Address (full)", "")).strip()
-#             country = str(row.get("Country", "")).strip()[:10]  # Ensure within max_length
-#             source = str(row.get("Source", "")).strip()
-#             tags = []  # Since 'Tags' is NaN in your sample, you can improve this later
-#             date_added_str = str(row.get("Created", "")).strip()
-#             # date_added = pd.to_datetime(date_added_str, errors='coerce') or datetime.now()
-#             date_added = pd.to_datetime(date_added_str, errors='coerce')
-#             if pd.isna(date_added):
-#                 date_added = now()
-#             elif is_naive(date_added):
-#                 date_added = make_aware(date_added)
-
-#             contact = Contact(
-#                 contact_id=contact_id,
-#                 first_name=first_name,
-#                 last_name=last_name,
-#                 full_name_lowercase=full_name_lowercase,
-#                 email=email,
-#                 phone=phone,
-#                 address=address,
-#                 country=country,
-#                 tags=tags,
-#                 source=source,
-#                 date_added=date_added,
-#                 date_updated=datetime.now(),
-#             )
-#             contact.save()
-#             print(f"Saved contact: {contact}")
-#         except Exception as e:
-#             print(f"Failed to save contact for row {row}: {e}")
-
-
-# def fetch_opportunities_xlsx():
-#     filepath = "/Users/rojinsaji/Downloads/opportunities-_19_.xlsx"
-#     try:
-#         df = pd.read_excel(filepath)
-#     except Exception as e:
-#         print(f"Error reading Excel file: {e}")
-#         return
-
-#     for _, row in df.iterrows():
-#         # print(row)
-#         # break
-#         try:
-#             contact_name = str(row.get("Contact Name")).strip()
-#             contact_id = str(row.get("Contact ID")).strip()
-           
-
-
-#             contact = Contact.objects.get(
-#                 contact_id=contact_id,
-#             )
-
-#             pipeline_id = str(row.get("Pipeline ID")).strip()
-#             pipeline = Pipeline.objects.get(
-#                 pipeline_id=pipeline_id,
-#             )
-
-#             stage_id = str(row.get("Pipeline Stage ID")).strip()
-#             stage = PipelineStage.objects.get(
-#                 pipeline_stage_id=stage_id,
-#             )
-
-#             # Parse dates
-#             created_on = row.get("Created on")
-#             if not pd.isnull(created_on):
-#                 created_on = pd.to_datetime(created_on)
-#                 if created_on.tzinfo is None or created_on.tzinfo.utcoffset(created_on) is None:
-#                     created_on = make_aware(created_on)
-
-#             # Create or update Opportunity
-#             opportunity_id = str(row.get("Opportunity ID")).strip()
-#             source = str(row.get("source")).strip()
-#             value = float(row.get("Lead Value"))
-#             assigned = str(row.get("assigned")).strip()
-#             tags = str(row.get("tags")).strip()
-#             engagement_score = str(row.get("Engagement Score")).strip()
-#             status = str(row.get("status")).strip()
-#             description = str(row.get("Job Description")).strip()
-#             address = str(row.get("Street Address")).strip()
-#             status = str(row.get("status")).strip()
-
-#             Opportunity.objects.update_or_create(
-#                 opportunity_id=opportunity_id,
-#                 defaults={
-#                     "contact": contact,
-#                     "pipeline": pipeline,
-#                     "current_stage": stage,
-#                     "created_by_source": source,
-#                     "created_by_channel": "xlsx_import",  # Arbitrary channel
-#                     "source_id": source,
-#                     "created_timestamp": created_on if created_on else make_aware(datetime.now()),
-#                     "value":value,
-#                     "assigned":assigned,
-#                     "tags":tags,
-#                     "engagement_score":engagement_score,
-#                     "status":status,
-#                     "address":address,
-#                     "description":description
-
-#                 }
-#             )
-
-#             print(f"Saved opportunity: {opportunity_id} for {contact_name}")
-
-#         except Exception as e:
-#             print(f"Failed to save row: {row}\nError: {e}")
-
-
 # pipelines_dict = {
 #   "pipelines": [
 #     {
@@ -4,7 +4,7 @@ from rest_framework import status
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework.filters import SearchFilter, OrderingFilter
 from django.db.models import Sum, Count, Avg, F, Q
-from django.db.models.functions import TruncMonth, ExtractMonth, ExtractYear
+from django.db.models.functions import TruncMonth
 from datetime import datetime, timedelta
 from dateutil.relativedelta import relativedelta
 import calendar
@@ -16,9 +16,17 @@ from django.utils.timezone import now
 from rest_framework.views import APIView
 from .serializers import RevenueMetricsSerializer, OpportunitySerializer
 from rest_framework.permissions import AllowAny
+from kpi_backend.db_router import replica_reads
+from kpi_backend.instrumentation import query_budget, section
+from .data_version import conditional_get
+from .date_ranges import day_range, local_now, local_today, midnight, parse_date_range
+from .snapshot import aggregate_opportunities, aggregate_windows, opportunities_by_source, snapshot_enabled
 
 
 
+@query_budget(20)
+@replica_reads
+@conditional_get
 class DashboardAPIView(GenericAPIView):
     serializer_class = DashboardSerializer
     filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
@@ -30,21 +38,8 @@ class DashboardAPIView(GenericAPIView):
     def get(self, request, *args, **kwargs):
         # Parse date parameters with validation
         try:
-            start_date = request.query_params.get('start_date')
-            end_date = request.query_params.get('end_date')
-
-
-            
-            if not start_date or not end_date:
-                start_date, end_date = self.get_default_date_range()
-
-              
-            start_date = datetime.strptime(start_date, '%Y-%m-%d')
-            end_date = datetime.strptime(end_date, '%Y-%m-%d')
-            
-            # Ensure end_date is inclusive by setting it to the end of the day
-            end_date = end_date.replace(hour=23, minute=59, second=59)
-            
+            # Whole days in the location's timezone, as [start, end)
+            date_range = parse_date_range(request.query_params)
         except ValueError:
             return Response(
                 {"error": "Invalid date format. Use YYYY-MM-DD format"}, 
@@ -53,45 +48,56 @@ class DashboardAPIView(GenericAPIView):
         
         # Get all data for the dashboard
         dashboard_data = {
-            "revenue_trend": self.get_revenue_trend(start_date, end_date),
-            "cash_collected": self.get_cash_collected(start_date, end_date),
+            "revenue_trend": self.get_revenue_trend(date_range),
+            "cash_collected": self.get_cash_collected(date_range),
             "projected_revenue": self.get_projected_revenue(),
-            "pipeline_value": self.get_pipeline_value(start_date, end_date),
-            "sales_performance": self.get_sales_performance(start_date, end_date),
-            "lead_source_breakdown": self.get_lead_source_breakdown(start_date, end_date),
+            "pipeline_value": self.get_pipeline_value(date_range),
+            "sales_performance": self.get_sales_performance(date_range),
+            "lead_source_breakdown": self.get_lead_source_breakdown(date_range),
             "cashflow_snapshot": self.get_cashflow_snapshot(),
             
         }
         
-        serializer = self.get_serializer(dashboard_data)
-        return Response(serializer.data)
+        with section('serialize'):
+            data = self.get_serializer(dashboard_data).data
+        return Response(data)
     
-    def get_revenue_trend(self, start_date, end_date):
+    @section('revenue_trend')
+    def get_revenue_trend(self, date_range):
         """Generate revenue trend data grouped by month within date range"""
-        # Get opportunities in date range with won status
-        opportunities = Opportunity.objects.filter(
-            created_timestamp__gte=start_date,
-            created_timestamp__lte=end_date,
-            # status='won'
-        ).annotate(
-            month=ExtractMonth('created_timestamp'),
-            year=ExtractYear('created_timestamp')
-        )
-        
         # Create a dictionary to store the aggregated data
         monthly_revenue = defaultdict(float)
-        
-        # Aggregate the values by month and year
-        for opportunity in opportunities:
-            key = (opportunity.year, opportunity.month)
-            monthly_revenue[key] += opportunity.value or 0
+
+        tz = date_range.start.tzinfo
+        first_month = date_range.first_day.replace(day=1)
+
+        if snapshot_enabled():
+            # One range sum per month over the snapshot
+            month = first_month
+            while month <= date_range.last_day:
+                next_month = month + relativedelta(months=1)
+                monthly_revenue[(month.year, month.month)] = aggregate_opportunities(
+                    max(midnight(month, tz), date_range.start), min(midnight(next_month, tz), date_range.end)
+                )[1]
+                month = next_month
+        else:
+            # Plain GROUP BY over the precomputed local creation month
+            months = Opportunity.objects.filter(
+                created_local_date__gte=date_range.first_day,
+                created_local_date__lte=date_range.last_day,
+                # status='won'
+            ).values('created_local_month').annotate(total=Sum('value')).order_by()
+
+            for row in months:
+                month = row['created_local_month']
+                monthly_revenue[(month.year, month.month)] = row['total'] or 0
         
         # Format the result for the frontend
         trend_data = []
         
         # Generate all months in range to ensure we have complete data
-        current_date = start_date.replace(day=1)
-        while current_date <= end_date:
+        current_date = first_month
+        while current_date <= date_range.last_day:
             year = current_date.year
             month = current_date.month
             month_name = calendar.month_name[month]
@@ -107,38 +113,31 @@ class DashboardAPIView(GenericAPIView):
         
         return trend_data
     
-    def get_cash_collected(self, start_date, end_date):
+    @section('cash_collected')
+    def get_cash_collected(self, date_range):
         """Calculate total cash collected in the specified date range"""
-        total_cash = Opportunity.objects.filter(
-            created_timestamp__gte=start_date,
-            created_timestamp__lte=end_date,
-            status='won'
-        ).aggregate(total=Sum('value'))['total'] or 0
+        _, total_cash = aggregate_opportunities(*date_range, statuses=['won'])
         
         return {
             "total": round(total_cash, 2),
-            "timeframe": f"{start_date.strftime('%Y-%m-%d')} to {end_date.strftime('%Y-%m-%d')}"
+            "timeframe": f"{date_range.first_day:%Y-%m-%d} to {date_range.last_day:%Y-%m-%d}"
         }
     
+    @section('projected_revenue')
     def get_projected_revenue(self):
         """Calculate projected revenue for the next 2 weeks"""
-        today = datetime.now()
+        today = local_now()
         week1_end = today + timedelta(days=7)
         week2_end = today + timedelta(days=14)
         
+        # Assuming these are the statuses for booked jobs
+        booked = ['booked', 'in_progress']
+
         # Revenue for week 1
-        week1_revenue = Opportunity.objects.filter(
-            created_timestamp__gte=today,
-            created_timestamp__lte=week1_end,
-            status__in=['booked', 'in_progress']  # Assuming these are the statuses for booked jobs
-        ).aggregate(total=Sum('value'))['total'] or 0
+        _, week1_revenue = aggregate_opportunities(today, week1_end, statuses=booked)
         
         # Revenue for week 2
-        week2_revenue = Opportunity.objects.filter(
-            created_timestamp__gt=week1_end,
-            created_timestamp__lte=week2_end,
-            status__in=['booked', 'in_progress']
-        ).aggregate(total=Sum('value'))['total'] or 0
+        _, week2_revenue = aggregate_opportunities(week1_end, week2_end, statuses=booked)
         
         return {
             "week1": round(week1_revenue, 2),
@@ -146,59 +145,41 @@ class DashboardAPIView(GenericAPIView):
             "total": round(week1_revenue + week2_revenue, 2)
         }
     
-    def get_pipeline_value(self, start_date, end_date):
+    @section('pipeline_value')
+    def get_pipeline_value(self, date_range):
         """Calculate total value of open deals/quotes within date range"""
-        pipeline_value = Opportunity.objects.filter(
-            created_timestamp__gte=start_date,
-            created_timestamp__lte=end_date,
-            status='quoted'  # Assuming 'quoted' is the status for open deals
-        ).aggregate(total=Sum('value'))['total'] or 0
+        # Assuming 'quoted' is the status for open deals
+        _, pipeline_value = aggregate_opportunities(*date_range, statuses=['quoted'])
         
         return {
             "total": round(pipeline_value, 2)
         }
     
 
-    def get_sales_performance(self, start_date, end_date):
+    @section('sales_performance')
+    def get_sales_performance(self, date_range):
         """Get sales performance metrics for the date range"""
 
         # Leads generated (stage = 'New Lead')
-        leads_generated = Opportunity.objects.filter(
-            created_timestamp__range=(start_date, end_date),
-            current_stage__name="New Lead"
-        ).count()
+        leads_generated, _ = aggregate_opportunities(*date_range, stage_names=["New Lead"])
 
         # Quotes sent (stage = 'Quote Sent')
-        quotes_sent = Opportunity.objects.filter(
-            created_timestamp__range=(start_date, end_date),
-            current_stage__name='Quote Sent'
-        ).count()
+        quotes_sent, _ = aggregate_opportunities(*date_range, stage_names=['Quote Sent'])
 
  
 
         # Jobs booked (stage = 'Quote Booked' or 'Won')
         #! Needs to check 'Quote Booked' is present in db
-        jobs_booked = Opportunity.objects.filter(
-            created_timestamp__range=(start_date, end_date),
-            current_stage__name__in=['Quote Booked', 'Won']
-        ).count()
+        jobs_booked, _ = aggregate_opportunities(*date_range, stage_names=['Quote Booked', 'Won'])
 
         # Jobs won (stage = 'Won')
-        jobs_won = Opportunity.objects.filter(
-            created_timestamp__range=(start_date, end_date),
-            current_stage__name='Won'
-        ).count()
+        jobs_won, _ = aggregate_opportunities(*date_range, stage_names=['Won'])
 
-        jobs_lost = Opportunity.objects.filter(
-            created_timestamp__range=(start_date, end_date),
-            current_stage__name='Lost'
-        ).count()
+        jobs_lost, _ = aggregate_opportunities(*date_range, stage_names=['Lost'])
 
         # Total sales from 'Won' status
-        total_sales = Opportunity.objects.filter(
-            created_timestamp__range=(start_date, end_date),
-            status='won'  # Assuming 'status' field also tracks won/lost
-        ).aggregate(total=Sum('value'))['total'] or 0.0
+        # Assuming 'status' field also tracks won/lost
+        _, total_sales = aggregate_opportunities(*date_range, statuses=['won'])
 
 
         total_closed = jobs_won + jobs_lost
@@ -220,73 +201,46 @@ class DashboardAPIView(GenericAPIView):
         }
 
     
-    def get_lead_source_breakdown(self, start_date, end_date):
+    @section('lead_source_breakdown')
+    def get_lead_source_breakdown(self, date_range):
         """Get breakdown of leads by source for the date range"""
-        sources = Opportunity.objects.filter(
-            created_timestamp__gte=start_date,
-            created_timestamp__lte=end_date
-        ).values('created_by_source').annotate(
-            count=Count('id'),
-            value=Sum('value')
-        ).order_by('-count')
+        sources = opportunities_by_source(*date_range)
         
         # Format the result for the frontend
         source_data = []
-        for source in sources:
+        for source, count, value in sources:
             source_data.append({
-                "source": source['created_by_source'],
-                "count": source['count'],
-                "value": round(source['value'] or 0, 2)
+                "source": source,
+                "count": count,
+                "value": round(value, 2)
             })
         
         return source_data
     
+    @section('cashflow_snapshot')
     def get_cashflow_snapshot(self):
         """Get cashflow snapshot (static date ranges, not based on parameters)"""
-        today = datetime.now()
+        now_local = local_now()
+        today = now_local.date()
         week_start = today - timedelta(days=today.weekday())
         week_end = week_start + timedelta(days=6)
         month_start = today.replace(day=1)
         month_end = (month_start + relativedelta(months=1) - timedelta(days=1))
-        next_30_days_end = today + timedelta(days=30)
-        
-        # Cash collected this week
-        this_week_cash = Opportunity.objects.filter(
-            created_timestamp__gte=week_start,
-            created_timestamp__lte=week_end,
-            status='won'
-        ).aggregate(total=Sum('value'))['total'] or 0
-        
-        # Cash collected this month
-        this_month_cash = Opportunity.objects.filter(
-            created_timestamp__gte=month_start,
-            created_timestamp__lte=month_end,
-            status='won'
-        ).aggregate(total=Sum('value'))['total'] or 0
+        next_30_days_end = now_local + timedelta(days=30)
         
-        # Cash expected next 30 days
-        next_30_days_cash = Opportunity.objects.filter(
-            created_timestamp__gte=today,
-            created_timestamp__lte=next_30_days_end,
-            ).filter(
-            Q(status__iexact='quote sent') | Q(status__iexact='awaiting deposit') | Q(status__iexact='won')
-            ).aggregate(total=Sum('value'))['total'] or 0
+        totals = aggregate_windows({
+            # Cash collected this week
+            "this_week": {**day_range(week_start, week_end)._asdict(), "statuses": ['won']},
+            # Cash collected this month
+            "this_month": {**day_range(month_start, month_end)._asdict(), "statuses": ['won']},
+            # Cash expected next 30 days
+            "next_30_days": {
+                "start": now_local, "end": next_30_days_end,
+                "statuses": ['quote sent', 'awaiting deposit', 'won'], "ignore_case": True,
+            },
+        })
         
-        return {
-            "this_week": round(this_week_cash, 2),
-            "this_month": round(this_month_cash, 2),
-            "next_30_days": round(next_30_days_cash, 2)
-        }
-    
-
-    def get_default_date_range(self):
-        first_opportunity = Opportunity.objects.order_by("created_timestamp").first()
-        if first_opportunity and first_opportunity.created_timestamp:
-            start_date = first_opportunity.created_timestamp.date()
-        else:
-            start_date = now().date()
-        end_date = now().date()
-        return start_date.strftime('%Y-%m-%d'), end_date.strftime('%Y-%m-%d')
+        return {name: round(total, 2) for name, (count, total) in totals.items()}
     
 
 
@@ -294,108 +248,224 @@ class DashboardAPIView(GenericAPIView):
 
 # views.py
 import os
-from django.http import HttpResponse
+from urllib.parse import urlencode
+from django.http import HttpResponse, StreamingHttpResponse, JsonResponse
 from django.contrib.admin.views.decorators import staff_member_required
 from django.conf import settings
+from django.utils.dateparse import parse_datetime
+from django.utils.html import escape
+from django.utils.timezone import make_aware, is_naive
+from .logs import tail, follow, search, LEVELS
+
+LOG_FILES = {
+    'ghl_sync': 'logs/ghl_sync_rotating.log',
+    'django': 'logs/ghl_sync.log',
+}
+
+
+def _stream_log_events(log_path, level, contains):
+    """Format followed log lines as server-sent events."""
+    yield "retry: 3000\n\n"
+    for line in follow(log_path, level=level, contains=contains):
+        if line is None:
+            yield ": keepalive\n\n"
+        else:
+            yield f"data: {line}\n\n"
+
 
 @staff_member_required
 def view_logs(request):
-    """View to display log files - only accessible to staff"""
+    """
+    View to display log files - only accessible to staff
+
+    Query params:
+        type: ghl_sync | django
+        lines: number of lines to show (default 100)
+        level: minimum level, e.g. WARNING
+        q: only show records containing this text
+        follow: 1 to stream new lines as server-sent events
+    """
     log_type = request.GET.get('type', 'ghl_sync')
-    
-    log_files = {
-        'ghl_sync': 'logs/ghl_sync_rotating.log',
-        'django': 'logs/ghl_sync.log',
-    }
-    
-    log_file = log_files.get(log_type, 'logs/ghl_sync_rotating.log')
+    level = request.GET.get('level') or None
+    contains = request.GET.get('q') or None
+    try:
+        num_lines = max(1, min(int(request.GET.get('lines', 100)), 5000))
+    except ValueError:
+        num_lines = 100
+
+    log_file = LOG_FILES.get(log_type, 'logs/ghl_sync_rotating.log')
     log_path = os.path.join(settings.BASE_DIR, log_file)
-    
+
+    if not os.path.exists(log_path):
+        return HttpResponse(f"Log file not found: {escape(log_path)}")
+
+    if request.GET.get('follow') == '1':
+        response = StreamingHttpResponse(
+            _stream_log_events(log_path, level, contains),
+            content_type='text/event-stream'
+        )
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
     try:
-        with open(log_path, 'r') as f:
-            # Get last 100 lines
-            lines = f.readlines()
-            last_lines = lines[-100:] if len(lines) > 100 else lines
-            content = ''.join(last_lines)
-            
-        html_content = f"""
-        <html>
-        <head>
-            <title>GHL Sync Logs</title>
-            <style>
-                body {{ font-family: monospace; background: #1e1e1e; color: #d4d4d4; }}
-                .log-container {{ padding: 20px; }}
-                .log-content {{ 
-                    background: #2d2d30; 
-                    padding: 15px; 
-                    border-radius: 5px; 
-                    white-space: pre-wrap; 
-                    overflow-x: auto;
-                }}
-                .nav {{ padding: 10px; background: #333; }}
-                .nav a {{ color: #4CAF50; margin-right: 20px; text-decoration: none; }}
-            </style>
-        </head>
-        <body>
-            <div class="nav">
-                <a href="?type=ghl_sync">GHL Sync Logs</a>
-                <a href="?type=django">Django Logs</a>
-                <span style="float: right; color: #888;">Last 100 lines</span>
-            </div>
-            <div class="log-container">
-                <h2>Logs: {log_type}</h2>
-                <div class="log-content">{content}</div>
-            </div>
-        </body>
-        </html>
-        """
-        return HttpResponse(html_content)
-        
-    except FileNotFoundError:
-        return HttpResponse(f"Log file not found: {log_path}")
+        content = escape('\n'.join(tail(log_path, num_lines, level=level, contains=contains)))
     except Exception as e:
-        return HttpResponse(f"Error reading log file: {str(e)}")
+        return HttpResponse(f"Error reading log file: {escape(str(e))}")
+
+    params = {'type': log_type, 'lines': num_lines, 'level': level or '', 'q': contains or ''}
+    follow_url = '?' + urlencode({**params, 'follow': 1})
+    level_options = ''.join(
+        f'<option value="{name}"{" selected" if level and level.upper() == name else ""}>{name}</option>'
+        for name in LEVELS
+    )
+
+    html_content = f"""
+    <html>
+    <head>
+        <title>GHL Sync Logs</title>
+        <style>
+            body {{ font-family: monospace; background: #1e1e1e; color: #d4d4d4; }}
+            .log-container {{ padding: 20px; }}
+            .log-content {{ 
+                background: #2d2d30; 
+                padding: 15px; 
+                border-radius: 5px; 
+                white-space: pre-wrap; 
+                overflow-x: auto;
+            }}
+            .nav {{ padding: 10px; background: #333; }}
+            .nav a {{ color: #4CAF50; margin-right: 20px; text-decoration: none; }}
+            .nav form {{ display: inline; }}
+        </style>
+    </head>
+    <body>
+        <div class="nav">
+            <a href="?type=ghl_sync">GHL Sync Logs</a>
+            <a href="?type=django">Django Logs</a>
+            <a href="#" id="live">Live</a>
+            <form method="get">
+                <input type="hidden" name="type" value="{escape(log_type)}">
+                <select name="level"><option value="">ALL</option>{level_options}</select>
+                <input name="q" placeholder="contains" value="{escape(contains or '')}">
+                <input name="lines" size="5" value="{num_lines}">
+                <button type="submit">Filter</button>
+            </form>
+            <span style="float: right; color: #888;">Last {num_lines} lines</span>
+        </div>
+        <div class="log-container">
+            <h2>Logs: {escape(log_type)}</h2>
+            <div class="log-content" id="log">{content}</div>
+        </div>
+        <script>
+            document.getElementById("live").onclick = function (e) {{
+                e.preventDefault();
+                var log = document.getElementById("log");
+                new EventSource("{escape(follow_url)}").onmessage = function (event) {{
+                    log.appendChild(document.createTextNode("\n" + event.data));
+                    window.scrollTo(0, document.body.scrollHeight);
+                }};
+                this.textContent = "Live (on)";
+            }};
+        </script>
+    </body>
+    </html>
+    """
+    return HttpResponse(html_content)
+
+
+
+
+
+
+@staff_member_required
+def search_logs(request):
+    """
+    Search the rotating sync log and its rotated segments via their index.
+
+    Query params:
+        start, end: ISO datetimes (naive values are taken as server time)
+        level: minimum level, e.g. WARNING
+        logger: exact logger name, e.g. data_management.helpers
+        q: substring the record must contain
+        limit: max records to return (default 200, max 1000)
+    """
+    bounds = {}
+    for param in ('start', 'end'):
+        value = request.GET.get(param)
+        if not value:
+            bounds[param] = None
+            continue
+        parsed = parse_datetime(value)
+        if parsed is None:
+            return JsonResponse({"error": f"Invalid {param}. Use an ISO 8601 datetime"}, status=400)
+        if is_naive(parsed):
+            parsed = make_aware(parsed)
+        bounds[param] = parsed.timestamp()
 
+    try:
+        limit = max(1, min(int(request.GET.get('limit', 200)), 1000))
+    except ValueError:
+        limit = 200
 
+    log_path = os.path.join(settings.BASE_DIR, LOG_FILES['ghl_sync'])
+    results = search(
+        log_path,
+        start=bounds['start'],
+        end=bounds['end'],
+        level=request.GET.get('level') or None,
+        logger=request.GET.get('logger') or None,
+        contains=request.GET.get('q') or None,
+        limit=limit,
+    )
+    return JsonResponse({"count": len(results), "results": results})
 
 
 
 
+@query_budget(10)
+@replica_reads
+@conditional_get
 class RevenueMetricsView(APIView):
 
     permission_classes = [AllowAny]
     
     def get(self, request):
         from datetime import timedelta, date
-        today = now().date()
+        today = local_today()
         start_of_year = today.replace(month=1, day=1)
         start_of_month = today.replace(day=1)
         start_of_quarter = date(today.year, ((today.month - 1) // 3) * 3 + 1, 1)
 
         # Optional period for cash collected
-        start_date_str = request.query_params.get("start_date")
-        end_date_str = request.query_params.get("end_date")
-        start_date = date.fromisoformat(start_date_str) if start_date_str else start_of_month
-        end_date = date.fromisoformat(end_date_str) if end_date_str else today
+        try:
+            cash_range = parse_date_range(request.query_params, default=day_range(start_of_month, today))
+        except ValueError:
+            return Response(
+                {"error": "Invalid date format. Use YYYY-MM-DD format"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
 
         week2_start = today + timedelta(days=7)
         week2_end = today + timedelta(days=14)
 
-        def total_value(qs):
-            return qs.aggregate(total=Sum("value"))["total"] or 0.0
-
-        queryset = Opportunity.objects.all()
-
-        data = {
-            "revenue_ytd": total_value(queryset.filter(created_timestamp__date__gte=start_of_year)),
-            "revenue_mtd": total_value(queryset.filter(created_timestamp__date__gte=start_of_month)),
-            "revenue_qtd": total_value(queryset.filter(created_timestamp__date__gte=start_of_quarter)),
-            "cash_collected": total_value(queryset.filter(created_timestamp__date__range=(start_date, end_date), status="won")),
-            "projected_revenue_week2": total_value(queryset.filter(created_timestamp__date__range=(week2_start, week2_end))),
-            "pipeline_value": total_value(queryset),
-        }
-
-        return Response(RevenueMetricsSerializer(data).data)
+        def days(first_day=None, last_day=None, **filters):
+            # Whole days in the location's timezone
+            return {**day_range(first_day, last_day)._asdict(), **filters}
+
+        totals = aggregate_windows({
+            "revenue_ytd": days(start_of_year),
+            "revenue_mtd": days(start_of_month),
+            "revenue_qtd": days(start_of_quarter),
+            "cash_collected": {**cash_range._asdict(), "statuses": ["won"]},
+            "projected_revenue_week2": days(week2_start, week2_end),
+            "pipeline_value": days(),
+        })
+        data = {name: total for name, (count, total) in totals.items()}
+
+        with section('serialize'):
+            data = RevenueMetricsSerializer(data).data
+        return Response(data)
     
 
 
@@ -410,8 +480,12 @@ class CustomPagination(PageNumberPagination):
 from rest_framework.generics import ListAPIView
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework.exceptions import ValidationError
+from .filters import filter_opportunities
 
 
+@query_budget(10)
+@replica_reads
+@conditional_get
 class OpportunityListGenericView(ListAPIView):
     """
     Alternative implementation using DRF Generic Views with filtering.
@@ -421,72 +495,353 @@ class OpportunityListGenericView(ListAPIView):
     filter_backends = [DjangoFilterBackend]
     pagination_class = CustomPagination  # optional override
 
-    
-    def get_queryset(self):
-        queryset = Opportunity.objects.select_related(
-            'contact', 'pipeline', 'current_stage', 'current_stage__pipeline'
-        ).order_by('-created_timestamp')
-        
-        # Get and validate required parameters
-        start_date = self.request.query_params.get('start_date')
-        end_date = self.request.query_params.get('end_date')
+    def get_fieldset(self):
+        """
+        Parse the optional ``fields`` and ``expand`` query parameters.
 
+        Returns:
+            (fields, expand) where each is a list of names or None when the
+            parameter was not given.
+        """
+        if hasattr(self, '_fieldset'):
+            return self._fieldset
 
-        
-        if not start_date or not end_date:
-            start_date, end_date = self.get_default_date_range()
+        def parse(param):
+            value = self.request.query_params.get(param)
+            if value is None:
+                return None
+            return [name.strip() for name in value.split(',') if name.strip()]
 
-            
-        start_date = datetime.strptime(start_date, '%Y-%m-%d')
-        end_date = datetime.strptime(end_date, '%Y-%m-%d')
-        
-        # Ensure end_date is inclusive by setting it to the end of the day
-        end_date = end_date.replace(hour=23, minute=59, second=59)
-        
-        if not start_date or not end_date:
+        fields = parse('fields')
+        expand = parse('expand')
+
+        allowed = OpportunitySerializer.Meta.fields
+        unknown = [name for name in fields or () if name not in allowed]
+        if unknown:
+            raise ValidationError({
+                'error': 'Invalid fields parameter',
+                'message': f"Unknown fields: {', '.join(unknown)}"
+            })
+        unknown = [name for name in expand or () if name not in OpportunitySerializer.EXPANDABLE]
+        if unknown:
             raise ValidationError({
-                'error': 'Both start_date and end_date are required parameters',
-                'message': 'Please provide dates in YYYY-MM-DD format'
+                'error': 'Invalid expand parameter',
+                'message': f"Cannot expand: {', '.join(unknown)}"
             })
 
+        self._fieldset = (fields, expand)
+        return self._fieldset
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        with section('query'):
+            page = self.paginate_queryset(queryset)
+            rows = page if page is not None else list(queryset)
+        with section('serialize'):
+            data = self.get_serializer(rows, many=True).data
+        if page is not None:
+            return self.get_paginated_response(data)
+        return Response(data)
+
+    def get_serializer(self, *args, **kwargs):
+        fields, expand = self.get_fieldset()
+        kwargs.setdefault('fields', fields)
+        kwargs.setdefault('expand', expand)
+        return super().get_serializer(*args, **kwargs)
 
-        
-        # Apply date filter
-        queryset = queryset.filter(
-            created_timestamp__range=(start_date, end_date),
+    def get_queryset(self):
+        fields, expand = self.get_fieldset()
+
+        queryset = Opportunity.objects.order_by('-created_timestamp')
+        if fields is None and expand is None:
+            queryset = queryset.select_related(
+                'contact', 'pipeline', 'current_stage', 'current_stage__pipeline'
+            )
+        else:
+            # Only load the selected columns and join the expanded relations
+            fields = fields or OpportunitySerializer.Meta.fields
+            expand = [name for name in expand or () if name in fields]
+            related = [path for name in expand for path in OpportunitySerializer.EXPANDABLE[name]]
+            queryset = queryset.only('id', *fields)
+            if related:
+                queryset = queryset.select_related(*related)
+
+        return filter_opportunities(queryset, self.request.query_params)
+
+
+
+
+import tempfile
+from django.db import router
+from django.http import StreamingHttpResponse, FileResponse
+from .exports import export_rows, iter_csv, iter_ndjson, write_xlsx, CONTENT_TYPES
+
+
+@replica_reads
+class OpportunityExportView(GenericAPIView):
+    """
+    Stream every opportunity matching the list filters as CSV, NDJSON or XLSX.
+
+    Accepts the same `start_date`, `end_date`, `source` and `pipeline_name`
+    query parameters as OpportunityListGenericView, without pagination.
+    """
+
+    def get_queryset(self):
+        # Rows are streamed after dispatch, outside the replica routing
+        opportunities = Opportunity.objects.using(router.db_for_read(Opportunity))
+        return filter_opportunities(opportunities, self.request.query_params)
+
+    def get(self, request, export_format):
+        if export_format not in CONTENT_TYPES:
+            return Response(
+                {"error": f"Unsupported export format. Use one of: {', '.join(CONTENT_TYPES)}"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        rows = export_rows(self.get_queryset())
+        filename = f"opportunities.{export_format}"
+
+        if export_format == 'xlsx':
+            # XLSX is a zip archive, so it is spooled to a temp file first
+            tmp = tempfile.TemporaryFile()
+            write_xlsx(rows, tmp)
+            tmp.seek(0)
+            return FileResponse(tmp, as_attachment=True, filename=filename,
+                                content_type=CONTENT_TYPES['xlsx'])
+
+        stream = iter_csv(rows) if export_format == 'csv' else iter_ndjson(rows)
+        response = StreamingHttpResponse(stream, content_type=CONTENT_TYPES[export_format])
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
+
+
+
+
+from django.db.models import Max
+from django.db.models.functions import TruncDate
+from rest_framework.permissions import IsAdminUser
+from .models import SyncRun
+from .serializers import SyncRunSerializer
+
+
+class SyncRunListView(ListAPIView):
+    """
+    Staff-only list of sync runs, newest first.
+
+    Optional filters: `location_id`, `mode`, `status`.
+    """
+    serializer_class = SyncRunSerializer
+    permission_classes = [IsAdminUser]
+    pagination_class = CustomPagination
+
+    def get_queryset(self):
+        queryset = SyncRun.objects.all()
+        for param in ('location_id', 'mode', 'status'):
+            value = self.request.query_params.get(param)
+            if value:
+                queryset = queryset.filter(**{param: value})
+        return queryset
+
+
+class SyncRunTrendsView(APIView):
+    """
+    Staff-only daily trends of successful sync runs, and the latest run
+    compared with the average of the previous ones in the window.
+
+    Query params: `days` (default 30), `location_id`, `mode` (default full).
+    """
+    permission_classes = [IsAdminUser]
+
+    COMPARED = ['duration_seconds', 'api_seconds', 'db_seconds', 'transform_seconds',
+                'peak_memory_mb', 'records_fetched']
+
+    def get(self, request):
+        try:
+            days = int(request.query_params.get('days', 30))
+        except ValueError:
+            return Response({"error": "days must be an integer"}, status=status.HTTP_400_BAD_REQUEST)
+
+        runs = SyncRun.objects.filter(
+            started_at__gte=now() - timedelta(days=days),
+            mode=request.query_params.get('mode', SyncRun.MODE_FULL),
         )
-        
+        location_id = request.query_params.get('location_id')
+        if location_id:
+            runs = runs.filter(location_id=location_id)
+
+        failures = dict(
+            runs.filter(status=SyncRun.STATUS_FAILED)
+            .annotate(day=TruncDate('started_at')).values('day')
+            .annotate(count=Count('id')).values_list('day', 'count')
+        )
+        successful = runs.filter(status=SyncRun.STATUS_SUCCESS)
+        daily = (
+            successful.annotate(day=TruncDate('started_at')).values('day')
+            .annotate(
+                runs=Count('id'),
+                avg_duration_seconds=Avg('duration_seconds'),
+                avg_api_seconds=Avg('api_seconds'),
+                avg_db_seconds=Avg('db_seconds'),
+                avg_transform_seconds=Avg('transform_seconds'),
+                avg_records_fetched=Avg('records_fetched'),
+                max_peak_memory_mb=Max('peak_memory_mb'),
+            )
+            .order_by('day')
+        )
+        trend = [
+            {**{key: round(value, 3) if isinstance(value, float) else value for key, value in row.items()},
+             'failures': failures.get(row['day'], 0)}
+            for row in daily
+        ]
+
+        comparison = None
+        latest = successful.order_by('-started_at').first()
+        if latest:
+            baseline = successful.exclude(pk=latest.pk).aggregate(
+                runs=Count('id'), **{field: Avg(field) for field in self.COMPARED}
+            )
+            comparison = {'latest_run': latest.pk, 'baseline_runs': baseline.pop('runs')}
+            for field in self.COMPARED:
+                value, average = getattr(latest, field), baseline[field]
+                comparison[field] = {
+                    'latest': value,
+                    'baseline': round(average, 3) if average is not None else None,
+                    'change_pct': round((value - average) / average * 100, 1)
+                    if value is not None and average else None,
+                }
+
+        return Response({'days': days, 'trend': trend, 'comparison': comparison})
+
 
-        source_map = {
-            'Google Ads': ['Google Ads', 'Google Advertising', 'google Ads'],
-            'GBP Organic': ['Organic Google', 'Google Maps', 'Organic google'],
-            'Facebook Groups': ['FB Community Group', 'FB Community G', 'Facebook Community Group', 'Facebook Ad', 'Instagram'],
-            'Referrals': ['Client Referral', 'Client referral', 'Word of mouth', 'Word Of Mouth', 'Referral', 'BNI'],
-            'Door Knocking': ['Door Knocking', 'Door knocking']
+
+
+from functools import partial
+from .models import OpportunityStageEvent
+from .stage_events import stage_funnel, stage_conversion, stage_velocity, current_stage_totals
+
+
+class StageAnalyticsView(APIView):
+    """
+    Base for the per-stage analytics.
+
+    Query params: `start_date`, `end_date` (YYYY-MM-DD, default from the
+    first opportunity until today) and `pipeline` (Pipeline id).
+    """
+    compute = None
+
+    def get_queryset(self):
+        """Not directly used but required for the default permissions"""
+        return OpportunityStageEvent.objects.all()
+
+    def get(self, request):
+        try:
+            date_range = parse_date_range(request.query_params)
+            pipeline_id = int(request.query_params.get('pipeline') or 0) or None
+        except ValueError:
+            return Response(
+                {"error": "Use YYYY-MM-DD dates and an integer pipeline id"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        with section('query'):
+            pipelines = type(self).compute(*date_range, pipeline_id)
+        return Response({
+            "start_date": date_range.first_day.strftime('%Y-%m-%d'),
+            "end_date": date_range.last_day.strftime('%Y-%m-%d'),
+            "pipelines": pipelines,
+        })
+
+
+@query_budget(5)
+class StageFunnelView(StageAnalyticsView):
+    """Opportunities reaching each `show_in_funnel` stage, and stage-to-stage conversion."""
+    compute = stage_funnel
+
+
+@query_budget(5)
+class StageConversionView(StageAnalyticsView):
+    """Which stages opportunities moved to after each stage."""
+    compute = stage_conversion
+
+
+@query_budget(5)
+class StageVelocityView(StageAnalyticsView):
+    """Average and median time spent in each stage."""
+    compute = stage_velocity
+
+
+@query_budget(3)
+class FunnelChartView(StageAnalyticsView):
+    """Opportunities created in the range by current `show_in_funnel` stage."""
+    compute = partial(current_stage_totals, flag='show_in_funnel')
+
+
+@query_budget(3)
+class PieChartView(StageAnalyticsView):
+    """Opportunities created in the range by current `show_in_pie_chart` stage."""
+    compute = partial(current_stage_totals, flag='show_in_pie_chart')
+
+
+
+
+import asyncio
+from asgiref.sync import sync_to_async
+from django.db import close_old_connections
+from django.views import View
+from kpi_backend.db_router import read_database, read_replica
+from kpi_backend.instrumentation import worker_metrics
+from kpi_backend.renderers import ORJSONRenderer
+
+
+def _run_section(method, *args):
+    """Run one dashboard section in a worker thread, on that thread's own connections."""
+    close_old_connections()
+    try:
+        with worker_metrics():
+            return method(*args)
+    finally:
+        close_old_connections()
+
+
+@query_budget(20)
+@conditional_get
+class AsyncDashboardView(View):
+    """
+    DashboardAPIView with its sections computed concurrently.
+
+    Each section runs in its own thread with its own database connection, at
+    most DASHBOARD_CONCURRENCY at a time per request, so the response takes
+    about as long as the slowest section rather than the sum of them. Served
+    best under ASGI (kpi_backend.asgi); same query parameters and payload.
+    """
+
+    async def get(self, request):
+        try:
+            date_range = await sync_to_async(parse_date_range)(request.GET)
+        except ValueError:
+            return JsonResponse({"error": "Invalid date format. Use YYYY-MM-DD format"},
+                                status=status.HTTP_400_BAD_REQUEST)
+
+        dashboard = DashboardAPIView()
+        sections = {
+            "revenue_trend": (dashboard.get_revenue_trend, date_range),
+            "cash_collected": (dashboard.get_cash_collected, date_range),
+            "projected_revenue": (dashboard.get_projected_revenue,),
+            "pipeline_value": (dashboard.get_pipeline_value, date_range),
+            "sales_performance": (dashboard.get_sales_performance, date_range),
+            "lead_source_breakdown": (dashboard.get_lead_source_breakdown, date_range),
+            "cashflow_snapshot": (dashboard.get_cashflow_snapshot,),
         }
+        limit = asyncio.Semaphore(settings.DASHBOARD_CONCURRENCY)
 
+        async def run(call):
+            async with limit:
+                return await sync_to_async(_run_section, thread_sensitive=False)(*call)
 
-        # Apply optional filters
-        source = self.request.query_params.get('source')
-        if source:
-            mapped_sources = source_map.get(source)
-            if mapped_sources:
-                print("mapped source:", mapped_sources)
-                queryset = queryset.filter(created_by_source__in=mapped_sources)
-                print(len(queryset))
-            else:
-                # If no mapping found, fallback to exact match
-                queryset = queryset.filter(contact__source__iexact=source)
-        
-        pipeline_stage = self.request.query_params.get('pipeline_name')
-        if pipeline_stage:
-            try:
-                # pipeline_stage_id = int(pipeline_stage)
-                queryset = queryset.filter(current_stage__name=pipeline_stage)
-            except (ValueError, TypeError):
-                raise ValidationError({
-                    'error': 'Invalid pipeline_stage parameter',
-                    'message': 'pipeline_stage must be a valid integer ID'
-                })
-        
-        return queryset
+        with read_replica(await sync_to_async(read_database)()):
+            results = await asyncio.gather(*(run(call) for call in sections.values()))
+        dashboard_data = dict(zip(sections, results))
+
+        with section('serialize'):
+            data = DashboardSerializer(dashboard_data).data
+        return HttpResponse(ORJSONRenderer().render(data), content_type='application/json')
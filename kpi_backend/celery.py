@@ -1,5 +1,6 @@
 import os
 from celery import Celery
+from celery.signals import worker_process_shutdown
 
 # Set the default Django settings module
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'kpi_backend.settings')
@@ -12,6 +13,37 @@ app.config_from_object('django.conf:settings', namespace='CELERY')
 # Load task modules from all registered Django app configs
 app.autodiscover_tasks()
 
+# Worker profiles per queue, used by `python manage.py run_worker <profile>`.
+# Webhooks are short and I/O bound: many processes with a small prefetch.
+# Syncs are long and memory heavy: few processes, no prefetch, and recycle the
+# process after each task so its memory is returned to the OS.
+WORKER_PROFILES = {
+    'webhooks': {
+        'queues': ['webhooks'],
+        'concurrency': 8,
+        'prefetch_multiplier': 4,
+    },
+    'sync': {
+        'queues': ['sync'],
+        'concurrency': 2,
+        'prefetch_multiplier': 1,
+        'max_tasks_per_child': 1,
+    },
+    'tokens': {
+        'queues': ['tokens', 'default'],
+        'concurrency': 1,
+        'prefetch_multiplier': 1,
+    },
+}
+
+
+@worker_process_shutdown.connect
+def flush_metrics(**kwargs):
+    # Prefork children may exit before their periodic metrics flush
+    from kpi_backend.metrics import flush
+    flush()
+
+
 @app.task(bind=True)
 def debug_task(self):
     print(f'Request: {self.request!r}')
@@ -0,0 +1,173 @@
+"""
+Read replica routing for the analytics endpoints.
+
+When `REPLICA_DB_HOST` is set, settings add a `replica` database alias.
+Views decorated with `@replica_reads` (dashboard, revenue metrics,
+opportunity list and exports) send their ORM reads there, so the large sync
+transactions on the primary do not slow them down. Everything else,
+including every write, the sync and the webhooks, uses `default`.
+
+The choice is made once per request. Reads stay on the primary when:
+
+- the replica is unreachable or its replay lag is over `REPLICA_MAX_LAG`
+  seconds (measured at most every `LAG_CHECK_INTERVAL` seconds per process)
+- data was written in the last `REPLICA_MAX_LAG` seconds (`record_write()`,
+  called after sync and webhook commits), so a read right after a write
+  sees it
+"""
+import contextvars
+import functools
+import logging
+import time
+from contextlib import ContextDecorator
+from typing import Optional
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DatabaseError, connections
+
+from kpi_backend.metrics import REPLICA_READS
+
+logger = logging.getLogger('kpi_backend.db_router')
+
+REPLICA = 'replica'
+
+# Seconds a measured replica lag is reused per process
+LAG_CHECK_INTERVAL = 5.0
+
+LAST_WRITE_KEY = 'db:last_write'
+
+# 0 when the replica has replayed everything it received, else the age of
+# the last replayed transaction. NULL when nothing was replayed yet.
+LAG_SQL = """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())
+    END
+"""
+
+_reads: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar('read_database', default=None)
+
+_lag = (0.0, None)
+
+
+def replica_configured() -> bool:
+    return REPLICA in settings.DATABASES
+
+
+def replica_lag() -> Optional[float]:
+    """Replay lag of the replica in seconds, or None when it is unreachable."""
+    global _lag
+    expires, lag = _lag
+    if time.monotonic() < expires:
+        return lag
+
+    try:
+        with connections[REPLICA].cursor() as cursor:
+            cursor.execute(LAG_SQL)
+            row = cursor.fetchone()
+        lag = float(row[0]) if row and row[0] is not None else None
+    except DatabaseError as e:
+        logger.warning(f"Replica unavailable: {e}")
+        lag = None
+    _lag = (time.monotonic() + LAG_CHECK_INTERVAL, lag)
+    return lag
+
+
+def record_write() -> None:
+    """Note that data was just committed on the primary; call from transaction.on_commit."""
+    if not replica_configured():
+        return
+    try:
+        # Older writes are replayed by any replica within REPLICA_MAX_LAG
+        cache.set(LAST_WRITE_KEY, time.time(), timeout=int(settings.REPLICA_MAX_LAG) + 1)
+    except Exception as e:
+        logger.warning(f"Could not record write time: {e}")
+
+
+def recent_write() -> bool:
+    """Whether data was written recently enough that the replica may not have it yet."""
+    if not replica_configured():
+        return False
+    try:
+        last_write = cache.get(LAST_WRITE_KEY)
+    except Exception:
+        return False
+    return last_write is not None and time.time() - last_write <= settings.REPLICA_MAX_LAG
+
+
+def read_database() -> str:
+    """Database the reads of a replica-routed request should use now."""
+    if not replica_configured():
+        return 'default'
+
+    lag = replica_lag()
+    if lag is None:
+        reason = 'unavailable'
+    elif lag > settings.REPLICA_MAX_LAG:
+        reason = 'lag'
+    else:
+        reason = 'recent_write' if recent_write() else 'replica'
+
+    database = REPLICA if reason == 'replica' else 'default'
+    REPLICA_READS.inc(database=database, reason=reason)
+    return database
+
+
+class read_replica(ContextDecorator):
+    """
+    Send the ORM reads of a block to `database` (default: `read_database()`).
+
+    Async code picks the database with `await sync_to_async(read_database)()`
+    and passes it in; tasks and threads started inside inherit the choice.
+    """
+
+    def __init__(self, database: str = None):
+        self.database = database
+
+    def _recreate_cm(self):
+        # Fresh instance per call so decorated methods are thread safe
+        return read_replica(self.database)
+
+    def __enter__(self):
+        self._token = _reads.set(self.database or read_database())
+        return self
+
+    def __exit__(self, *exc):
+        _reads.reset(self._token)
+        return False
+
+
+def replica_reads(view):
+    """
+    Route the reads of a view class to the replica.
+
+    Querysets evaluated after dispatch (streamed responses) must be pinned
+    with `.using(router.db_for_read(Model))` inside the view.
+    """
+    dispatch = view.dispatch
+
+    @functools.wraps(dispatch)
+    def wrapped(self, request, *args, **kwargs):
+        with read_replica():
+            return dispatch(self, request, *args, **kwargs)
+
+    view.dispatch = wrapped
+    return view
+
+
+class ReplicaRouter:
+    """Database router: reads go where `read_replica()` says, everything else to the default."""
+
+    def db_for_read(self, model, **hints):
+        return _reads.get()
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # The replica holds the same data as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return False if db == REPLICA else None
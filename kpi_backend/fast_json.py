@@ -0,0 +1,41 @@
+"""
+Fast JSON encoding/decoding helpers.
+
+orjson is used when it is installed; otherwise these fall back to the
+stdlib ``json`` module so the project keeps working without it.
+"""
+import json
+
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional speedup
+    orjson = None
+
+
+# DRF's encoder already knows how to turn Decimal, lazy strings, timedelta,
+# QuerySets, NumPy scalars etc. into JSON-native values, so reuse it as the
+# fallback hook for anything orjson does not handle natively.
+_encoder = JSONEncoder()
+
+if orjson is not None:
+    ORJSON_OPTIONS = (
+        orjson.OPT_UTC_Z
+        | orjson.OPT_NON_STR_KEYS
+        | orjson.OPT_SERIALIZE_NUMPY
+    )
+
+
+def dumps(obj) -> bytes:
+    """Serialize ``obj`` to UTF-8 encoded JSON bytes."""
+    if orjson is not None:
+        return orjson.dumps(obj, default=_encoder.default, option=ORJSON_OPTIONS)
+    return json.dumps(obj, cls=JSONEncoder, separators=(",", ":")).encode()
+
+
+def loads(data):
+    """Deserialize JSON from ``bytes`` or ``str``."""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
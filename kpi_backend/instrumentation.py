@@ -0,0 +1,236 @@
+"""
+Per-request SQL and timing instrumentation.
+
+`InstrumentationMiddleware` counts the queries of each request and the time
+spent in them, collects the timings of `section()` blocks (dashboard
+calculations, serialization, rendering), and reports everything as a
+`Server-Timing` header and a structured log line.
+
+Views can declare a query budget with `@query_budget(n)`. Exceeding it logs
+a warning, or raises `QueryBudgetExceeded` when `QUERY_BUDGET_STRICT` is set
+(e.g. in tests), so N+1 regressions show up immediately.
+"""
+import contextvars
+import logging
+import re
+import threading
+import time
+from contextlib import ContextDecorator, ExitStack, contextmanager
+from typing import Dict, List, Optional
+
+from django.conf import settings
+from django.db import connections
+
+from kpi_backend.fast_json import dumps
+from kpi_backend.metrics import HTTP_REQUEST_DURATION
+
+logger = logging.getLogger('kpi_backend.instrumentation')
+
+
+class QueryBudgetExceeded(AssertionError):
+    """Raised when a view issues more queries than its budget in strict mode."""
+
+
+class RequestMetrics:
+    """Query count, DB time and section timings of one request."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_time = 0.0
+        # name -> [seconds, queries]
+        self.sections: Dict[str, List[float]] = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, execute, sql, params, many, context):
+        # connection.execute_wrapper hook
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - started
+            self.queries += 1
+
+    @property
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+    def add_section(self, name: str, seconds: float, queries: int) -> None:
+        entry = self.sections.setdefault(name, [0.0, 0])
+        entry[0] += seconds
+        entry[1] += queries
+
+    def merge(self, other: 'RequestMetrics') -> None:
+        """Add the queries and sections of work done in another thread."""
+        with self._lock:
+            self.queries += other.queries
+            self.db_time += other.db_time
+            for name, (seconds, queries) in other.sections.items():
+                self.add_section(name, seconds, queries)
+
+
+_current: contextvars.ContextVar[Optional[RequestMetrics]] = contextvars.ContextVar(
+    'request_metrics', default=None
+)
+
+
+def current_metrics() -> Optional[RequestMetrics]:
+    """Metrics of the request being handled, or None outside a request."""
+    return _current.get()
+
+
+@contextmanager
+def worker_metrics():
+    """
+    Instrument work a request runs in another thread.
+
+    The thread's queries and sections are collected separately and merged
+    into the request's metrics at the end, so work running concurrently is
+    not counted in each other's sections.
+    """
+    parent = _current.get()
+    if parent is None:
+        yield
+        return
+    metrics = RequestMetrics()
+    token = _current.set(metrics)
+    try:
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(metrics))
+            yield
+    finally:
+        _current.reset(token)
+        parent.merge(metrics)
+
+
+class section(ContextDecorator):
+    """
+    Time a block or function as a named section of the current request.
+
+    Usable as `with section('serialize'):` or as a `@section('name')`
+    decorator. Does nothing outside an instrumented request.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._metrics = None
+
+    def _recreate_cm(self):
+        # Fresh instance per call so decorated methods are thread safe
+        return section(self.name)
+
+    def __enter__(self):
+        self._metrics = _current.get()
+        if self._metrics is not None:
+            self._started = time.perf_counter()
+            self._queries = self._metrics.queries
+        return self
+
+    def __exit__(self, *exc):
+        if self._metrics is not None:
+            self._metrics.add_section(
+                self.name,
+                time.perf_counter() - self._started,
+                self._metrics.queries - self._queries,
+            )
+        return False
+
+
+def query_budget(max_queries: int):
+    """
+    Declare the maximum number of queries a view may issue per request.
+
+    Works on function views and on view classes (APIView, GenericAPIView...).
+    """
+    def decorator(view):
+        view.query_budget = max_queries
+        return view
+    return decorator
+
+
+def _view_budget(view_func) -> Optional[int]:
+    view_class = getattr(view_func, 'view_class', None) or getattr(view_func, 'cls', None)
+    budget = getattr(view_class, 'query_budget', None)
+    if budget is None:
+        budget = getattr(view_func, 'query_budget', None)
+    return budget
+
+
+_TOKEN_RE = re.compile(r'[^A-Za-z0-9_.-]')
+
+
+def server_timing(metrics: RequestMetrics, total: float) -> str:
+    """Format metrics as a Server-Timing header value (durations in ms)."""
+    parts = [
+        f'total;dur={total * 1000:.1f}',
+        f'db;dur={metrics.db_time * 1000:.1f};desc="{metrics.queries} queries"',
+    ]
+    for name, (seconds, queries) in metrics.sections.items():
+        parts.append(f'{_TOKEN_RE.sub("_", name)};dur={seconds * 1000:.1f};desc="{queries} queries"')
+    return ', '.join(parts)
+
+
+class InstrumentationMiddleware:
+    """
+    Record query count, DB time and section timings for every request.
+
+    Adds a `Server-Timing` header when `SERVER_TIMING` is enabled and logs one
+    JSON line per request to the `kpi_backend.instrumentation` logger. For
+    streaming responses the numbers cover the view, not the streamed body.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        request._query_budget = None
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(metrics))
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+
+        total = metrics.elapsed
+        match = getattr(request, 'resolver_match', None)
+        HTTP_REQUEST_DURATION.observe(
+            total, view=match.view_name if match else 'unmatched',
+            method=request.method, status=response.status_code,
+        )
+        if getattr(settings, 'SERVER_TIMING', False):
+            response['Server-Timing'] = server_timing(metrics, total)
+
+        # Over-budget requests are logged at WARNING
+        budget = request._query_budget
+        over_budget = budget is not None and metrics.queries > budget
+
+        logger.log(logging.WARNING if over_budget else logging.INFO, dumps({
+            'event': 'request',
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'total_ms': round(total * 1000, 1),
+            'db_ms': round(metrics.db_time * 1000, 1),
+            'queries': metrics.queries,
+            'query_budget': budget,
+            'sections': {
+                name: {'ms': round(seconds * 1000, 1), 'queries': queries}
+                for name, (seconds, queries) in metrics.sections.items()
+            },
+        }).decode())
+
+        if over_budget and getattr(settings, 'QUERY_BUDGET_STRICT', False):
+            raise QueryBudgetExceeded(
+                f"{request.method} {request.path} issued {metrics.queries} queries, "
+                f"over its budget of {budget}"
+            )
+
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request._query_budget = _view_budget(view_func)
+        return None
@@ -0,0 +1,319 @@
+"""
+On-demand profiling of any API request for staff users.
+
+Adding `?profile=` to a request made by a staff user runs it under a
+profiler and returns a JSON report instead of the normal payload:
+
+- `?profile=trace` (default): deterministic call tree of every function call;
+  exact call counts, but slows the request down several times
+- `?profile=sample`: statistical call tree sampling the request thread's
+  stack every millisecond, with little overhead
+
+The report contains the call tree, every SQL query with its duration, the
+query plan (`EXPLAIN ANALYZE` on PostgreSQL) of the slowest SELECTs, and
+tracemalloc allocation stats. Non-staff requests are served normally.
+"""
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import defaultdict
+from contextlib import ExitStack
+from typing import Any, Dict, List, Optional
+
+from django.db import connections
+from django.http import JsonResponse
+
+
+TREE_MIN_SHARE = 0.01   # prune call tree nodes below 1% of the total
+TREE_MAX_DEPTH = 80
+EXPLAIN_SLOWEST = 5
+TOP_ALLOCATIONS = 20
+SAMPLE_INTERVAL = 0.001
+
+
+def _frame_label(filename: str, lineno: int, name: str) -> str:
+    return f"{name} ({_short_path(filename)}:{lineno})"
+
+
+def _short_path(filename: str) -> str:
+    for prefix in sorted(sys.path, key=len, reverse=True):
+        if prefix and filename.startswith(prefix + os.sep):
+            return filename[len(prefix) + 1:]
+    return filename
+
+
+class SQLRecorder:
+    """execute_wrapper keeping every query with its parameters and duration."""
+
+    def __init__(self):
+        self.queries: List[Dict[str, Any]] = []
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append({
+                'alias': context['connection'].alias,
+                'sql': sql,
+                'params': params,
+                'many': many,
+                'ms': round((time.perf_counter() - started) * 1000, 3),
+            })
+
+
+def explain(query: Dict[str, Any]) -> Optional[str]:
+    """Query plan of a recorded SELECT (executed again by EXPLAIN ANALYZE)."""
+    if query['many'] or not query['sql'].lstrip().upper().startswith('SELECT'):
+        return None
+    connection = connections[query['alias']]
+    if connection.vendor == 'postgresql':
+        prefix = 'EXPLAIN (ANALYZE, BUFFERS)'
+    elif connection.vendor == 'sqlite':
+        prefix = 'EXPLAIN QUERY PLAN'
+    else:
+        prefix = 'EXPLAIN'
+    with connection.cursor() as cursor:
+        cursor.execute(f"{prefix} {query['sql']}", query['params'])
+        return '\n'.join(' '.join(str(column) for column in row) for row in cursor.fetchall())
+
+
+class CallTracer:
+    """
+    Deterministic profiler recording the full call tree with sys.setprofile.
+
+    Unlike cProfile's caller/callee graph, each node is a distinct call path,
+    so recursion (e.g. the middleware chain) does not collapse the tree.
+    """
+
+    def __init__(self):
+        self.root = {'children': {}, 'calls': 0, 'time': 0.0}
+        self._stack = []
+
+    def start(self):
+        sys.setprofile(self._profile)
+
+    def stop(self):
+        sys.setprofile(None)
+
+    def _profile(self, frame, event, arg):
+        if event == 'call' or event == 'c_call':
+            if event == 'call':
+                code = frame.f_code
+                key = (code.co_filename, code.co_firstlineno, code.co_name)
+            else:
+                key = ('~', 0, f"<built-in {getattr(arg, '__qualname__', repr(arg))}>")
+            parent = self._stack[-1][0] if self._stack else self.root
+            node = parent['children'].get(key)
+            if node is None:
+                node = parent['children'][key] = {'children': {}, 'calls': 0, 'time': 0.0}
+            node['calls'] += 1
+            self._stack.append((node, time.perf_counter()))
+        elif self._stack:
+            # return, c_return, c_exception
+            node, started = self._stack.pop()
+            node['time'] += time.perf_counter() - started
+
+    def tree(self) -> Dict[str, Any]:
+        total = sum(child['time'] for child in self.root['children'].values()) or 1e-9
+
+        def export(key, node, depth):
+            children = [] if depth >= TREE_MAX_DEPTH else [
+                export(child_key, child, depth + 1)
+                for child_key, child in sorted(node['children'].items(), key=lambda item: -item[1]['time'])
+                if child['time'] >= total * TREE_MIN_SHARE
+            ]
+            return {
+                'function': _frame_label(*key),
+                'calls': node['calls'],
+                'own_ms': round((node['time'] - sum(c['time'] for c in node['children'].values())) * 1000, 3),
+                'cumulative_ms': round(node['time'] * 1000, 3),
+                'children': children,
+            }
+
+        return {
+            'profiler': 'trace',
+            'total_ms': round(total * 1000, 3),
+            'tree': [export(key, node, 0) for key, node in
+                     sorted(self.root['children'].items(), key=lambda item: -item[1]['time'])
+                     if node['time'] >= total * TREE_MIN_SHARE],
+        }
+
+
+class StackSampler:
+    """
+    Samples the stack of one thread at a fixed interval from a helper thread.
+
+    Frames above `root_code` (the server and middleware around the
+    profiled call) are left out of the samples.
+    """
+
+    def __init__(self, thread_id: int, root_code=None, interval: float = SAMPLE_INTERVAL):
+        self.thread_id = thread_id
+        self.root_code = root_code
+        self.interval = interval
+        self.samples: Dict[tuple, int] = defaultdict(int)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        return False
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append((code.co_filename, frame.f_lineno, code.co_name))
+                if code is self.root_code:
+                    break
+                frame = frame.f_back
+            self.samples[tuple(reversed(stack))] += 1
+
+    def tree(self) -> Dict[str, Any]:
+        root = {'children': {}, 'samples': 0}
+        for stack, count in self.samples.items():
+            root['samples'] += count
+            node = root
+            for frame in stack[:TREE_MAX_DEPTH]:
+                # Group by function, not by the line that was executing
+                key = (frame[0], frame[2])
+                node = node['children'].setdefault(key, {'children': {}, 'samples': 0, 'line': frame[1]})
+                node['samples'] += count
+
+        total = root['samples'] or 1
+
+        def export(key, node):
+            return {
+                'function': _frame_label(key[0], node['line'], key[1]),
+                'samples': node['samples'],
+                'share': round(node['samples'] / total, 4),
+                'children': [
+                    export(child_key, child)
+                    for child_key, child in sorted(node['children'].items(), key=lambda item: -item[1]['samples'])
+                    if child['samples'] >= total * TREE_MIN_SHARE
+                ],
+            }
+
+        return {
+            'profiler': 'sample',
+            'interval_ms': self.interval * 1000,
+            'samples': root['samples'],
+            'tree': [export(key, node) for key, node in
+                     sorted(root['children'].items(), key=lambda item: -item[1]['samples'])],
+        }
+
+
+def memory_report(snapshot: tracemalloc.Snapshot, peak: int) -> Dict[str, Any]:
+    statistics = snapshot.filter_traces([
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, __file__),
+    ]).statistics('lineno')
+    return {
+        'peak_kb': round(peak / 1024, 1),
+        'retained_kb': round(sum(stat.size for stat in statistics) / 1024, 1),
+        'top_allocations': [
+            {
+                'location': f"{_short_path(stat.traceback[0].filename)}:{stat.traceback[0].lineno}",
+                'size_kb': round(stat.size / 1024, 1),
+                'count': stat.count,
+            }
+            for stat in statistics[:TOP_ALLOCATIONS]
+        ],
+    }
+
+
+class ProfilingMiddleware:
+    """
+    Serve `?profile=` requests from staff users with a profiling report.
+
+    Must come after AuthenticationMiddleware.
+    """
+
+    MODES = ('trace', 'sample')
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if 'profile' not in request.GET or not getattr(request.user, 'is_staff', False):
+            return self.get_response(request)
+
+        mode = request.GET['profile'] or 'trace'
+        if mode not in self.MODES:
+            return JsonResponse({'error': f"Unknown profiler {mode!r}, use one of {', '.join(self.MODES)}"},
+                                status=400)
+
+        # Strip the parameter so views and filters do not see it
+        request.GET = request.GET.copy()
+        del request.GET['profile']
+
+        recorder = SQLRecorder()
+        started_tracing = not tracemalloc.is_tracing()
+        if started_tracing:
+            tracemalloc.start()
+        tracemalloc.reset_peak()
+
+        try:
+            started = time.perf_counter()
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(recorder))
+                if mode == 'sample':
+                    profiler = StackSampler(threading.get_ident(), root_code=self._run.__code__)
+                    with profiler:
+                        response = self._run(request)
+                else:
+                    profiler = CallTracer()
+                    profiler.start()
+                    try:
+                        response = self._run(request)
+                    finally:
+                        profiler.stop()
+            elapsed = time.perf_counter() - started
+
+            snapshot = tracemalloc.take_snapshot()
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            if started_tracing:
+                tracemalloc.stop()
+
+        slowest = sorted(recorder.queries, key=lambda query: query['ms'], reverse=True)
+        plans = []
+        for query in slowest[:EXPLAIN_SLOWEST]:
+            try:
+                plan = explain(query)
+            except Exception as e:
+                plan = f"EXPLAIN failed: {e}"
+            if plan is not None:
+                plans.append({'sql': query['sql'], 'ms': query['ms'], 'plan': plan})
+
+        return JsonResponse({
+            'request': {
+                'method': request.method,
+                'path': request.get_full_path(),
+                'status': response.status_code,
+                'total_ms': round(elapsed * 1000, 3),
+            },
+            'profile': profiler.tree(),
+            'sql': {
+                'count': len(recorder.queries),
+                'total_ms': round(sum(query['ms'] for query in recorder.queries), 3),
+                'queries': [{**query, 'params': repr(query['params'])} for query in recorder.queries],
+                'slowest_plans': plans,
+            },
+            'memory': memory_report(snapshot, peak),
+        })
+
+    def _run(self, request):
+        # Root frame of the profiled call tree
+        return self.get_response(request)
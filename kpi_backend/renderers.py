@@ -0,0 +1,34 @@
+from rest_framework.renderers import JSONRenderer
+
+from kpi_backend import fast_json
+from kpi_backend.instrumentation import section
+
+
+class ORJSONRenderer(JSONRenderer):
+    """
+    Drop-in replacement for DRF's JSONRenderer backed by orjson.
+
+    Datetimes, UUIDs, NumPy arrays and dataclasses are serialized natively;
+    Decimal and other DRF-specific types go through DRF's encoder. Indented
+    output (e.g. for the browsable API) is delegated to the stock renderer.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+
+        if fast_json.orjson is None:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        renderer_context = renderer_context or {}
+        if self.get_indent(accepted_media_type, renderer_context) is not None:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        with section('render'):
+            ret = fast_json.dumps(data)
+
+        # Keep parity with JSONRenderer, which escapes U+2028/U+2029 so the
+        # output stays a strict JavaScript subset.
+        if b'\xe2\x80\xa8' in ret or b'\xe2\x80\xa9' in ret:
+            ret = ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+        return ret
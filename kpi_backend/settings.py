@@ -13,6 +13,7 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 from pathlib import Path
 from decouple import config
 from celery.schedules import crontab
+from kombu import Queue
 import os
 
 
@@ -53,11 +54,15 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware',
+    # Query counts, Server-Timing headers and query budgets per request
+    'kpi_backend.instrumentation.InstrumentationMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    # ?profile= reports for staff users
+    'kpi_backend.profiling.ProfilingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -94,6 +99,21 @@ DATABASES = {
     }
 }
 
+# Read replica for the analytics endpoints (kpi_backend.db_router); unset to read from the primary
+REPLICA_DB_HOST = config("REPLICA_DB_HOST", default="")
+if REPLICA_DB_HOST:
+    DATABASES['replica'] = {
+        **DATABASES['default'],
+        'HOST': REPLICA_DB_HOST,
+        'PORT': config("REPLICA_DB_PORT", default='5432'),
+        'TEST': {'MIRROR': 'default'},
+    }
+
+DATABASE_ROUTERS = ['kpi_backend.db_router.ReplicaRouter']
+
+# Replay lag in seconds above which those endpoints read from the primary instead
+REPLICA_MAX_LAG = config("REPLICA_MAX_LAG", default=5.0, cast=float)
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -152,7 +172,17 @@ REST_FRAMEWORK = {
     # or allow read-only access for unauthenticated users.
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.DjangoModelPermissionsOrAnonReadOnly'
-    ]
+    ],
+    # orjson-backed JSON (falls back to stdlib json if orjson is missing)
+    'DEFAULT_RENDERER_CLASSES': [
+        'kpi_backend.renderers.ORJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'kpi_backend.parsers.ORJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
 }
 
 
@@ -186,18 +216,95 @@ CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = 'UTC'
 
+# Separate queues so a long sync backfill never delays webhook processing.
+# Workers are started per queue with the profiles in kpi_backend/celery.py
+# (`python manage.py run_worker <profile>`).
+CELERY_TASK_DEFAULT_QUEUE = 'default'
+CELERY_TASK_QUEUES = (
+    Queue('default', routing_key='default'),
+    Queue('webhooks', routing_key='webhooks'),
+    Queue('sync', routing_key='sync'),
+    Queue('tokens', routing_key='tokens'),
+)
+CELERY_TASK_ROUTES = {
+    'accounts.tasks.handle_webhook_event': {'queue': 'webhooks'},
+    'accounts.tasks.sync_opp__and_cntct_task': {'queue': 'sync'},
+    'accounts.tasks.make_api_for_ghl': {'queue': 'tokens'},
+}
+
+# Redis priorities: 0 is the highest. Interactive work (e.g. the first sync
+# after connecting a location) is sent with CELERY_PRIORITY_INTERACTIVE.
+CELERY_TASK_DEFAULT_PRIORITY = 5
+CELERY_PRIORITY_INTERACTIVE = 0
+
+# Acknowledge after the task finishes so a killed worker does not lose it,
+# and only reserve one message at a time per process by default.
+CELERY_TASK_ACKS_LATE = True
+CELERY_TASK_REJECT_ON_WORKER_LOST = True
+CELERY_WORKER_PREFETCH_MULTIPLIER = 1
+CELERY_BROKER_TRANSPORT_OPTIONS = {
+    'priority_steps': list(range(10)),
+    'sep': ':',
+    'queue_order_strategy': 'priority',
+    # Must exceed the longest task time limit, otherwise Redis redelivers
+    # unacknowledged (acks_late) sync tasks while they are still running.
+    'visibility_timeout': 2 * 60 * 60,
+}
+
 
 CELERY_BEAT_SCHEDULE = {
+    # Refreshes tokens that expire within the next 30 minutes
     'make-api-for-ghl': {
         'task': 'accounts.tasks.make_api_for_ghl',
-        'schedule': crontab(hour='*/20'),
+        'schedule': crontab(minute='*/10'),
+    }
+}
+
+
+# Shared cache (access tokens, locks). Uses a different Redis DB than Celery.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': config("CACHE_URL", default='redis://localhost:6379/1'),
     }
 }
 
 
+# Request instrumentation (kpi_backend.instrumentation)
+SERVER_TIMING = config("SERVER_TIMING", default=DEBUG, cast=bool)
+# Raise instead of logging when a view exceeds its @query_budget (tests)
+QUERY_BUDGET_STRICT = config("QUERY_BUDGET_STRICT", default=False, cast=bool)
+
+# Metrics (kpi_backend.metrics) are aggregated across processes in Redis.
+# /api/metrics/ requires `Authorization: Bearer <METRICS_TOKEN>` if set,
+# otherwise a staff session.
+METRICS_REDIS_URL = config("METRICS_REDIS_URL", default=CACHES['default']['LOCATION'])
+METRICS_TOKEN = config("METRICS_TOKEN", default="")
+
+# Measure SyncRun.peak_memory_mb with tracemalloc instead of the RSS peak
+SYNC_RUN_TRACEMALLOC = config("SYNC_RUN_TRACEMALLOC", default=False, cast=bool)
+
+# Map synced GHL pages column by column with pandas instead of record by record
+GHL_SYNC_COLUMNAR = config("GHL_SYNC_COLUMNAR", default=False, cast=bool)
+
+# Answer dashboard KPIs from a per-worker NumPy snapshot of opportunities
+# (data_management.snapshot) instead of querying Postgres
+OPPORTUNITY_SNAPSHOT = config("OPPORTUNITY_SNAPSHOT", default=False, cast=bool)
+
+# Dashboard sections AsyncDashboardView computes at once per request (one DB connection each)
+DASHBOARD_CONCURRENCY = config("DASHBOARD_CONCURRENCY", default=4, cast=int)
+
+# Seconds an analytics ETag (data_management.data_version) stays valid while the data is unchanged
+DATA_ETAG_TTL = config("DATA_ETAG_TTL", default=60, cast=int)
+
+
 
 GHL_CLIENT_ID = config("GHL_CLIENT_ID")
 GHL_CLIENT_SECRET = config("GHL_CLIENT_SECRET")
+# Overridable so syncs can run against a local stand-in (see benchmark_sync)
+GHL_API_BASE_URL = config("GHL_API_BASE_URL", default="https://services.leadconnectorhq.com")
+# OAuth token endpoint used to refresh access tokens
+GHL_TOKEN_URL = config("GHL_TOKEN_URL", default=f"{GHL_API_BASE_URL}/oauth/token")
 
 
 LOGGING = {
@@ -224,7 +331,8 @@ LOGGING = {
             'formatter': 'verbose',
         },
         'rotating_file': {
-            'class': 'logging.handlers.RotatingFileHandler',
+            # RotatingFileHandler that also writes a sidecar index for log search
+            'class': 'data_management.logs.IndexedRotatingFileHandler',
             'filename': os.path.join(BASE_DIR, 'logs', 'ghl_sync_rotating.log'),
             'maxBytes': 1024*1024*10,  # 10 MB
             'backupCount': 5,
@@ -238,6 +346,12 @@ LOGGING = {
             'level': 'INFO',
             'propagate': True,
         },
+        # One JSON line per request with query counts and section timings
+        'kpi_backend.instrumentation': {
+            'handlers': ['console', 'rotating_file'],
+            'level': 'INFO',
+            'propagate': False,
+        },
         # General Django logger
         'django': {
             'handlers': ['console', 'file'],
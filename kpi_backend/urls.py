@@ -16,9 +16,11 @@ Including another URLconf
 """
 from django.contrib import admin
 from django.urls import path, include
+from kpi_backend.views import metrics
 
 urlpatterns = [
     path('api/admin/', admin.site.urls),
     path('api/accounts/', include("accounts.urls")),
-    path('api/data/', include("data_management.urls"))
+    path('api/data/', include("data_management.urls")),
+    path('api/metrics/', metrics, name='metrics'),
 ]
@@ -0,0 +1,28 @@
+import hmac
+
+import redis
+from django.conf import settings
+from django.http import HttpResponse
+
+from kpi_backend import metrics as metrics_registry
+
+
+def metrics(request):
+    """
+    Prometheus scrape endpoint, aggregated over all web and worker processes.
+
+    Requires `Authorization: Bearer <METRICS_TOKEN>` when METRICS_TOKEN is
+    set, otherwise a logged-in staff user.
+    """
+    if settings.METRICS_TOKEN:
+        expected = f"Bearer {settings.METRICS_TOKEN}"
+        if not hmac.compare_digest(request.headers.get('Authorization', ''), expected):
+            return HttpResponse("Unauthorized", status=401)
+    elif not request.user.is_staff:
+        return HttpResponse("Forbidden", status=403)
+
+    try:
+        body = metrics_registry.render()
+    except redis.RedisError as e:
+        return HttpResponse(f"Metrics store unavailable: {e}", status=503)
+    return HttpResponse(body, content_type='text/plain; version=0.0.4; charset=utf-8')